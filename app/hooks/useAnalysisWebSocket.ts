@@ -14,6 +14,7 @@ export const useAnalysisWebSocket = (fileId: string | null) => {
     setSampleAnalysisResult,
     addSampleVerificationUpdate,
     updateSampleStatus,
+    setSampleEventCursor,
     getSample
   } = useStore();
 
@@ -31,7 +32,10 @@ export const useAnalysisWebSocket = (fileId: string | null) => {
 
     const connect = () => {
       setConnectionStatus('connecting');
-      const ws = new WebSocket(`${WS_BASE_URL}/ws/${fileId}`);
+      // Resume after the last event already stored for this sample
+      const after = sample?.eventCursor ? `&after=${encodeURIComponent(sample.eventCursor)}` : '';
+      const ws = new WebSocket(`${WS_BASE_URL}/ws/${fileId}?protocol=batch${after}`);
+      let jobId: string | undefined;
       socketRef.current = ws;
 
       ws.onopen = () => {
@@ -40,10 +44,11 @@ export const useAnalysisWebSocket = (fileId: string | null) => {
         updateSampleStatus(fileId, 'processing');
       };
 
-      ws.onmessage = (event) => {
-        try {
-          const data: WebSocketMessage = JSON.parse(event.data);
-          
+      const handleEvent = (data: WebSocketMessage) => {
+          if (data.type === 'job') {
+            jobId = data.job_id;
+            return;
+          }
           switch (data.type) {
             case 'log':
               if (data.message) addSampleLog(fileId, data.message);
@@ -73,6 +78,19 @@ export const useAnalysisWebSocket = (fileId: string | null) => {
               setConnectionStatus('error');
               break;
           }
+      };
+
+      ws.onmessage = (event) => {
+        try {
+          const data: WebSocketMessage = JSON.parse(event.data);
+          // Batched protocol: one frame carries every event coalesced since the last send
+          const events = data.type === 'batch' ? data.events || [] : [data];
+          events.forEach(handleEvent);
+          // One cursor update per frame, from its last numbered event
+          const last = events[events.length - 1];
+          if (jobId && last?.seq !== undefined) {
+            setSampleEventCursor(fileId, `${jobId}:${last.seq}`);
+          }
         } catch (e) {
           console.error('Error parsing WebSocket message:', e);
         }
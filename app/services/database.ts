@@ -27,13 +27,14 @@ export const initDatabase = async () => {
   // Simple migration attempts (ignore errors if columns exist)
   try { await db.execAsync('ALTER TABLE samples ADD COLUMN collectionTime TEXT;'); } catch (e) {}
   try { await db.execAsync('ALTER TABLE samples ADD COLUMN depth REAL;'); } catch (e) {}
+  try { await db.execAsync('ALTER TABLE samples ADD COLUMN eventCursor TEXT;'); } catch (e) {}
 };
 
 export const saveSample = async (sample: Sample) => {
   if (!db) await initDatabase();
   
   await db.runAsync(
-    `INSERT OR REPLACE INTO samples (fileId, sampleId, status, fileName, uploadDate, collectionTime, depth, latitude, longitude, latestAnalysis, logs, progress, verificationUpdates) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`,
+    `INSERT OR REPLACE INTO samples (fileId, sampleId, status, fileName, uploadDate, collectionTime, depth, latitude, longitude, latestAnalysis, logs, progress, verificationUpdates, eventCursor) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`,
     [
       sample.fileId,
       sample.sampleId,
@@ -47,7 +48,8 @@ export const saveSample = async (sample: Sample) => {
       JSON.stringify(sample.latestAnalysis || {}),
       JSON.stringify(sample.logs || []),
       JSON.stringify(sample.progress || []),
-      JSON.stringify(sample.verificationUpdates || [])
+      JSON.stringify(sample.verificationUpdates || []),
+      sample.eventCursor ?? null
     ]
   );
 };
@@ -70,7 +72,8 @@ export const getSamples = async (): Promise<Sample[]> => {
     latestAnalysis: JSON.parse(row.latestAnalysis),
     logs: JSON.parse(row.logs),
     progress: JSON.parse(row.progress),
-    verificationUpdates: JSON.parse(row.verificationUpdates)
+    verificationUpdates: JSON.parse(row.verificationUpdates),
+    eventCursor: row.eventCursor ?? undefined
   }));
 };
 
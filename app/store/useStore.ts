@@ -11,6 +11,7 @@ interface AppState {
   addSample: (sample: Sample) => void;
   updateSampleStatus: (fileId: string, status: Sample['status']) => void;
   addSampleLog: (fileId: string, log: string) => void;
+  setSampleEventCursor: (fileId: string, eventCursor: string) => void;
   updateSampleProgress: (fileId: string, progress: ProgressStep) => void;
   setSampleAnalysisResult: (fileId: string, result: AnalysisResult) => void;
   addSampleVerificationUpdate: (fileId: string, update: VerificationUpdate) => void;
@@ -72,6 +73,16 @@ export const useStore = create<AppState>((set, get) => ({
       return { samples: updatedSamples };
     });
   },
+  setSampleEventCursor: (fileId, eventCursor) => {
+    set((state) => {
+      const updatedSamples = state.samples.map((s) =>
+        s.fileId === fileId ? { ...s, eventCursor } : s
+      );
+      const updatedSample = updatedSamples.find(s => s.fileId === fileId);
+      if (updatedSample) saveSample(updatedSample);
+      return { samples: updatedSamples };
+    });
+  },
   updateSampleProgress: (fileId, progress) => {
     set((state) => {
       const updatedSamples = state.samples.map((s) =>
@@ -12,6 +12,8 @@ export interface Sample {
   logs: string[];
   progress: ProgressStep[];
   verificationUpdates: VerificationUpdate[];
+  // `{job_id}:{seq}` of the last job event received, sent back as ?after= on reconnect
+  eventCursor?: string;
 }
 
 export interface AnalysisResult {
@@ -41,7 +43,7 @@ export interface VerificationUpdate {
 }
 
 // WebSocket Message Types
-export type WebSocketMessageType = 'log' | 'progress' | 'clustering_result' | 'verification_update' | 'complete' | 'error';
+export type WebSocketMessageType = 'log' | 'progress' | 'clustering_result' | 'verification_update' | 'complete' | 'error' | 'job' | 'batch';
 
 export interface WebSocketMessage {
   type: WebSocketMessageType;
@@ -49,4 +51,7 @@ export interface WebSocketMessage {
   step?: string;
   status?: string;
   data?: any;
+  events?: WebSocketMessage[];
+  seq?: number;
+  job_id?: string;
 }
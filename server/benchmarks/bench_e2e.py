@@ -0,0 +1,335 @@
+"""
+End-to-end benchmark: concurrent clients upload a synthetic file, open
+the WebSocket and wait for "complete", against a real server process
+talking to the local stub analysis service.
+
+Reports throughput, p50/p99 latency per stage as seen by the clients,
+peak server RSS per stage, and the server's own /metrics spans.
+
+Run from the server directory:
+    python -m benchmarks.bench_e2e --reads 100000 --clients 4 --duplication 0.5
+Point --server-url at a running server to skip spawning one (its
+EXTERNAL_API_URL must then be the stub, e.g. `python -m benchmarks.stub_service`).
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import aiohttp
+import numpy as np
+
+from benchmarks.stub_service import StubService, start as start_stub
+from benchmarks.synthetic import write_reads
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Log messages of run_analysis_job that open each server stage
+STAGE_MARKERS = (
+    ("Reading Sequences", "reading"),
+    ("Generating AI Embeddings", "analysing"),
+    ("Starting NCBI Verification", "verifying"),
+)
+STAGES = ("upload", "queued", "reading", "analysing", "verifying", "total")
+
+
+class MemorySampler(threading.Thread):
+    """Samples the RSS of a process and its children (uvicorn workers)."""
+
+    def __init__(self, pid, interval=0.02):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.samples.append((time.monotonic(), tree_rss(self.pid)))
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def peak(self, start, end):
+        values = [rss for t, rss in self.samples if start <= t <= end]
+        return max(values) if values else None
+
+
+def tree_rss(pid):
+    """Resident bytes of `pid` plus its descendants (Linux /proc)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+    return total
+
+
+def decode_frame(msg):
+    """Events of one WebSocket frame (legacy single event or batch)."""
+    if msg.type == aiohttp.WSMsgType.BINARY:
+        frame = json.loads(zlib.decompress(msg.data, -zlib.MAX_WBITS))
+    else:
+        frame = json.loads(msg.data)
+    return frame["events"] if frame.get("type") == "batch" else [frame]
+
+
+async def run_client(session, server_url, path, filename, backend, timings, protocol="legacy"):
+    """One upload + WebSocket session; appends {stage: (start, end)} to `timings`."""
+    spans = {}
+    started = time.monotonic()
+    with open(path, "rb") as f:
+        form = aiohttp.FormData()
+        form.add_field("file", f, filename=filename)
+        async with session.post(f"{server_url}/upload", data=form) as resp:
+            resp.raise_for_status()
+            upload = await resp.json()
+    spans["upload"] = (started, time.monotonic())
+
+    ws_url = server_url.replace("http", "ws", 1) + f"/ws/{upload['file_id']}?backend={backend}"
+    if protocol != "legacy":
+        # "batch" or "deflate" (binary batches)
+        ws_url += "&protocol=batch" + ("&encoding=deflate" if protocol == "deflate" else "")
+    stage, stage_start = "queued", time.monotonic()
+    first_result = None
+    status = "error"
+    frames = 0
+    async with session.ws_connect(ws_url, max_msg_size=0) as ws:
+        async for msg in ws:
+            if msg.type not in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+                break
+            frames += 1
+            now = time.monotonic()
+            for event in decode_frame(msg):
+                if event.get("type") == "log":
+                    for marker, name in STAGE_MARKERS:
+                        if event.get("message", "").startswith(marker):
+                            spans[stage] = (stage_start, now)
+                            stage, stage_start = name, now
+                elif event.get("type") == "clustering_result" and first_result is None:
+                    first_result = now - started
+                elif event.get("type") in ("complete", "error"):
+                    status = event["type"]
+        # The server closes the socket right after the final event
+    end = time.monotonic()
+    spans[stage] = (stage_start, end)
+    spans["total"] = (started, end)
+    timings.append({"spans": spans, "status": status, "first_result": first_result, "frames": frames})
+
+
+async def wait_healthy(session, server_url, process=None, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"Server exited with code {process.returncode}")
+        try:
+            async with session.get(f"{server_url}/health") as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit(f"Server at {server_url} did not become healthy")
+
+
+def spawn_server(port, stub_url, workdir, args):
+    env = {
+        **os.environ,
+        "EXTERNAL_API_URL": stub_url,
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "PREDICTION_CACHE_PATH": os.path.join(workdir, "predictions.sqlite3"),
+        "EMBEDDING_STORE_DIR": os.path.join(workdir, "embeddings"),
+        "RESULT_STORE_DIR": os.path.join(workdir, "results"),
+        "ANALYSIS_BACKENDS": args.backend,
+        "JOB_CONCURRENCY": str(args.job_concurrency),
+    }
+    cmd = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(args.workers), "--log-level", "warning"]
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    return subprocess.Popen(cmd, cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarise(timings, sampler, reads, file_bytes, wall):
+    report = {"runs": len(timings), "errors": sum(t["status"] != "complete" for t in timings)}
+    report["wall_seconds"] = round(wall, 3)
+    report["reads_per_second"] = round(reads * len(timings) / wall, 1)
+    report["upload_mb_per_second"] = round(file_bytes * len(timings) / wall / 1e6, 2)
+
+    report["frames_per_run"] = round(float(np.mean([t["frames"] for t in timings])), 1) if timings else 0
+    first = [t["first_result"] for t in timings if t["first_result"] is not None]
+    if first:
+        report["first_result_p50"] = round(float(np.percentile(first, 50)), 3)
+        report["first_result_p99"] = round(float(np.percentile(first, 99)), 3)
+
+    stages = {}
+    for stage in STAGES:
+        windows = [t["spans"][stage] for t in timings if stage in t["spans"]]
+        if not windows:
+            continue
+        durations = [end - start for start, end in windows]
+        row = {
+            "p50": round(float(np.percentile(durations, 50)), 4),
+            "p99": round(float(np.percentile(durations, 99)), 4),
+        }
+        if sampler is not None:
+            peaks = [sampler.peak(start, end) for start, end in windows]
+            peaks = [p for p in peaks if p is not None]
+            if peaks:
+                row["peak_rss_mb"] = round(max(peaks) / 1e6, 1)
+        stages[stage] = row
+    report["stages"] = stages
+    return report
+
+
+def print_report(report, server_metrics):
+    print(f"\n{report['runs']} runs, {report['errors']} errors in {report['wall_seconds']}s")
+    print(f"Throughput: {report['reads_per_second']:,.0f} reads/s, {report['upload_mb_per_second']} MB/s uploaded")
+    print(f"WebSocket frames per run: {report['frames_per_run']}")
+    if "first_result_p50" in report:
+        print(f"First result: p50 {report['first_result_p50']}s, p99 {report['first_result_p99']}s")
+    print(f"\n{'stage':<12}{'p50 (s)':>10}{'p99 (s)':>10}{'peak RSS (MB)':>16}")
+    for stage, row in report["stages"].items():
+        print(f"{stage:<12}{row['p50']:>10}{row['p99']:>10}{row.get('peak_rss_mb', '-'):>16}")
+
+    if server_metrics:
+        print(f"\nServer spans (/metrics)\n{'histogram':<56}{'count':>8}{'p50':>10}{'p99':>10}{'max':>10}")
+        for h in server_metrics.get("histograms", []):
+            labels = ",".join(f"{k}={v}" for k, v in h["labels"].items())
+            name = f"{h['name']}{{{labels}}}" if labels else h["name"]
+            print(f"{name:<56}{h['count']:>8}{h['p50']:>10.4g}{h['p99']:>10.4g}{h['max']:>10.4g}")
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_e2e_")
+    suffix = (".fastq" if args.format == "fastq" else ".fasta") + (".gz" if args.gzip else "")
+    runs = args.clients * args.rounds
+    # Runs of the same file are served by the prediction cache after the first
+    paths = []
+    for i in range(runs if args.distinct else 1):
+        path = os.path.join(workdir, f"reads_{i}{suffix}")
+        n_unique = write_reads(path, args.reads, args.read_length, args.duplication, args.format, args.gzip,
+                               seed=args.seed + i)
+        paths.append(path)
+    file_bytes = os.path.getsize(paths[0])
+    print(f"Generated {len(paths)} file(s) of {args.reads} reads ({n_unique} unique), {file_bytes / 1e6:.1f} MB each")
+
+    stub_runner = None
+    process = None
+    sampler = None
+    server_url = args.server_url
+    try:
+        if server_url is None:
+            stub = StubService(args.latency, args.jitter, args.per_read, args.failure_rate, stall_rate=args.stall_rate)
+            stub_runner, stub_url = await start_stub(stub)
+            port = free_port()
+            process = spawn_server(port, stub_url, workdir, args)
+            server_url = f"http://127.0.0.1:{port}"
+            sampler = MemorySampler(process.pid)
+            sampler.start()
+
+        timeout = aiohttp.ClientTimeout(total=None)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            await wait_healthy(session, server_url, process)
+            timings = []
+            semaphore = asyncio.Semaphore(args.clients)
+
+            async def client(path):
+                async with semaphore:
+                    await run_client(session, server_url, path, os.path.basename(path), args.backend, timings,
+                                     args.protocol)
+
+            started = time.monotonic()
+            await asyncio.gather(*(client(paths[i % len(paths)]) for i in range(runs)))
+            wall = time.monotonic() - started
+
+            async with session.get(f"{server_url}/metrics") as resp:
+                server_metrics = await resp.json() if resp.status == 200 else None
+
+        report = summarise(timings, sampler, args.reads, file_bytes, wall)
+        print_report(report, server_metrics)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"args": vars(args), "report": report, "server_metrics": server_metrics}, f, indent=2)
+        if report["errors"]:
+            raise SystemExit(f"{report['errors']} run(s) did not complete, see {workdir}/server.log")
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    data = parser.add_argument_group("synthetic data")
+    data.add_argument("--reads", type=int, default=50000)
+    data.add_argument("--read-length", type=int, default=150)
+    data.add_argument("--duplication", type=float, default=0.3)
+    data.add_argument("--format", choices=("fastq", "fasta"), default="fastq")
+    data.add_argument("--gzip", action="store_true")
+    data.add_argument("--seed", type=int, default=42)
+    data.add_argument("--distinct", action="store_true", help="a different file per run (no cache hits)")
+
+    load = parser.add_argument_group("load")
+    load.add_argument("--clients", type=int, default=4, help="concurrent clients")
+    load.add_argument("--rounds", type=int, default=1, help="runs per client")
+    load.add_argument("--backend", default="remote")
+    load.add_argument("--protocol", choices=("legacy", "batch", "deflate"), default="legacy",
+                      help="WebSocket framing (see websocket_endpoint)")
+
+    server = parser.add_argument_group("server")
+    server.add_argument("--server-url", default=None, help="use a running server instead of spawning one")
+    server.add_argument("--workers", type=int, default=1)
+    server.add_argument("--job-concurrency", type=int, default=2)
+
+    stub = parser.add_argument_group("stub analysis service")
+    stub.add_argument("--latency", type=float, default=0.05)
+    stub.add_argument("--jitter", type=float, default=0.2)
+    stub.add_argument("--per-read", type=float, default=0.0)
+    stub.add_argument("--failure-rate", type=float, default=0.0)
+    stub.add_argument("--stall-rate", type=float, default=0.0)
+
+    parser.add_argument("--json", help="also write the report to this file")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
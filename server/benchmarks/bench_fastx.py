@@ -0,0 +1,75 @@
+"""
+Counting benchmark: FastxReader vs Bio.SeqIO.
+
+Run from the server directory:
+    python -m benchmarks.bench_fastx --reads 200000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from Bio import SeqIO
+
+from module.fastx import FastxReader
+
+MIN_SPEEDUP = 10.0
+
+
+def write_fastq(path, reads, read_length, seed=42):
+    rng = random.Random(seed)
+    quality = "I" * read_length
+    with open(path, 'w') as f:
+        for i in range(reads):
+            seq = "".join(rng.choices("ACGT", k=read_length))
+            f.write(f"@read_{i}\n{seq}\n+\n{quality}\n")
+
+
+def time_best(fn, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def seqio_count(path):
+    with open(path, 'r') as f:
+        return sum(1 for _ in SeqIO.parse(f, "fastq"))
+
+
+def fastx_count(path):
+    with FastxReader(path) as reader:
+        return reader.count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reads", type=int, default=200000)
+    parser.add_argument("--read-length", type=int, default=150)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.fastq")
+        write_fastq(path, args.reads, args.read_length)
+        size_mb = os.path.getsize(path) / 1e6
+
+        seqio_time, seqio_n = time_best(lambda: seqio_count(path), args.repeats)
+        fastx_time, fastx_n = time_best(lambda: fastx_count(path), args.repeats)
+
+    assert seqio_n == fastx_n == args.reads, (seqio_n, fastx_n)
+    speedup = seqio_time / fastx_time
+    print(f"{args.reads} reads, {size_mb:.1f} MB")
+    print(f"SeqIO.parse : {seqio_time:.3f}s ({args.reads / seqio_time:,.0f} reads/s)")
+    print(f"FastxReader : {fastx_time:.3f}s ({args.reads / fastx_time:,.0f} reads/s)")
+    print(f"Speedup     : {speedup:.1f}x")
+    if speedup < MIN_SPEEDUP:
+        raise SystemExit(f"FastxReader is only {speedup:.1f}x faster than SeqIO (expected >= {MIN_SPEEDUP}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Local stand-in for the analysis service's /predict/fasta.
+
+Predictions are derived from a hash of each sequence, so repeated runs
+(and cached vs. uncached runs) agree. Latency and failures are injectable.
+
+Run from the server directory:
+    python -m benchmarks.stub_service --port 8765 --latency 0.2 --failure-rate 0.05
+and start the server with EXTERNAL_API_URL=http://127.0.0.1:8765
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import zlib
+
+from aiohttp import web
+
+GENERA = ("Bacillus", "Escherichia", "Pseudomonas", "Vibrio", "Alteromonas",
+          "Prochlorococcus", "Synechococcus", "Pelagibacter", "Roseobacter", "Flavobacterium")
+CLASSES = ("Bacilli", "Gammaproteobacteria", "Cyanophyceae", "Alphaproteobacteria", "Flavobacteriia")
+
+
+class StubService:
+    """
+    `latency` seconds per request (+/- `jitter` fraction) plus `per_read`
+    seconds per sequence. A `failure_rate` fraction of requests answers
+    `failure_status`, a `stall_rate` fraction sleeps `stall` seconds first
+    (to trigger hedges and attempt timeouts).
+    """
+
+    def __init__(self, latency=0.05, jitter=0.2, per_read=0.0, failure_rate=0.0,
+                 failure_status=503, stall_rate=0.0, stall=10.0, seed=42):
+        self.latency = latency
+        self.jitter = jitter
+        self.per_read = per_read
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self._rng = random.Random(seed)
+        self.stats = {"requests": 0, "failures": 0, "stalls": 0, "sequences": 0, "bytes": 0}
+
+    def app(self):
+        app = web.Application(client_max_size=1 << 30)
+        app.router.add_post("/predict/fasta", self.predict)
+        app.router.add_get("/stats", self.get_stats)
+        return app
+
+    async def get_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def predict(self, request):
+        self.stats["requests"] += 1
+        form = await request.post()
+        body = form["file"].file.read()
+        self.stats["bytes"] += len(body)
+        if body[:2] == b"\x1f\x8b":
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        records = parse_records(body)
+
+        delay = self.latency * (1 + self._rng.uniform(-self.jitter, self.jitter)) + self.per_read * len(records)
+        if self._rng.random() < self.stall_rate:
+            self.stats["stalls"] += 1
+            delay += self.stall
+        await asyncio.sleep(max(delay, 0))
+
+        if self._rng.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            return web.Response(status=self.failure_status, text="Injected failure")
+
+        self.stats["sequences"] += len(records)
+        results = [{"id": name, "prediction": predict(seq)} for name, seq in records]
+        return web.json_response({"count": len(results), "results": results})
+
+
+def parse_records(body):
+    """(name, sequence) pairs of a FASTA or FASTQ payload."""
+    lines = body.decode("ascii", "replace").splitlines()
+    records = []
+    if lines and lines[0].startswith("@"):
+        for i in range(0, len(lines) - 1, 4):
+            records.append((lines[i][1:], lines[i + 1]))
+        return records
+    name, parts = None, []
+    for line in lines:
+        if line.startswith(">"):
+            if name is not None:
+                records.append((name, "".join(parts)))
+            name, parts = line[1:], []
+        elif line:
+            parts.append(line)
+    if name is not None:
+        records.append((name, "".join(parts)))
+    return records
+
+
+def predict(seq):
+    digest = hashlib.blake2b(seq.upper().encode(), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    genus = value % len(GENERA)
+    return {
+        "genus": GENERA[genus],
+        "class": CLASSES[genus % len(CLASSES)],
+        "genus_prob": round(0.4 + (value >> 8) % 600 / 1000, 3),
+    }
+
+
+async def start(service, host="127.0.0.1", port=0):
+    """Serves `service` on the running loop; returns (runner, base_url)."""
+    runner = web.AppRunner(service.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--per-read", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=503)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall", type=float, default=10.0)
+    args = parser.parse_args()
+
+    service = StubService(args.latency, args.jitter, args.per_read, args.failure_rate,
+                          args.failure_status, args.stall_rate, args.stall)
+    web.run_app(service.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Synthetic FASTA/FASTQ generator for benchmarks.
+
+Run from the server directory:
+    python -m benchmarks.synthetic out.fastq.gz --reads 1000000 --duplication 0.6
+"""
+import argparse
+import gzip
+
+import numpy as np
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+# Reads generated (and written) per step
+BATCH = 65536
+
+
+def write_reads(path, reads, read_length=150, duplication=0.0, fmt="fastq",
+                compress=False, length_jitter=0, seed=42):
+    """
+    Writes `reads` random reads and returns the number of distinct sequences.
+    `duplication` is the fraction of reads that repeat an earlier sequence
+    (0.6 -> 40% unique), `length_jitter` varies read lengths by +/- that
+    many bases. `compress` writes gzip.
+    """
+    rng = np.random.default_rng(seed)
+    n_unique = max(1, int(round(reads * (1 - duplication))))
+    lengths = rng.integers(read_length - length_jitter, read_length + length_jitter + 1, n_unique)
+    lengths = np.maximum(lengths, 1)
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    pool = BASES[rng.integers(0, 4, int(offsets[-1]))].tobytes()
+
+    # Every unique sequence appears once, the rest are random repeats
+    order = np.concatenate([np.arange(n_unique), rng.integers(0, n_unique, reads - n_unique)])
+    rng.shuffle(order)
+
+    opener = gzip.open if compress else open
+    with opener(path, "wb") as f:
+        for batch_start in range(0, reads, BATCH):
+            out = []
+            for i, unique in enumerate(order[batch_start:batch_start + BATCH].tolist(), start=batch_start):
+                seq = pool[offsets[unique]:offsets[unique + 1]]
+                if fmt == "fastq":
+                    out.append(b"@read_%d\n%s\n+\n%s\n" % (i, seq, b"I" * len(seq)))
+                else:
+                    out.append(b">read_%d\n%s\n" % (i, seq))
+            f.write(b"".join(out))
+    return n_unique
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--reads", type=int, default=100000)
+    parser.add_argument("--read-length", type=int, default=150)
+    parser.add_argument("--length-jitter", type=int, default=0)
+    parser.add_argument("--duplication", type=float, default=0.0)
+    parser.add_argument("--format", choices=("fastq", "fasta"), default=None,
+                        help="defaults to the extension of PATH")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    compress = args.path.endswith(".gz")
+    fmt = args.format or ("fasta" if ".fa" in args.path.lower() else "fastq")
+    n_unique = write_reads(args.path, args.reads, args.read_length, args.duplication, fmt,
+                           compress, args.length_jitter, args.seed)
+    print(f"Wrote {args.reads} {fmt} reads ({n_unique} unique) to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,223 @@
-from fastapi import FastAPI, WebSocket, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from Bio import SeqIO
-import shutil
+from fastapi.responses import JSONResponse, PlainTextResponse
 import os
-import uuid
 import aiohttp
 import asyncio
+import time
+import numpy as np
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 from utils.utils import set_global_seed
+from module.aggregation import AbundanceAggregator
+from module.backends import LocalBackend, RemoteBackend
+from module.compression import GZIP_MAGIC, GzipDecoder, is_gzip
+from module.fastx import open_fastx
+from module.http_client import SharedHttpClient
+from module.jobs import JobManager, JobQueueFull, JobStore
+from module.metrics import BYTES_BUCKETS, Metrics
+from module.multipart_upload import StreamingForm
+from module.prediction_cache import PredictionCache
+from module.readiness import Readiness
+from module.result_store import GROUP_COLUMNS, SORT_COLUMNS, ResultStore
+from module.predictor import PredictionError
+from module.sequence_index import SequenceScanner
+from module.sketch import SketchClusterer
+from module.service_client import CircuitBreaker, EndpointBudget, ServiceClient
+from module.upload_store import UploadStore
+from module.verifier import AsyncBlastVerifier
+from module.ws_protocol import ENCODINGS, EventBatcher, encode_batch, msgpack_available
 # NOTE: ClusterEngine import removed - using external API instead
 
 set_global_seed(42)
 
-app = FastAPI()
+# Pooled connection budget toward the analysis service, shared by all sessions
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+
+# Resilience of calls to the analysis service: per-attempt timeout and
+# total budget (retries + backoff) per shard, hedging after the p95
+# latency, and a circuit breaker shared by all sessions
+PREDICT_ATTEMPT_TIMEOUT = float(os.getenv("PREDICT_ATTEMPT_TIMEOUT", "120"))
+PREDICT_TOTAL_BUDGET = float(os.getenv("PREDICT_TOTAL_BUDGET", "300"))
+PREDICT_MAX_ATTEMPTS = int(os.getenv("PREDICT_MAX_ATTEMPTS", "3"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Per-sequence prediction cache (memory LRU in front of SQLite)
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "cache/predictions.sqlite3")
+PREDICTION_CACHE_MEMORY_ITEMS = int(os.getenv("PREDICTION_CACHE_MEMORY_ITEMS", "100000"))
+PREDICTION_CACHE_MAX_ITEMS = int(os.getenv("PREDICTION_CACHE_MAX_ITEMS", "5000000"))
+
+# Collapse reads with their reverse complement during dereplication
+DEREPLICATE_REVERSE_COMPLEMENT = os.getenv("DEREPLICATE_REVERSE_COMPLEMENT", "0") == "1"
+
+# Triage mode for large samples: group similar uniques by MinHash k-mer
+# sketches and predict/embed one representative per group (approximate)
+SKETCH_PRECLUSTER = os.getenv("SKETCH_PRECLUSTER", "0") == "1"
+SKETCH_KMER = int(os.getenv("SKETCH_KMER", "16"))
+SKETCH_THRESHOLD = float(os.getenv("SKETCH_THRESHOLD", "0.5"))  # estimated Jaccard similarity
+SKETCH_MIN_SEQUENCES = int(os.getenv("SKETCH_MIN_SEQUENCES", "10000"))  # smaller samples run exact
+# Skip sketching when a sample estimate says fewer uniques would be grouped
+SKETCH_MIN_REDUNDANCY = float(os.getenv("SKETCH_MIN_REDUNDANCY", "0.1"))
+
+# Enabled analysis backends, the first one is the default.
+# "remote" calls EXTERNAL_API_URL, "local" runs DNABERT + ClusterEngine in-process
+ANALYSIS_BACKENDS = [name.strip() for name in os.getenv("ANALYSIS_BACKENDS", "remote").split(",") if name.strip()]
+LOCAL_WORKERS = int(os.getenv("LOCAL_WORKERS", "0")) or None  # 0 = one per core group
+LOCAL_MODEL_NAME = os.getenv("LOCAL_MODEL_NAME", "zhihan1996/DNABERT-S")
+EMBEDDING_STORE_DIR = os.getenv("EMBEDDING_STORE_DIR", "cache/embeddings")
+# Name the top local clusters by sending a few representatives of each to
+# EXTERNAL_API_URL; 0 keeps local analyses entirely on-premises
+VERIFY_LOCAL_CLUSTERS = os.getenv("VERIFY_LOCAL_CLUSTERS", "1") == "1"
+
+# Local clustering: HDBSCAN runs on a subsample, the rest is assigned by kNN.
+# Non-deterministic mode uses approximate neighbours and a parallel UMAP layout.
+CLUSTER_SAMPLE_SIZE = int(os.getenv("CLUSTER_SAMPLE_SIZE", "50000"))
+CLUSTER_PCA_COMPONENTS = int(os.getenv("CLUSTER_PCA_COMPONENTS", "50")) or None  # 0 = no PCA
+CLUSTER_DETERMINISTIC = os.getenv("CLUSTER_DETERMINISTIC", "1") == "1"
+# Load models and compile clustering kernels in the background at startup
+# (reported on /health/ready); 0 defers it all to the first analysis
+BACKEND_WARMUP = os.getenv("BACKEND_WARMUP", "1") == "1"
+
+# Background analysis jobs: state and event logs survive client disconnects
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "cache/jobs.sqlite3")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "64"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))  # seconds
+JOB_LEASE = float(os.getenv("JOB_LEASE", "30"))  # seconds before a dead worker's jobs are re-queued
+
+# Upload blobs and their metadata. Several uvicorn workers on one host share
+# UPLOAD_DIR and JOB_STORE_PATH; both are SQLite in WAL mode, which is not
+# safe on network filesystems, so they must stay on local disk.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "temp_uploads")
+UPLOAD_DB_PATH = os.getenv("UPLOAD_DB_PATH") or None  # default: UPLOAD_DIR/uploads.sqlite3
+# Uploads are deleted once analysed; ones never analysed go after this long
+UPLOAD_RETENTION = float(os.getenv("UPLOAD_RETENTION", str(24 * 3600)))  # seconds
+# Columnar per-read results of finished jobs (shared like UPLOAD_DIR)
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "cache/results")
+RESULT_PAGE_LIMIT = int(os.getenv("RESULT_PAGE_LIMIT", "1000"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Per-process counters and histograms, served on /metrics
+    app.state.metrics = Metrics()
+    app.state.http = SharedHttpClient(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+    )
+    await app.state.http.start()
+    app.state.service = ServiceClient(
+        app.state.http,
+        EXTERNAL_API_URL,
+        budgets={
+            "/predict/fasta": EndpointBudget(
+                attempt_timeout=PREDICT_ATTEMPT_TIMEOUT,
+                total_budget=PREDICT_TOTAL_BUDGET,
+                max_attempts=PREDICT_MAX_ATTEMPTS,
+            ),
+        },
+        breaker=CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_TIMEOUT),
+        hedge_percentile=HEDGE_PERCENTILE,
+        max_hedge_ratio=HEDGE_MAX_RATIO,
+        metrics=app.state.metrics,
+    )
+    app.state.prediction_cache = PredictionCache(
+        PREDICTION_CACHE_PATH,
+        memory_items=PREDICTION_CACHE_MEMORY_ITEMS,
+        max_disk_items=PREDICTION_CACHE_MAX_ITEMS,
+    )
+
+    sketcher = None
+    if SKETCH_PRECLUSTER:
+        sketcher = SketchClusterer(
+            k=SKETCH_KMER,
+            threshold=SKETCH_THRESHOLD,
+            canonical=DEREPLICATE_REVERSE_COMPLEMENT,
+        )
+
+    app.state.backends = {}
+    if "remote" in ANALYSIS_BACKENDS:
+        app.state.backends["remote"] = RemoteBackend(
+            app.state.service,
+            app.state.prediction_cache,
+            shard_size=SHARD_SIZE,
+            concurrency=SHARD_CONCURRENCY,
+            reverse_complement=DEREPLICATE_REVERSE_COMPLEMENT,
+            compress_level=UPSTREAM_GZIP_LEVEL or None,
+            sketcher=sketcher,
+            sketch_min_sequences=SKETCH_MIN_SEQUENCES,
+            sketch_min_redundancy=SKETCH_MIN_REDUNDANCY,
+        )
+    if "local" in ANALYSIS_BACKENDS:
+        from module.embedding_store import EmbeddingStore
+        from module.local_inference import EmbeddingPool
+        pool = EmbeddingPool(workers=LOCAL_WORKERS, model_name=LOCAL_MODEL_NAME)
+        # One store per model, embeddings of different models never mix
+        store = EmbeddingStore(
+            os.path.join(EMBEDDING_STORE_DIR, LOCAL_MODEL_NAME.strip("/").replace("/", "__")),
+            model_name=LOCAL_MODEL_NAME,
+        )
+        app.state.backends["local"] = LocalBackend(
+            pool,
+            store,
+            reverse_complement=DEREPLICATE_REVERSE_COMPLEMENT,
+            cluster_options={
+                "sample_size": CLUSTER_SAMPLE_SIZE,
+                "pca_components": CLUSTER_PCA_COMPONENTS,
+                "deterministic": CLUSTER_DETERMINISTIC,
+            },
+            sketcher=sketcher,
+            sketch_min_sequences=SKETCH_MIN_SEQUENCES,
+            sketch_min_redundancy=SKETCH_MIN_REDUNDANCY,
+        )
+
+    app.state.uploads = UploadStore(UPLOAD_DIR, UPLOAD_DB_PATH)
+    await asyncio.to_thread(app.state.uploads.prune, time.time() - UPLOAD_RETENTION)
+    app.state.job_store = JobStore(JOB_STORE_PATH)
+    await asyncio.to_thread(app.state.job_store.prune, time.time() - JOB_RETENTION)
+    # Per-read tables of finished jobs, kept as long as the jobs themselves
+    app.state.results = ResultStore(RESULT_STORE_DIR)
+    await asyncio.to_thread(app.state.results.prune, time.time() - JOB_RETENTION)
+    app.state.jobs = JobManager(
+        app.state.job_store,
+        run_analysis_job,
+        concurrency=JOB_CONCURRENCY,
+        queue_size=JOB_QUEUE_SIZE,
+        lease=JOB_LEASE,
+        metrics=app.state.metrics,
+    )
+    await app.state.jobs.start()
+
+    # Serve right away, heavy backends warm up behind /health/ready
+    app.state.readiness = Readiness()
+    if BACKEND_WARMUP:
+        for name, backend in app.state.backends.items():
+            app.state.readiness.add(name, backend.warm_up())
+    try:
+        yield
+    finally:
+        await app.state.readiness.close()
+        await app.state.jobs.close()
+        app.state.job_store.close()
+        app.state.uploads.close()
+        for backend in app.state.backends.values():
+            await backend.close()
+        await app.state.http.close()
+        app.state.prediction_cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend access
 app.add_middleware(
@@ -22,11 +227,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "temp_uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 # External API endpoint
-EXTERNAL_API_URL = "https://pug-c-776087882401.europe-west1.run.app"
+EXTERNAL_API_URL = os.getenv("EXTERNAL_API_URL", "https://pug-c-776087882401.europe-west1.run.app")
+
+# Unique sequences per FASTA shard sent to /predict/fasta
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "2048"))
+SHARD_CONCURRENCY = int(os.getenv("SHARD_CONCURRENCY", "4"))
+# gzip level of shards sent upstream (e.g. 1). Off by default: only enable it
+# for a prediction service known to accept gzip-compressed FASTA uploads
+UPSTREAM_GZIP_LEVEL = int(os.getenv("UPSTREAM_GZIP_LEVEL", "0"))
 
 
 """
@@ -38,25 +250,370 @@ async def health_check():
     return {"status": "ok", "message": "Backend is running"}
 
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: 503 until every enabled backend has warmed up"""
+    stats = app.state.readiness.stats()
+    return JSONResponse(stats, status_code=200 if stats["ready"] else 503)
+
+
+@app.get("/health/pool")
+async def pool_stats():
+    """Connection pool statistics of the shared HTTP client"""
+    return app.state.http.stats()
+
+
+@app.get("/health/upstream")
+async def upstream_stats():
+    """Hedging, retry and circuit breaker state of the analysis service client"""
+    return app.state.service.stats()
+
+
+@app.get("/health/cache")
+async def cache_stats():
+    """Hit/miss counters and sizes of the prediction cache"""
+    return app.state.prediction_cache.stats()
+
+
+@app.get("/metrics")
+async def metrics(format: str = "json"):
+    """
+    Counters and latency/size histograms of this process (stage spans,
+    upstream attempts, retries, uploads, messages sent).
+    `?format=prometheus` returns the Prometheus text format instead.
+    """
+    if format == "prometheus":
+        return PlainTextResponse(app.state.metrics.prometheus(), media_type="text/plain; version=0.0.4")
+    return app.state.metrics.snapshot()
+
+
 """"
 Upload Files
 """
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), type: str = Form(".fastq")):
+async def upload_file(request: Request):
     """
-    Saves file and returns an ID. 
+    Streams file to disk and returns an ID. 
     Frontend uses this ID to open a WebSocket connection.
-    Accepts file type parameter (.fasta or .fastq)
+    The multipart body is parsed as it arrives: bytes of the `file` field
+    are written straight to the upload and scanned on the way, so the file
+    is never spooled to a temporary file first.
+    The `type` field (.fasta or .fastq) is only a hint - the real format is
+    sniffed from the content while records and bases are counted on the fly.
+    Gzip/BGZF files (.fastq.gz) are detected by their magic bytes, stored
+    compressed and scanned through a streaming decompressor.
+    """
+    uploads = app.state.uploads
+    metrics = app.state.metrics
+    file_id, part_path = uploads.new_part()
+    scanner = SequenceScanner()
+    decoder = None
+    compression = None
+    head = b""  # First bytes of the file, until there are enough to sniff gzip
+
+    def write_file(buffer, data):
+        nonlocal decoder, compression, head
+        if head is not None:
+            head += data
+            if len(head) < len(GZIP_MAGIC):
+                return
+            data, head = head, None
+            if is_gzip(data):
+                decoder = GzipDecoder()
+                compression = "gzip"
+        buffer.write(data)
+        if decoder is None:
+            scanner.feed(data)
+        else:
+            for block in decoder.feed(data):
+                scanner.feed(block)
+
+    try:
+        with metrics.span("upload") as span, open(part_path, "wb") as buffer:
+            form = StreamingForm(request.headers.get("content-type"), lambda data: write_file(buffer, data))
+            pending = bytearray()
+            async for chunk in request.stream():
+                pending += chunk
+                if len(pending) >= UPLOAD_CHUNK_SIZE:
+                    # Parse + disk write + scan run off the event loop
+                    await asyncio.to_thread(form.feed, bytes(pending))
+                    pending.clear()
+            await asyncio.to_thread(form.feed, bytes(pending))
+            form.finish()
+            if head:
+                # Shorter than the gzip magic, so plain
+                buffer.write(head)
+                scanner.feed(head)
+            if decoder is not None:
+                decoder.finish()
+            summary = scanner.finish()
+            span["bytes"] = buffer.tell()
+    except ValueError as e:
+        metrics.inc("uploads", status="rejected")
+        os.remove(part_path)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    # Publish the file under its real extension only once it is complete
+    await asyncio.to_thread(uploads.commit, file_id, part_path, summary, compression)
+    metrics.inc("uploads", status="ok", compression=compression or "none")
+    metrics.inc("upload_bytes", span["bytes"])
+    metrics.inc("upload_sequence_bytes", summary["bytes"])
+    metrics.observe("upload_size_bytes", span["bytes"], BYTES_BUCKETS)
+
+    return {
+        "file_id": file_id,
+        "format": summary["format"],
+        "compression": compression,
+        "sequence_count": summary["records"],
+        "message": "File received. Connect to WebSocket."
+    }
+
+
+""""
+Analysis Jobs
+"""
+async def run_analysis_job(ctx):
+    """
+    Analyses one upload on one backend. Runs in the JobManager, so it
+    finishes even if every client disconnects; progress goes out as events.
+    Each stage is a timing span of the job's trace; the per-stage totals
+    end up in the job result under "timings".
+    """
+    uploads = app.state.uploads
+    metrics = app.state.metrics
+    upload = await asyncio.to_thread(uploads.get, ctx.file_id)
+    backend = app.state.backends.get(ctx.backend)
+
+    # STEP 1: VALIDATION
+    if upload is None:
+        await ctx.emit({"type": "error", "message": "File not found"})
+        return
+    if backend is None:
+        await ctx.emit({"type": "error", "message": f"Analysis backend '{ctx.backend}' is not enabled"})
+        return
+
+    await ctx.stage("reading")
+    compressed = " (gzip)" if upload["compression"] else ""
+    await ctx.emit({"type": "log", "message": f"Reading Sequences from {upload['format'].upper()}{compressed} file..."})
+
+    # Sequence count comes from the sidecar index written during upload,
+    # older uploads without one get a vectorised scan of the mapped file
+    index = await asyncio.to_thread(uploads.index, ctx.file_id)
+    with open_fastx(upload["path"], index=index, compression=upload["compression"]) as reader:
+        with metrics.span("parse", backend=ctx.backend) as span:
+            sequence_count = await asyncio.to_thread(reader.count)
+            span["records"] = sequence_count
+
+        if sequence_count == 0:
+            await ctx.emit({"type": "error", "message": "No sequences found in file. Please check the file format."})
+            return
+
+        await ctx.emit({"type": "log", "message": f"Found {sequence_count} sequences"})
+
+        await ctx.stage("analysing")
+        await ctx.emit({"type": "log", "message": "Generating AI Embeddings..."})
+
+        await ctx.emit({"type": "log", "message": "Running UMAP & HDBSCAN..."})
+
+        # Genus (remote) or cluster (local) abundances, merged per shard as
+        # progress updates only: shards land in any order
+        aggregator = AbundanceAggregator()
+
+        async def send_log(message):
+            await ctx.emit({"type": "log", "message": message})
+
+        async def on_shard(payload):
+            # Stream partial results as soon as each shard lands
+            with metrics.span("aggregate", backend=ctx.backend) as span:
+                span["items"] = len(payload.get("results", []))
+                aggregator.add_results(payload.get("results", []), payload.get("weights"))
+                result = aggregator.clustering_result()
+            await ctx.emit({
+                "type": "clustering_result",
+                "data": result
+            })
+
+        try:
+            with metrics.span("analyse", backend=ctx.backend):
+                reads = await backend.analyze(reader, ctx.file_id, on_shard=on_shard, on_log=send_log)
+        except PredictionError as e:
+            print(f"Final error: {e}")
+            await ctx.emit({"type": "error", "message": str(e)})
+            return
+        except aiohttp.ClientError as e:
+            print(f"Client error: {e}")
+            await ctx.emit({"type": "error", "message": f"Connection error: {str(e)}"})
+            return
+
+        # Final stats from every unique sequence in file order, so ties and
+        # float sums don't depend on which shard happened to land first
+        with metrics.span("aggregate", backend=ctx.backend) as span:
+            span["items"] = reads.n_unique
+            abundance = AbundanceAggregator()
+            abundance.add_results(reads.predictions, reads.counts)
+            clustering_result = abundance.clustering_result()
+        await ctx.emit({"type": "clustering_result", "data": clustering_result})
+
+    await ctx.emit({"type": "log", "message": "Clustering Complete"})
+
+    # Send verification updates from prediction results
+    await ctx.stage("verifying")
+    await ctx.emit({"type": "log", "message": "Starting NCBI Verification (Slow)..."})
+    print(f"Sending verification for {len(abundance)} groups")
+
+    # Top groups by abundance, noise excluded
+    verifications = []
+    with metrics.span("verify", backend=ctx.backend):
+        if ctx.backend == "local" and VERIFY_LOCAL_CLUSTERS and len(abundance):
+            # Local clusters carry no genus: ask the analysis service about
+            # a few representatives of each, streamed as they complete
+            labels = np.fromiter(
+                (prediction["cluster"] for prediction in reads.predictions), dtype=np.int64, count=reads.n_unique
+            )
+            probabilities = np.fromiter(
+                (prediction["prediction"]["genus_prob"] for prediction in reads.predictions),
+                dtype=np.float64, count=reads.n_unique,
+            )
+            async for update in AsyncBlastVerifier.verify_stream(
+                reads.sequences, labels, app.state.service, top_n=5,
+                weights=reads.counts, probabilities=probabilities,
+            ):
+                print(f"Sending verification {update['step']}: {update['description']} - {update['match_percentage']}%")
+                await ctx.emit({"type": "verification_update", "data": update})
+                verifications.append(update)
+        if not verifications and len(abundance):
+            # Genus groups, or local clusters the service could not name
+            for idx, update in enumerate(abundance.verification_updates(top_n=5)):
+                print(f"Sending verification {idx+1}: {update['description']} - {update['match_percentage']}%")
+                await ctx.emit({"type": "verification_update", "data": update})
+                verifications.append(update)
+        elif not verifications:
+            # No results - show placeholder
+            verification_msg = {
+                "type": "verification_update",
+                "data": {
+                    "step": "Verification 1/1",
+                    "cluster_id": 0,
+                    "status": "No predictions available",
+                    "match_percentage": 0.0,
+                    "description": "The file may be empty or in an unsupported format"
+                }
+            }
+            await ctx.emit(verification_msg)
+            verifications.append(verification_msg["data"])
+
+    # Per-read predictions, queryable through /jobs/{job_id}/reads
+    with metrics.span("persist", backend=ctx.backend) as span:
+        span["rows"] = await asyncio.to_thread(app.state.results.write, ctx.job_id, reads)
+
+    # Stage totals and counters so far, the full span list goes to the job log
+    timings = ctx.trace.summary() if ctx.trace is not None else {}
+    timings.pop("spans", None)
+    await ctx.set_result({
+        "clustering_result": clustering_result,
+        "verification": verifications,
+        "timings": timings,
+        "reads": len(reads),
+    })
+
+    # The job's events and result outlive the upload itself
+    await asyncio.to_thread(uploads.delete, ctx.file_id)
+
+    await ctx.emit({"type": "complete", "message": "Analysis Finished."})
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, current stage and (once finished) result of an analysis job"""
+    job = await asyncio.to_thread(app.state.jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _open_results(job_id):
+    table = app.state.results.open(job_id)
+    if table is None:
+        raise HTTPException(status_code=404, detail="No per-read results for this job")
+    return table
+
+
+def _result_mask(table, genus, class_, cluster, min_prob, max_prob):
+    if all(value is None for value in (genus, class_, cluster, min_prob, max_prob)):
+        return None
+    return table.mask(genus=genus, class_=class_, cluster=cluster, min_prob=min_prob, max_prob=max_prob)
+
+
+@app.get("/jobs/{job_id}/reads")
+async def get_job_reads(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    sort: str = "row",
+    order: str = "asc",
+    genus: Optional[List[str]] = Query(None),
+    class_: Optional[List[str]] = Query(None, alias="class"),
+    cluster: Optional[int] = None,
+    min_prob: Optional[float] = None,
+    max_prob: Optional[float] = None,
+):
+    """
+    Per-read predictions of a finished job, one page at a time.
+    Filters: genus / class (repeatable), cluster, min_prob / max_prob
+    (genus probability). Sort by row (file order), genus, class, cluster
+    or genus_prob; order asc or desc.
+    """
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_COLUMNS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    limit = min(limit, RESULT_PAGE_LIMIT)
+
+    def run():
+        table = _open_results(job_id)
+        mask = _result_mask(table, genus, class_, cluster, min_prob, max_prob)
+        return table.query(mask, sort=sort, descending=order == "desc", offset=offset, limit=limit)
+
+    total, rows = await asyncio.to_thread(run)
+    return {"total": total, "offset": offset, "limit": limit, "reads": rows}
+
+
+@app.get("/jobs/{job_id}/groups")
+async def get_job_groups(
+    job_id: str,
+    by: str = "genus",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    genus: Optional[List[str]] = Query(None),
+    class_: Optional[List[str]] = Query(None, alias="class"),
+    cluster: Optional[int] = None,
+    min_prob: Optional[float] = None,
+    max_prob: Optional[float] = None,
+):
     """
-    file_id = str(uuid.uuid4())
-    # Use the provided file type (remove leading dot if present)
-    file_extension = type.lstrip('.')
-    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.{file_extension}")
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    return {"file_id": file_id, "message": "File received. Connect to WebSocket."}
+    Read counts per genus, class or cluster (largest first) over the
+    reads matching the same filters as /jobs/{job_id}/reads.
+    """
+    if by not in GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(GROUP_COLUMNS)}")
+    limit = min(limit, RESULT_PAGE_LIMIT)
+
+    def run():
+        table = _open_results(job_id)
+        mask = _result_mask(table, genus, class_, cluster, min_prob, max_prob)
+        return table.group_by(by, mask, offset=offset, limit=limit)
+
+    return {"by": by, **await asyncio.to_thread(run)}
+
+
+@app.get("/health/jobs")
+async def job_stats():
+    """Queue depth, running jobs and live subscribers of the job manager"""
+    return await asyncio.to_thread(app.state.jobs.stats)
 
 
 """"
@@ -64,282 +621,129 @@ Socket for prcocessing
 """
 @app.websocket("/ws/{file_id}")
 async def websocket_endpoint(websocket: WebSocket, file_id: str):
+    """
+    Subscribes to the analysis job of an upload, starting it if needed.
+    Past events are replayed before live ones, so reconnects and duplicate
+    connections share one analysis instead of re-running it.
+
+    By default every event is its own JSON frame. `?protocol=batch` sends
+    `{"type": "batch", "events": [...]}` frames instead: events that arrive
+    while the previous frame is still being written are coalesced into the
+    next one (older clustering_result snapshots are dropped), so slow
+    clients get fewer, larger frames rather than a growing backlog.
+    `&encoding=deflate` (raw deflate of the JSON) or `&encoding=msgpack`
+    switch batches to binary frames.
+    Job events carry a `seq`. A client that reconnects with
+    `?after={job_id}:{seq}` only receives the events after it; a cursor of
+    another job (e.g. one that failed and was re-run) replays everything.
+    The socket is closed as soon as the final event has been written.
+    """
     await websocket.accept()
-    
-    # Try to find the file with either extension
-    file_path = None
-    file_format = None
-    for ext, fmt in [("fastq", "fastq"), ("fasta", "fasta"), ("fa", "fasta"), ("fq", "fastq")]:
-        potential_path = os.path.join(UPLOAD_DIR, f"{file_id}.{ext}")
-        if os.path.exists(potential_path):
-            file_path = potential_path
-            file_format = fmt
-            break
+    jobs = websocket.app.state.jobs
+    metrics = websocket.app.state.metrics
 
-    try:
-        # STEP 1: VALIDATION
-        if not file_path or not os.path.exists(file_path):
+    # Pick the analysis backend, e.g. /ws/{file_id}?backend=local
+    backend_name = websocket.query_params.get("backend", ANALYSIS_BACKENDS[0])
+    batched = websocket.query_params.get("protocol") == "batch"
+    encoding = websocket.query_params.get("encoding", "json")
+
+    async def send_event(event):
+        if batched:
+            await _send_batch(websocket, [event], encoding, metrics)
+        else:
+            await websocket.send_json(event)
+            metrics.inc("ws_messages_sent", type=event.get("type"))
+
+    async def events():
+        upload = await asyncio.to_thread(websocket.app.state.uploads.get, file_id)
+        if upload is None:
+            # Finished jobs no longer have an upload, but can still be replayed
+            job = await asyncio.to_thread(websocket.app.state.job_store.latest, file_id, backend_name)
+            if job is None:
+                yield {"type": "error", "message": "File not found"}
+                return
+        else:
             try:
-                await websocket.send_json({"type": "error", "message": "File not found"})
-            except:
-                pass
-            return
+                job = await jobs.submit(file_id, backend_name)
+            except JobQueueFull as e:
+                yield {"type": "error", "message": str(e)}
+                return
 
-        # Small delay to ensure client is ready
-        await asyncio.sleep(0.1)
-        
-        try:
-            await websocket.send_json({"type": "log", "message": f"Reading Sequences from {file_format.upper()} file..."})
-        except Exception as e:
-            print(f"Failed to send initial message: {e}")
+        yield {"type": "job", "job_id": job["id"], "status": job["status"]}
+        after_job, _, after_seq = websocket.query_params.get("after", "").rpartition(":")
+        after = int(after_seq) if after_job == job["id"] and after_seq.isdigit() else -1
+        async for event in jobs.subscribe(job["id"], after):
+            yield event
+
+    try:
+        if batched and (encoding not in ENCODINGS or (encoding == "msgpack" and not msgpack_available())):
+            batched = False
+            await send_event({"type": "error", "message": f"Unsupported encoding '{encoding}'"})
             return
-        
-        # Read file content and count sequences
-        sequence_count = 0
-        with open(file_path, 'r') as f:
-            for record in SeqIO.parse(f, file_format):
-                sequence_count += 1
-        
-        if sequence_count == 0:
-            await websocket.send_json({"type": "error", "message": "No sequences found in file. Please check the file format."})
+        if backend_name not in websocket.app.state.backends:
+            await send_event({"type": "error", "message": f"Analysis backend '{backend_name}' is not enabled"})
             return
-        
-        await websocket.send_json({"type": "log", "message": f"Found {sequence_count} sequences"})
-        
-        # Read file content as binary for upload
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
-        await websocket.send_json({"type": "log", "message": "Generating AI Embeddings..."})
-        
-        # Create session with connector that allows retries
-        connector = aiohttp.TCPConnector(
-            ttl_dns_cache=300,
-            use_dns_cache=True,
-            limit=100,
-            limit_per_host=10
-        )
-        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as session:
-            # Prepare form data for FASTA prediction
-            form = aiohttp.FormData()
-            form.add_field('file', file_content, filename=f"{file_id}.{file_format}", content_type='application/octet-stream')
-            
-            await websocket.send_json({"type": "log", "message": "Running UMAP & HDBSCAN..."})
-            
-            # Retry logic with exponential backoff
-            max_retries = 3
-            retry_delay = 2
-            last_error = None
-            
-            for attempt in range(max_retries):
-                try:
-                    print(f"Attempting to call external API (attempt {attempt + 1}/{max_retries})...")
-                    await websocket.send_json({"type": "log", "message": f"Connecting to analysis service (attempt {attempt + 1}/{max_retries})..."})
-                    
-                    # Re-create form data for each retry
-                    form = aiohttp.FormData()
-                    form.add_field('file', file_content, filename=f"{file_id}.{file_format}", content_type='application/octet-stream')
-                    
-                    async with session.post(f"{EXTERNAL_API_URL}/predict/fasta", data=form, timeout=aiohttp.ClientTimeout(total=300)) as resp:
-                        print(f"External API response status: {resp.status}")
-                        
-                        if resp.status != 200:
-                            error_text = await resp.text()
-                            print(f"External API error: {error_text}")
-                            last_error = f"External API error ({resp.status}): {error_text}"
-                            if attempt < max_retries - 1:
-                                await websocket.send_json({"type": "log", "message": f"Service returned error, retrying in {retry_delay}s..."})
-                                await asyncio.sleep(retry_delay)
-                                retry_delay *= 2  # Exponential backoff
-                                continue
-                            else:
-                                await websocket.send_json({"type": "error", "message": last_error})
-                                return
-                        
-                        result = await resp.json()
-                        print(f"External API response: {result}")
-                        
-                        # Success! Break out of retry loop
-                        break
-                        
-                except (aiohttp.ClientConnectorError, aiohttp.ClientConnectorDNSError, asyncio.TimeoutError) as e:
-                    last_error = str(e)
-                    print(f"Connection error on attempt {attempt + 1}: {last_error}")
-                    
-                    if attempt < max_retries - 1:
-                        await websocket.send_json({"type": "log", "message": f"Connection failed, retrying in {retry_delay}s..."})
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                        continue
-                    else:
-                        error_msg = f"Cannot connect to analysis service after {max_retries} attempts: {last_error}"
-                        print(f"Final error: {error_msg}")
-                        await websocket.send_json({"type": "error", "message": error_msg})
-                        return
-                except Exception as e:
-                    last_error = str(e)
-                    print(f"Unexpected error on attempt {attempt + 1}: {last_error}")
-                    
-                    if attempt < max_retries - 1:
-                        await websocket.send_json({"type": "log", "message": f"Processing error, retrying in {retry_delay}s..."})
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                        continue
-                    else:
-                        await websocket.send_json({"type": "error", "message": f"Processing failed: {last_error}"})
-                        return
-            
-            # Continue processing if we successfully got a result
-            if 'result' not in locals():
-                return
-            
-            await websocket.send_json({"type": "log", "message": "Clustering Complete"})
-            
-            # Parse the response
-            count = result.get("count", 0)
-            results = result.get("results", [])
-            
-            # Calculate cluster statistics
-            if results:
-                unique_predictions = {}
-                for item in results:
-                    pred_dict = item.get("prediction", {})
-                    # Use genus as the key
-                    genus = pred_dict.get("genus", "unknown")
-                    genus_prob = pred_dict.get("genus_prob", 0)
-                    class_name = pred_dict.get("class", "unknown")
-                    
-                    if genus not in unique_predictions:
-                        unique_predictions[genus] = {
-                            "count": 0,
-                            "class": class_name,
-                            "avg_prob": 0,
-                            "total_prob": 0
-                        }
-                    unique_predictions[genus]["count"] += 1
-                    unique_predictions[genus]["total_prob"] += genus_prob
-                
-                # Calculate averages
-                for genus in unique_predictions:
-                    unique_predictions[genus]["avg_prob"] = unique_predictions[genus]["total_prob"] / unique_predictions[genus]["count"]
-                
-                # Create top groups
-                top_groups = []
-                for idx, (genus, data) in enumerate(sorted(unique_predictions.items(), key=lambda x: x[1]["count"], reverse=True)[:20]):
-                    percentage = (data["count"] / count * 100) if count > 0 else 0
-                    top_groups.append({
-                        "group_id": idx,
-                        "count": data["count"],
-                        "percentage": round(percentage, 2)
-                    })
-                
-                total_clusters = len(unique_predictions)
-            else:
-                top_groups = []
-                total_clusters = 0
-            
-            # Send clustering result
-            await websocket.send_json({
-                "type": "clustering_result",
-                "data": {
-                    "total_reads": count,
-                    "total_clusters": total_clusters,
-                    "noise_count": 0,
-                    "noise_percentage": 0.0,
-                    "top_groups": top_groups
-                }
-            })
-            
-            # Send verification updates from prediction results
-            await websocket.send_json({"type": "log", "message": "Starting NCBI Verification (Slow)..."})
-            print(f"Sending verification for {len(unique_predictions)} unique predictions")
-            
-            # Group results by prediction for verification display
-            if results:
-                displayed = 0
-                sorted_predictions = sorted(unique_predictions.items(), key=lambda x: x[1]["count"], reverse=True)[:5]
-                print(f"Top 5 predictions: {[genus for genus, _ in sorted_predictions]}")
-                
-                for idx, (genus, data) in enumerate(sorted_predictions):
-                    percentage = (data["count"] / count * 100) if count > 0 else 0
-                    prob_percent = round(data["avg_prob"] * 100, 1)
-                    
-                    # Determine status based on probability
-                    if prob_percent >= 95:
-                        status = "KNOWN (Old)"
-                    elif prob_percent >= 80:
-                        status = "RELATED (Old)"
-                    elif prob_percent >= 50:
-                        status = "NOVEL (New)"
-                    else:
-                        status = "GHOST (Newish)"
-                    
-                    verification_msg = {
-                        "type": "verification_update",
-                        "data": {
-                            "step": f"Verification {idx+1}/{min(5, len(unique_predictions))}",
-                            "cluster_id": idx,
-                            "status": status,
-                            "match_percentage": prob_percent,
-                            "description": f"{genus} (Class: {data['class']}, {data['count']} sequences, {round(percentage, 1)}%)"
-                        }
-                    }
-                    print(f"Sending verification {idx+1}: {genus} - {prob_percent}%")
-                    await websocket.send_json(verification_msg)
-                    await asyncio.sleep(0.1)  # Small delay between messages
-                    displayed += 1
-                    if displayed >= 5:
-                        break
-            else:
-                # No results - show placeholder
-                await websocket.send_json({
-                    "type": "verification_update",
-                    "data": {
-                        "step": "Verification 1/1",
-                        "cluster_id": 0,
-                        "status": "No predictions available",
-                        "match_percentage": 0.0,
-                        "description": "The file may be empty or in an unsupported format"
-                    }
-                })
-            
-            await websocket.send_json({"type": "complete", "message": "Analysis Finished."})
-            print("Analysis complete, waiting before closing connection...")
-            
-            # Give client time to receive all messages before closing
-            await asyncio.sleep(1.0)
-
-    except aiohttp.ClientError as e:
-        print(f"Client error: {e}")
-        try:
-            await websocket.send_json({"type": "error", "message": f"Connection error: {str(e)}"})
-            await asyncio.sleep(0.2)
-        except:
-            pass
+
+        if batched:
+            await _stream_batched(websocket, events(), encoding, metrics)
+        else:
+            async for event in events():
+                await send_event(event)
+
+    except WebSocketDisconnect:
+        print(f"Client disconnected from {file_id}, analysis continues in the background")
     except Exception as e:
         print(f"General error: {e}")
         import traceback
         traceback.print_exc()
         try:
-            await websocket.send_json({"type": "error", "message": str(e)})
-            await asyncio.sleep(0.2)
+            await send_event({"type": "error", "message": str(e)})
         except:
             pass
-    
+
     finally:
-        # Cleanup
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass  # Ignore cleanup errors
-        # Close connection gracefully
+        # Frames already written are delivered before the close frame
         try:
             await websocket.close()
         except:
             pass  # Connection may already be closed
 
 
+async def _stream_batched(websocket, events, encoding, metrics):
+    batcher = EventBatcher()
+
+    async def produce():
+        try:
+            async for event in events:
+                batcher.put(event)
+        finally:
+            batcher.close()
+
+    producer = asyncio.create_task(produce())
+    try:
+        # Each send returns once the frame is handed to the transport, which
+        # waits while the client's buffer is full; meanwhile events batch up
+        while batch := await batcher.get_batch():
+            await _send_batch(websocket, batch, encoding, metrics)
+        await producer
+    finally:
+        producer.cancel()
+        if batcher.dropped:
+            metrics.inc("ws_events_superseded", batcher.dropped)
+
+
+async def _send_batch(websocket, batch, encoding, metrics):
+    payload, binary = encode_batch(batch, encoding)
+    if binary:
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_text(payload)
+    metrics.inc("ws_frames_sent", encoding=encoding)
+    metrics.inc("ws_frame_bytes", len(payload), encoding=encoding)
+    for event in batch:
+        metrics.inc("ws_messages_sent", type=event.get("type"))
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
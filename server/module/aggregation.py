@@ -0,0 +1,157 @@
+import numpy as np
+
+# Verification status by average prediction probability (percent)
+STATUS_THRESHOLDS = (
+    (95, "KNOWN (Old)"),
+    (80, "RELATED (Old)"),
+    (50, "NOVEL (New)"),
+)
+STATUS_FALLBACK = "GHOST (Newish)"
+
+
+class AbundanceAggregator:
+    """
+    Incremental per-group abundance stats, kept as NumPy columns.
+    Each batch of predictions is turned into label / probability / weight
+    arrays and folded in with one np.unique + bincount, so merging costs
+    O(batch) however many results came before. Group rows are appended in
+    first-seen order; top-k partitions around the k-th count instead of
+    sorting every group, and ties go to the group seen first.
+    Labels in `noise_labels` (and items flagged as noise) count towards
+    the total reads and the noise stats, never towards a group.
+    """
+
+    def __init__(self, noise_labels=("unknown",)):
+        self.noise_labels = list(noise_labels)
+        self.total = 0.0
+        self.noise_count = 0.0
+        self._index = {}
+        self._labels = []
+        self._classes = []
+        self._counts = np.zeros(0, dtype=np.float64)
+        self._prob_sums = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self._labels)
+
+    def add_results(self, results, weights=None):
+        """
+        Folds in prediction items ({"prediction": {"genus", "class",
+        "genus_prob"}, "cluster"?}); `weights` are read multiplicities.
+        """
+        n = len(results)
+        predictions = [item.get("prediction") or {} for item in results]
+        labels = [pred.get("genus") or "unknown" for pred in predictions]
+        classes = [pred.get("class") or "unknown" for pred in predictions]
+        probabilities = np.fromiter((pred.get("genus_prob") or 0 for pred in predictions), dtype=np.float64, count=n)
+        # Local clustering marks unassigned reads with cluster -1
+        noise = np.fromiter((item.get("cluster") == -1 for item in results), dtype=bool, count=n)
+        self.add(labels, probabilities, weights, classes, noise)
+
+    def add(self, labels, probabilities=None, weights=None, classes=None, noise=None):
+        """Folds in one batch of columns (all of the same length)."""
+        labels = np.asarray(labels)
+        n = len(labels)
+        if n == 0:
+            return
+        weights = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+        probabilities = np.zeros(n) if probabilities is None else np.asarray(probabilities, dtype=np.float64)
+
+        is_noise = np.isin(labels, self.noise_labels) if self.noise_labels else np.zeros(n, dtype=bool)
+        if noise is not None:
+            is_noise |= np.asarray(noise, dtype=bool)
+        self.total += weights.sum()
+        self.noise_count += weights[is_noise].sum()
+
+        keep = np.flatnonzero(~is_noise)
+        if len(keep) == 0:
+            return
+        batch_labels, first, inverse = np.unique(labels[keep], return_index=True, return_inverse=True)
+
+        # Only distinct labels of the batch touch Python, visited in
+        # first-seen order so new groups are appended in that order
+        group_ids = np.empty(len(batch_labels), dtype=np.int64)
+        labels_list = batch_labels.tolist()
+        for i in np.argsort(first, kind="stable").tolist():
+            label = labels_list[i]
+            group = self._index.get(label)
+            if group is None:
+                group = len(self._labels)
+                self._index[label] = group
+                self._labels.append(label)
+                self._classes.append(classes[keep[first[i]]] if classes is not None else "unknown")
+            group_ids[i] = group
+
+        size = len(self._labels)
+        if len(self._counts) < size:
+            self._counts = np.concatenate([self._counts, np.zeros(size - len(self._counts))])
+            self._prob_sums = np.concatenate([self._prob_sums, np.zeros(size - len(self._prob_sums))])
+
+        groups = group_ids[inverse.ravel()]
+        w = weights[keep]
+        self._counts += np.bincount(groups, weights=w, minlength=size)
+        self._prob_sums += np.bincount(groups, weights=w * probabilities[keep], minlength=size)
+
+    def top(self, k):
+        """Group rows of the `k` most abundant groups, largest first."""
+        counts = self._counts
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if len(counts) > k:
+            # Every group tied with the k-th largest count is a candidate
+            cutoff = np.partition(counts, len(counts) - k)[len(counts) - k]
+            rows = np.flatnonzero(counts >= cutoff)
+        else:
+            rows = np.arange(len(counts))
+        # Largest first, equal counts in first-seen (row) order
+        return rows[np.lexsort((rows, -counts[rows]))][:k]
+
+    def clustering_result(self, top_k=20, group_ids="rank"):
+        """
+        `clustering_result` payload. `group_ids` is "rank" (position in
+        the top list) or "label" (the group label itself, e.g. a cluster id).
+        """
+        total = int(round(self.total))
+        top_groups = []
+        for rank, row in enumerate(self.top(top_k).tolist()):
+            count = int(round(self._counts[row]))
+            top_groups.append({
+                "group_id": rank if group_ids == "rank" else self._json_label(self._labels[row]),
+                "count": count,
+                "percentage": round(count / total * 100, 2) if total > 0 else 0,
+            })
+
+        noise_count = int(round(self.noise_count))
+        return {
+            "total_reads": total,
+            "total_clusters": len(self._labels),
+            "noise_count": noise_count,
+            "noise_percentage": round(noise_count / total * 100, 2) if total > 0 else 0.0,
+            "top_groups": top_groups,
+        }
+
+    def verification_updates(self, top_n=5):
+        """`verification_update` data for the `top_n` most abundant groups."""
+        rows = self.top(top_n).tolist()
+        updates = []
+        for idx, row in enumerate(rows):
+            count = int(round(self._counts[row]))
+            percentage = (count / float(self.total) * 100) if self.total > 0 else 0
+            prob_percent = round(float(self._prob_sums[row] / self._counts[row]) * 100, 1) if self._counts[row] else 0.0
+
+            # Determine status based on probability
+            status = next((name for threshold, name in STATUS_THRESHOLDS if prob_percent >= threshold), STATUS_FALLBACK)
+
+            label = self._labels[row]
+            updates.append({
+                "step": f"Verification {idx+1}/{len(rows)}",
+                "cluster_id": idx,
+                "status": status,
+                "match_percentage": prob_percent,
+                "description": f"{label} (Class: {self._classes[row]}, {count} sequences, {round(percentage, 1)}%)"
+            })
+        return updates
+
+    @staticmethod
+    def _json_label(label):
+        return label.item() if isinstance(label, np.generic) else label
@@ -0,0 +1,187 @@
+import asyncio
+
+import numpy as np
+
+from module.dereplicate import dereplicate
+from module.predictor import CachedPredictor, PredictionError, ShardedPredictor
+from module.sketch import representatives
+
+
+class AnalysisBackend:
+    """
+    Interface used by websocket_endpoint.
+    `analyze` returns a DereplicatedReads with one prediction per unique
+    sequence and reports weighted partial results through `on_shard(payload)`.
+    """
+
+    name = None
+
+    async def analyze(self, reader, file_id, on_shard=None, on_log=None):
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Loads whatever the first analysis would otherwise wait for."""
+
+    async def close(self):
+        pass
+
+
+class RemoteBackend(AnalysisBackend):
+    """Predictions from the external analysis service (/predict/fasta)."""
+
+    name = "remote"
+
+    def __init__(self, service, cache, shard_size=2048, concurrency=4, reverse_complement=False, compress_level=None,
+                 sketcher=None, sketch_min_sequences=0, sketch_min_redundancy=0.0):
+        self.service = service
+        self.cache = cache
+        self.shard_size = shard_size
+        self.concurrency = concurrency
+        self.reverse_complement = reverse_complement
+        self.compress_level = compress_level
+        self.sketcher = sketcher
+        self.sketch_min_sequences = sketch_min_sequences
+        self.sketch_min_redundancy = sketch_min_redundancy
+
+    async def analyze(self, reader, file_id, on_shard=None, on_log=None):
+        # Only unique sequences missing from the prediction cache go upstream
+        predictor = CachedPredictor(
+            ShardedPredictor(
+                self.service,
+                shard_size=self.shard_size,
+                concurrency=self.concurrency,
+                compress_level=self.compress_level,
+            ),
+            self.cache,
+            reverse_complement=self.reverse_complement,
+            sketcher=self.sketcher,
+            sketch_min_sequences=self.sketch_min_sequences,
+            sketch_min_redundancy=self.sketch_min_redundancy,
+        )
+        return await predictor.predict(reader, file_id, on_shard=on_shard, on_log=on_log)
+
+
+class LocalBackend(AnalysisBackend):
+    """
+    On-premises analysis: DNABERT embeddings from a pool of pinned worker
+    processes, clustered with ClusterEngine.run_scalable_analysis
+    (`cluster_options` are passed through to it).
+    Embeddings persist in an EmbeddingStore, so re-running a sample only
+    embeds sequences that were never seen before.
+    Each unique sequence is labelled with its cluster instead of a genus.
+    With a `sketcher` (SketchClusterer), at least `sketch_min_sequences`
+    uniques and an estimated redundancy of at least `sketch_min_redundancy`,
+    only k-mer sketch group representatives are embedded and clustered;
+    members take their representative's cluster.
+    """
+
+    name = "local"
+
+    def __init__(self, pool, store, reverse_complement=False, seed=42, cluster_options=None,
+                 sketcher=None, sketch_min_sequences=0, sketch_min_redundancy=0.0):
+        self.pool = pool
+        self.store = store
+        self.reverse_complement = reverse_complement
+        self.seed = seed
+        self.cluster_options = cluster_options or {}
+        self.sketcher = sketcher
+        self.sketch_min_sequences = sketch_min_sequences
+        self.sketch_min_redundancy = sketch_min_redundancy
+
+    async def analyze(self, reader, file_id, on_shard=None, on_log=None):
+        # Imported lazily so the remote-only server never loads umap
+        from module.clustering import ClusterEngine
+
+        reads = await asyncio.to_thread(dereplicate, reader.records(), self.reverse_complement)
+        if on_log:
+            await on_log(
+                f"Dereplicated {len(reads)} reads into {reads.n_unique} unique sequences "
+                f"({reads.duplication_factor:.1f}x duplication)"
+            )
+
+        async def on_progress(done, total):
+            if on_log:
+                await on_log(f"Embedded {done}/{total} unique sequences on {self.pool.workers} workers")
+
+        # Uniques that get embedded and clustered (all, or the sketch representatives)
+        targets = np.arange(reads.n_unique)
+        groups = targets
+        weights = reads.counts
+        if self.sketcher is not None and reads.n_unique >= self.sketch_min_sequences:
+            redundancy = await asyncio.to_thread(self.sketcher.estimate_redundancy, reads.sequences)
+            if redundancy < self.sketch_min_redundancy:
+                if on_log:
+                    await on_log(
+                        f"Sketch pre-clustering skipped: at most {redundancy * 100:.0f}% of the sequences "
+                        f"are near-duplicates"
+                    )
+            else:
+                groups = await asyncio.to_thread(self.sketcher.group, reads.sequences, reads.counts)
+                targets = representatives(groups)
+                weights = np.bincount(groups, weights=reads.counts, minlength=reads.n_unique)[targets]
+                if on_log:
+                    await on_log(
+                        f"Sketch pre-clustering: {reads.n_unique} unique sequences in {len(targets)} groups, "
+                        f"embedding representatives only"
+                    )
+        keys = [reads.keys[unique] for unique in targets.tolist()]
+
+        rows = await asyncio.to_thread(self.store.lookup, keys)
+        missing = targets[rows < 0].tolist()
+        if on_log:
+            await on_log(f"Embedding store: {len(targets) - len(missing)} cached, {len(missing)} to embed")
+        if missing:
+            sequences = [reads.sequences[unique].decode('ascii') for unique in missing]
+            new_embeddings = await self.pool.embed(sequences, on_progress=on_progress)
+            await asyncio.to_thread(self.store.append, [reads.keys[unique] for unique in missing], new_embeddings)
+
+        # float16 rows gathered from the memory-mapped store
+        embeddings = await asyncio.to_thread(self.store.load, keys)
+
+        cluster_df = await asyncio.to_thread(
+            ClusterEngine.run_scalable_analysis, embeddings, self.seed, **self.cluster_options
+        )
+        if len(cluster_df) != len(targets):
+            raise PredictionError("Local clustering failed")
+        if on_log:
+            stats = ClusterEngine.get_stats(cluster_df, weights=weights)
+            await on_log(
+                f"Found {stats['total_clusters']} clusters, {stats['noise_count']} reads "
+                f"({stats['noise_percentage']}%) unassigned"
+            )
+
+        probabilities = cluster_df['probability'].tolist()
+        for row, cluster_id in enumerate(cluster_df['cluster'].astype(int).tolist()):
+            unique = int(targets[row])
+            genus = "unknown" if cluster_id == -1 else f"Cluster {cluster_id}"
+            reads.predictions[unique] = {
+                "cluster": cluster_id,
+                "prediction": {
+                    "genus": genus,
+                    "class": "Unclassified",
+                    "genus_prob": probabilities[row],
+                },
+            }
+        if len(targets) < reads.n_unique:
+            for unique, representative in enumerate(groups.tolist()):
+                reads.predictions[unique] = reads.predictions[representative]
+
+        if on_shard:
+            weights = reads.counts.tolist()
+            await on_shard({"count": len(reads), "results": reads.predictions, "weights": weights})
+        return reads
+
+    async def warm_up(self):
+        # Model load in every worker, and the umap/sklearn imports plus
+        # numba JIT compilation (tens of seconds on first use)
+        await asyncio.gather(self.pool.warm_up(), asyncio.to_thread(_warm_clustering, self.seed))
+
+    async def close(self):
+        self.pool.shutdown()
+
+
+def _warm_clustering(seed):
+    from module.clustering import ClusterEngine
+
+    rng = np.random.default_rng(seed)
+    ClusterEngine.run_scalable_analysis(rng.normal(size=(300, 32)).astype(np.float32), seed)
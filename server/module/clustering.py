@@ -1,9 +1,18 @@
+import warnings
+
 import umap
 import pandas as pd
 import numpy as np
+from pynndescent import NNDescent
+from sklearn.cluster import HDBSCAN
+from sklearn.decomposition import PCA
+from sklearn.neighbors import NearestNeighbors
+
+from module.aggregation import AbundanceAggregator
 
-# HDBSCAN removed - using external API for clustering instead
-# This module is kept for backwards compatibility but not actively used
+# run_analysis: UMAP-only fallback on the full matrix (small samples)
+# run_scalable_analysis: PCA -> kNN graph -> UMAP + HDBSCAN on a subsample,
+# remaining points assigned from their nearest subsample neighbours
 
 class ClusterEngine:
     @staticmethod
@@ -13,54 +22,157 @@ class ClusterEngine:
         For production, use external API via main.py
         """
         try:
-            # 1. UMAP
+            # 1. UMAP (float16 store rows are widened first)
+            embeddings = np.asarray(embeddings, dtype=np.float32)
             reducer = umap.UMAP(n_neighbors=15, min_dist=0.1, metric='cosine', random_state=seed, n_jobs=1)
             embedding_2d = reducer.fit_transform(embeddings)
 
             # 3. Create Stats DataFrame
             df = pd.DataFrame(embedding_2d, columns=['x', 'y'])
             df['cluster'] = 0  # Single cluster fallback
+            df['probability'] = 1.0
             return df
         except Exception as e:
             print(f"Clustering fallback failed: {e}")
             # Return minimal valid structure
-            return pd.DataFrame({'x': [], 'y': [], 'cluster': []})
+            return pd.DataFrame({'x': [], 'y': [], 'cluster': [], 'probability': []})
 
     @staticmethod
-    def get_stats(df):
+    def run_scalable_analysis(embeddings, seed=42, pca_components=50, sample_size=50000,
+                              n_neighbors=15, umap_components=2, min_cluster_size=None,
+                              assign_neighbors=10, deterministic=True, n_jobs=-1, chunk_size=8192):
+        """
+        Density clustering for samples too large for run_analysis.
+
+        1. PCA to `pca_components` dims, fitted on the subsample and applied
+           chunk by chunk (float16 input is never widened as a whole).
+        2. kNN graph of `sample_size` randomly drawn points: exact and
+           parallel when `deterministic`, pynndescent otherwise.
+        3. UMAP to `umap_components` dims on that graph (skipped when None),
+           then HDBSCAN on the subsample.
+        4. Every other point takes the majority label of its
+           `assign_neighbors` nearest subsample points.
+
+        With `deterministic` the result only depends on `seed`; UMAP's
+        layout is then the one single-threaded step, bounded by `sample_size`.
+        Clusters are renumbered by size; -1 is noise.
+        Returns a DataFrame with x, y, cluster and probability columns.
+        """
+        embeddings = np.asarray(embeddings)
+        n = len(embeddings)
+        if n == 0:
+            return pd.DataFrame({'x': [], 'y': [], 'cluster': [], 'probability': []})
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, sample_size), replace=False))
+
+        if len(sample) < 3:
+            # Too few points to estimate any density
+            df = pd.DataFrame(np.zeros((n, 2), dtype=np.float32), columns=['x', 'y'])
+            df['cluster'] = 0
+            df['probability'] = 1.0
+            return df
+
+        # 1. PCA, then unit rows so euclidean neighbours are cosine neighbours
+        n_components = min(pca_components or embeddings.shape[1], embeddings.shape[1], len(sample))
+        pca = None
+        if n_components < embeddings.shape[1]:
+            pca = PCA(n_components=n_components, svd_solver='randomized', random_state=seed)
+            pca.fit(embeddings[sample].astype(np.float32))
+        reduced = np.empty((n, n_components), dtype=np.float32)
+        for start in range(0, n, chunk_size):
+            block = embeddings[start:start + chunk_size].astype(np.float32)
+            reduced[start:start + chunk_size] = pca.transform(block) if pca is not None else block
+        reduced /= np.maximum(np.linalg.norm(reduced, axis=1, keepdims=True), 1e-12)
+        sample_vectors = reduced[sample]
+
+        # 2. kNN graph of the subsample
+        k = min(n_neighbors, len(sample) - 1)
+        if deterministic:
+            index = NearestNeighbors(n_neighbors=k + 1, n_jobs=n_jobs).fit(sample_vectors)
+            knn_dists, knn_indices = index.kneighbors(sample_vectors)
+        else:
+            index = NNDescent(sample_vectors, n_neighbors=k + 1, metric='euclidean', n_jobs=n_jobs)
+            knn_indices, knn_dists = index.neighbor_graph
+
+        # 3. Layout + density clustering on the subsample
+        if umap_components and len(sample) > n_neighbors:
+            reducer = umap.UMAP(
+                n_neighbors=k + 1,
+                n_components=umap_components,
+                min_dist=0.0,
+                precomputed_knn=(knn_indices, knn_dists, None),
+                random_state=seed if deterministic else None,
+                n_jobs=1 if deterministic else n_jobs,
+            )
+            with warnings.catch_warnings():
+                # No search index is passed along; transform() is never used
+                warnings.filterwarnings('ignore', message='precomputed_knn')
+                space = reducer.fit_transform(sample_vectors)
+        else:
+            space = sample_vectors
+        coords = np.zeros((len(sample), 2), dtype=np.float32)
+        coords[:, :min(2, space.shape[1])] = space[:, :2]
+
+        if min_cluster_size is None:
+            min_cluster_size = max(5, len(sample) // 500)
+        min_cluster_size = max(2, min(min_cluster_size, len(sample)))
+        hdb = HDBSCAN(min_cluster_size=min_cluster_size, copy=True, n_jobs=n_jobs).fit(space)
+        sample_labels = hdb.labels_.astype(np.int64)
+        sample_probs = hdb.probabilities_.astype(np.float32)
+
+        labels = np.empty(n, dtype=np.int64)
+        probs = np.empty(n, dtype=np.float32)
+        xy = np.empty((n, 2), dtype=np.float32)
+        labels[sample] = sample_labels
+        probs[sample] = sample_probs
+        xy[sample] = coords
+
+        # 4. Assign the rest from their nearest subsample points
+        rest = np.setdiff1d(np.arange(n), sample, assume_unique=True)
+        k = min(assign_neighbors, len(sample))
+        n_labels = int(sample_labels.max()) + 2  # slot 0 is noise
+        for start in range(0, len(rest), chunk_size):
+            chunk = rest[start:start + chunk_size]
+            if deterministic:
+                _, neighbours = index.kneighbors(reduced[chunk], n_neighbors=k)
+            else:
+                neighbours, _ = index.query(reduced[chunk], k=k)
+
+            votes = np.zeros((len(chunk), n_labels), dtype=np.int32)
+            support = np.zeros((len(chunk), n_labels), dtype=np.float32)
+            rows = np.repeat(np.arange(len(chunk)), k)
+            slots = sample_labels[neighbours].ravel() + 1
+            np.add.at(votes, (rows, slots), 1)
+            np.add.at(support, (rows, slots), sample_probs[neighbours].ravel())
+
+            winner = votes.argmax(axis=1)
+            labels[chunk] = winner - 1
+            probs[chunk] = support[np.arange(len(chunk)), winner] / k
+            xy[chunk] = coords[neighbours].mean(axis=1)
+
+        # Largest cluster first, noise stays -1
+        clustered = labels >= 0
+        sizes = np.bincount(labels[clustered], minlength=n_labels - 1)
+        rank = np.empty_like(sizes)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(len(sizes))
+        labels[clustered] = rank[labels[clustered]]
+
+        df = pd.DataFrame(xy, columns=['x', 'y'])
+        df['cluster'] = labels
+        df['probability'] = probs
+        return df
+
+    @staticmethod
+    def get_stats(df, weights=None):
+        """
+        clustering_result payload for a cluster DataFrame.
+        `weights` are per-row read counts (dereplicated input); -1 is noise.
+        """
         try:
-            total_seqs = len(df)
-            if total_seqs == 0:
-                return pd.DataFrame()
-            
-            abundance = df['cluster'].value_counts().reset_index()
-            abundance.columns = ['cluster', 'count']
-            abundance['percentage'] = (abundance['count'] / total_seqs) * 100
-            
-            # Filter valid species
-            species_df = abundance[abundance['cluster'] != -1].sort_values('count', ascending=False)
-            return species_df
+            aggregator = AbundanceAggregator(noise_labels=(-1,))
+            aggregator.add(df['cluster'].astype(int).to_numpy(), weights=weights)
+            return aggregator.clustering_result(group_ids="label")
         except Exception as e:
             print(f"Stats calculation failed: {e}")
-            return pd.DataFrame()
-        
-        noise_row = abundance[abundance['cluster'] == -1]
-        noise_count = int(noise_row['count'].sum()) if not noise_row.empty else 0
-        noise_perc = float(noise_row['percentage'].sum()) if not noise_row.empty else 0
-
-      
-        top_groups = []
-        for _, row in species_df.head(20).iterrows():
-            top_groups.append({
-                "group_id": int(row['cluster']),
-                "count": int(row['count']),
-                "percentage": round(row['percentage'], 2)
-            })
-
-        return {
-            "total_reads": total_seqs,
-            "total_clusters": len(species_df),
-            "noise_count": noise_count,
-            "noise_percentage": round(noise_perc, 2),
-            "top_groups": top_groups
-        }
\ No newline at end of file
+            return AbundanceAggregator().clustering_result()
@@ -0,0 +1,57 @@
+import gzip
+import zlib
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Upper bound of one decompressed block, keeps RSS flat on highly
+# compressible (or hostile) input
+MAX_BLOCK = 4 * 1024 * 1024
+
+# zlib window bits for a gzip container
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def is_gzip(head):
+    return bytes(head[:2]) == GZIP_MAGIC
+
+
+class GzipDecoder:
+    """
+    Streaming gzip decompressor for chunks as they arrive.
+    Handles multi-member files, so BGZF (a series of small gzip members,
+    as written by bgzip/samtools) decodes the same as plain gzip.
+    """
+
+    def __init__(self, max_block=MAX_BLOCK):
+        self.max_block = max_block
+        self._member = zlib.decompressobj(_GZIP_WBITS)
+        self._in_member = False
+
+    def feed(self, data):
+        """Yields decompressed blocks of at most `max_block` bytes."""
+        data = bytes(data)
+        while data:
+            self._in_member = True
+            try:
+                block = self._member.decompress(data, self.max_block)
+            except zlib.error as e:
+                raise ValueError(f"Corrupt gzip data: {e}")
+            if block:
+                yield block
+            if self._member.eof:
+                # Next member (BGZF block) starts right after this one
+                data = self._member.unused_data
+                self._member = zlib.decompressobj(_GZIP_WBITS)
+                self._in_member = False
+            else:
+                data = self._member.unconsumed_tail
+
+    def finish(self):
+        """Raises ValueError if the stream ended inside a member."""
+        if self._in_member:
+            raise ValueError("Truncated gzip file")
+
+
+def gzip_bytes(data, level=1):
+    """Single-member gzip of `data`; level 1 already gets most of the gain on DNA."""
+    return gzip.compress(bytes(data), compresslevel=level, mtime=0)
@@ -0,0 +1,91 @@
+from array import array
+
+import numpy as np
+
+from module.prediction_cache import sequence_key
+
+# IUPAC complement table (input is upper-cased first)
+_COMPLEMENT = bytes.maketrans(b"ACGTRYKMBVDHN", b"TGCAYRMKVBHDN")
+
+
+def normalize(seq, reverse_complement=False):
+    """
+    Upper-cases a read (U -> T) and, if requested, returns the
+    lexicographically smaller of the read and its reverse complement so
+    both strands collapse onto one unique sequence.
+    """
+    seq = bytes(seq).upper().replace(b"U", b"T")
+    if reverse_complement:
+        rc = seq.translate(_COMPLEMENT)[::-1]
+        if rc < seq:
+            return rc
+    return seq
+
+
+class DereplicatedReads:
+    """
+    Unique sequences of an upload plus the mapping needed to expand
+    per-unique results back to every read.
+    `counts[u]` is the multiplicity of unique `u` and `read_to_unique[i]`
+    the unique that read `i` collapsed onto. Read names are kept as one
+    UTF-8 blob (`name_data`) cut by `name_offsets`, not as per-read strings.
+    """
+
+    def __init__(self, name_data, name_offsets, read_to_unique, sequences, keys):
+        self.name_data = name_data
+        self.name_offsets = name_offsets
+        self.read_to_unique = read_to_unique
+        self.sequences = sequences
+        self.keys = keys
+        self.counts = np.bincount(read_to_unique, minlength=len(sequences))
+        # One prediction per unique sequence, filled in by the predictor
+        self.predictions = [None] * len(sequences)
+
+    def __len__(self):
+        return len(self.read_to_unique)
+
+    @property
+    def n_unique(self):
+        return len(self.sequences)
+
+    @property
+    def duplication_factor(self):
+        return len(self) / self.n_unique if self.n_unique else 0.0
+
+    def name(self, i):
+        return bytes(self.name_data[self.name_offsets[i]:self.name_offsets[i + 1]]).decode('utf-8', 'replace')
+
+    def iter_reads(self):
+        """Yields (read_name, prediction) in file order."""
+        for i, unique in enumerate(self.read_to_unique.tolist()):
+            yield self.name(i), self.predictions[unique]
+
+
+def dereplicate(records, reverse_complement=False):
+    """
+    Collapses (name, sequence) records into a DereplicatedReads.
+    Per read only a name and a uint32 unique id are kept; sequences and
+    their cache keys exist once per unique.
+    """
+    name_data = bytearray()
+    name_ends = array('q', [0])
+    read_to_unique = array('I')
+    seen = {}
+
+    for name, seq in records:
+        canonical = normalize(seq, reverse_complement)
+        read_to_unique.append(seen.setdefault(canonical, len(seen)))
+        name_data += name
+        name_ends.append(len(name_data))
+
+    # Insertion order is unique id order
+    sequences = list(seen)
+    del seen
+    keys = [sequence_key(seq) for seq in sequences]
+    return DereplicatedReads(
+        name_data,
+        np.frombuffer(name_ends, dtype=np.int64),
+        np.frombuffer(read_to_unique, dtype=f"u{read_to_unique.itemsize}"),
+        sequences,
+        keys,
+    )
@@ -0,0 +1,197 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+KEY_BYTES = 16
+
+
+class _Snapshot:
+    """Mapped rows of one committed state; replaced as a whole, never mutated."""
+
+    def __init__(self, rows, vectors, keys):
+        self.rows = rows
+        self.vectors = vectors
+        self.keys = keys
+        prefixes = keys.view('<u8')[:, 0]
+        order = np.argsort(prefixes, kind="stable")
+        self.sorted_prefixes = prefixes[order]
+        self.sorted_rows = order.astype(np.int64)
+
+
+class EmbeddingStore:
+    """
+    Persistent embeddings keyed by `sequence_key`.
+    Vectors are fixed-width float16 rows in a memory-mapped file; keys are
+    kept in a parallel file and indexed by a sorted uint64 prefix array, so
+    millions of rows cost ~16 bytes of RAM each and lookups are vectorised.
+    `meta.json` holds the committed row count; bytes past it are the tail
+    of an interrupted append and are cut off. Appends take an exclusive
+    file lock and re-read the meta first, so several processes on one
+    host (e.g. uvicorn workers) can share a directory; lookups remap when
+    another process has committed rows. Reads take no lock: the mapped
+    arrays are published as one immutable snapshot, swapped in a single
+    assignment, so a concurrent append never shows a half-updated index.
+    """
+
+    def __init__(self, directory, dim=None, model_name=None):
+        self.directory = directory
+        self.dim = dim
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._vectors_path = os.path.join(directory, "vectors.f16")
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._lock_path = os.path.join(directory, "lock")
+
+        self._snapshot = None  # Not mapped yet
+        with self._locked():
+            meta = self._read_meta()
+            if meta is not None and ((dim is not None and meta["dim"] != dim) or meta.get("model_name") != model_name):
+                raise ValueError(
+                    f"Embedding store at {directory} holds {meta.get('model_name')} (dim {meta['dim']}), "
+                    f"not {model_name} (dim {dim})"
+                )
+            self._sync(meta)
+
+    @property
+    def rows(self):
+        """Committed rows currently mapped (None before the first sync)."""
+        return None if self._snapshot is None else self._snapshot.rows
+
+    @property
+    def vectors(self):
+        """Zero-copy float16 view of every stored row."""
+        return self._snapshot.vectors
+
+    def lookup(self, keys):
+        """Row number of each key, -1 where the key is not stored."""
+        return self._lookup(self._refresh(), self._as_key_array(keys))
+
+    def load(self, keys):
+        """float16 matrix for `keys`; raises KeyError if any key is missing."""
+        # Rows and vectors from the same snapshot
+        snapshot = self._refresh()
+        rows = self._lookup(snapshot, self._as_key_array(keys))
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} embeddings missing from store")
+        return snapshot.vectors[rows]
+
+    def append(self, keys, vectors):
+        """Stores new (key, vector) pairs; keys already present are skipped."""
+        keys = self._as_key_array(keys)
+        vectors = np.asarray(vectors)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(f"Expected vectors of shape ({len(keys)}, {self.dim}), got {vectors.shape}")
+
+        with self._locked():
+            # Rows other processes committed since our last look
+            self._sync(self._read_meta())
+            new = self._lookup(self._snapshot, keys) < 0
+            # Drop duplicates within the batch itself
+            _, first = np.unique(keys.view(f'V{KEY_BYTES}').ravel(), return_index=True)
+            unique_mask = np.zeros(len(keys), dtype=bool)
+            unique_mask[first] = True
+            new &= unique_mask
+            if not new.any():
+                return 0
+
+            # Data first, meta last: a crash in between leaves a tail _sync cuts off
+            with open(self._vectors_path, 'ab') as f:
+                f.write(np.ascontiguousarray(vectors[new], dtype=np.float16).tobytes())
+            with open(self._keys_path, 'ab') as f:
+                f.write(np.ascontiguousarray(keys[new]).tobytes())
+            added = int(new.sum())
+            rows = self._snapshot.rows + added
+            self._write_meta(rows)
+            self._snapshot = self._map(rows)
+            return added
+
+    @contextmanager
+    def _locked(self):
+        # flock excludes other processes, the thread lock other threads
+        with self._lock, open(self._lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _sync(self, meta):
+        """Adopts the committed state and cuts uncommitted tails (lock held)."""
+        if meta is None:
+            # Nothing committed yet; any bytes are from a crashed first append.
+            # A new store without `dim` takes it from the first append
+            rows, widths = 0, ((self._vectors_path, 0), (self._keys_path, 0))
+        else:
+            self.dim = meta["dim"]
+            rows = meta["rows"]
+            widths = ((self._vectors_path, self.dim * 2), (self._keys_path, KEY_BYTES))
+        for path, width in widths:
+            with open(path, 'ab') as f:
+                if f.tell() > rows * width:
+                    f.truncate(rows * width)
+        if rows != self.rows:
+            self._snapshot = self._map(rows)
+
+    def _refresh(self):
+        """Current snapshot, remapped first if another process committed rows."""
+        snapshot = self._snapshot
+        meta = self._read_meta()
+        # Committed rows only grow; never step back to an older state
+        if meta is not None and meta["rows"] > snapshot.rows:
+            self.dim = meta["dim"]
+            snapshot = self._map(meta["rows"])
+            if snapshot.rows > self._snapshot.rows:
+                self._snapshot = snapshot
+        return snapshot
+
+    def _map(self, rows):
+        if rows:
+            vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r', shape=(rows, self.dim))
+            keys = np.memmap(self._keys_path, dtype=np.uint8, mode='r', shape=(rows, KEY_BYTES))
+        else:
+            vectors = np.empty((0, self.dim or 0), dtype=np.float16)
+            keys = np.empty((0, KEY_BYTES), dtype=np.uint8)
+        return _Snapshot(rows, vectors, keys)
+
+    @staticmethod
+    def _lookup(snapshot, keys):
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if snapshot.rows == 0 or len(keys) == 0:
+            return rows
+
+        prefixes = keys.view('<u8')[:, 0]
+        pos = np.searchsorted(snapshot.sorted_prefixes, prefixes)
+        pos = np.minimum(pos, len(snapshot.sorted_prefixes) - 1)
+        candidates = snapshot.sorted_rows[pos]
+        # Prefix match narrows it down, the full 16-byte key confirms it
+        match = (snapshot.sorted_prefixes[pos] == prefixes) & np.all(snapshot.keys[candidates] == keys, axis=1)
+        rows[match] = candidates[match]
+        return rows
+
+    def _write_meta(self, rows):
+        tmp_path = self._meta_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"dim": self.dim, "rows": rows, "model_name": self.model_name}, f)
+        os.replace(tmp_path, self._meta_path)
+
+    @staticmethod
+    def _as_key_array(keys):
+        if isinstance(keys, np.ndarray):
+            return keys.reshape(-1, KEY_BYTES)
+        return np.frombuffer(b"".join(keys), dtype=np.uint8).reshape(-1, KEY_BYTES)
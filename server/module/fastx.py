@@ -0,0 +1,263 @@
+import mmap
+import os
+
+import numpy as np
+
+from module.compression import GzipDecoder
+from module.sequence_index import CARRIAGE_RETURN, FASTA_COMMENT, FASTA_HEADER, INDEX_STRIDE, SequenceScanner
+
+# Bytes handed to the vectorised scanner per step
+SCAN_WINDOW = 4 * 1024 * 1024
+
+# Compressed bytes read per step by GzipFastxReader
+READ_CHUNK = 1024 * 1024
+
+
+class FastxReader:
+    """
+    Zero-copy FASTA/FASTQ reader backed by mmap.
+    Record boundaries come from the vectorised SequenceScanner, so counting
+    never builds per-read objects, and records are served as memoryview
+    slices of the mapped file (valid until the reader is closed).
+    """
+
+    def __init__(self, path, index=None):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        if self.size:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._mm)
+        else:
+            self._mm = None
+            self._view = memoryview(b"")
+
+        # Sidecar summary from upload (sparse offsets), full offsets on demand
+        self._index = index
+        self._offsets = None
+        self.format = index["format"] if index else self._sniff()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count()
+
+    def close(self):
+        self._view.release()
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                pass  # Caller still holds record slices; the map goes with them
+        self._file.close()
+
+    def count(self):
+        """Number of records, from the sidecar index if available."""
+        if self._index is None:
+            self._index = self._scan(INDEX_STRIDE)[0]
+        return self._index["records"]
+
+    def offsets(self):
+        """Byte offset of every record header as an int64 array."""
+        if self._offsets is None:
+            summary, self._offsets = self._scan(1)
+            if self._index is None:
+                summary["stride"] = INDEX_STRIDE
+                summary["offsets"] = self._offsets[::INDEX_STRIDE]
+                self._index = summary
+        return self._offsets
+
+    def record(self, i):
+        """Random access: (name, sequence) of record `i`."""
+        offsets = self.offsets()
+        start = int(offsets[i])
+        end = int(offsets[i + 1]) if i + 1 < len(offsets) else self.size
+        return next(self.records(start, end))
+
+    def chunks(self, records_per_chunk):
+        """
+        Yields record-aligned (start, end, n_records) byte ranges.
+        Uses the sparse sidecar offsets when the chunk size allows it,
+        so no scan is needed for uploads indexed on the fly.
+        """
+        if self._offsets is None and self._index is not None and records_per_chunk % self._index["stride"] == 0:
+            step = records_per_chunk // self._index["stride"]
+            boundaries = np.asarray(self._index["offsets"], dtype=np.int64)[::step]
+        else:
+            boundaries = self.offsets()[::records_per_chunk]
+
+        total = self.count()
+        for n, start in enumerate(boundaries):
+            end = int(boundaries[n + 1]) if n + 1 < len(boundaries) else self.size
+            yield int(start), end, min(records_per_chunk, total - n * records_per_chunk)
+
+    def chunk(self, start, end):
+        """Zero-copy view of a byte range, e.g. one chunk from `chunks()`."""
+        return self._view[start:end]
+
+    def records(self, start=0, end=None):
+        """
+        Yields (name, sequence) memoryviews for records in a byte range.
+        FASTQ and single-line FASTA sequences are zero-copy; wrapped FASTA
+        sequences are joined into one bytes object.
+        """
+        end = self.size if end is None else end
+        yield from _parse_records(self._mm, self._view, self.format, start, end)
+
+    def sequences(self, start=0, end=None):
+        """Yields sequences as upper-case str, for tokenizers and hashing."""
+        for _, seq in self.records(start, end):
+            yield bytes(seq).decode('ascii').upper()
+
+    def _scan(self, stride):
+        scanner = SequenceScanner(stride=stride)
+        for pos in range(0, self.size, SCAN_WINDOW):
+            scanner.feed(self._view[pos:pos + SCAN_WINDOW])
+        summary = scanner.finish()
+        return summary, scanner.offsets()
+
+    def _sniff(self):
+        return _sniff_format(self._view[:4096])
+
+
+class GzipFastxReader:
+    """
+    Streaming reader for gzip/BGZF compressed FASTA/FASTQ uploads.
+    The file stays compressed on disk and is inflated block by block;
+    decompressed data is cut at record boundaries from the sidecar index
+    (offsets into the decompressed stream) so only a few MiB are ever
+    held in memory. Exposes the sequential part of the FastxReader API.
+    """
+
+    def __init__(self, path, index=None):
+        self.path = path
+        self._index = index
+        self.format = index["format"] if index else self._sniff()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count()
+
+    def close(self):
+        pass  # Files are only open while records() is iterated
+
+    def count(self):
+        """Number of records, from the sidecar index if available."""
+        if self._index is None:
+            scanner = SequenceScanner()
+            for block in self._blocks():
+                scanner.feed(block)
+            self._index = scanner.finish()
+        return self._index["records"]
+
+    def records(self):
+        """
+        Yields (name, sequence) for every record. Views are only backed
+        by the current decompressed block, copy them to keep them around.
+        """
+        self.count()
+        boundaries = np.append(np.asarray(self._index["offsets"], dtype=np.int64), self._index["bytes"])
+        buf = bytearray()
+        buf_start = 0  # Decompressed offset of buf[0]
+        for block in self._blocks():
+            buf += block
+            # Parse up to the last record boundary already inflated
+            last = boundaries[np.searchsorted(boundaries, buf_start + len(buf), side="right") - 1]
+            cut = int(last) - buf_start
+            if cut > 0:
+                data = bytes(buf[:cut])
+                del buf[:cut]
+                buf_start += cut
+                yield from _parse_records(data, memoryview(data), self.format, 0, len(data))
+        if buf:
+            data = bytes(buf)
+            yield from _parse_records(data, memoryview(data), self.format, 0, len(data))
+
+    def sequences(self):
+        """Yields sequences as upper-case str, for tokenizers and hashing."""
+        for _, seq in self.records():
+            yield bytes(seq).decode('ascii').upper()
+
+    def _blocks(self):
+        decoder = GzipDecoder()
+        with open(self.path, 'rb') as f:
+            while True:
+                raw = f.read(READ_CHUNK)
+                if not raw:
+                    break
+                yield from decoder.feed(raw)
+        decoder.finish()
+
+    def _sniff(self):
+        for block in self._blocks():
+            return _sniff_format(block[:4096])
+        return _sniff_format(b"")
+
+
+def open_fastx(path, index=None, compression=None):
+    """FastxReader, or GzipFastxReader for `compression="gzip"` uploads."""
+    if compression == "gzip":
+        return GzipFastxReader(path, index)
+    return FastxReader(path, index)
+
+
+def _sniff_format(head):
+    head = bytes(head).lstrip()
+    if head.startswith(b">"):
+        return "fasta"
+    if head.startswith(b"@"):
+        return "fastq"
+    raise ValueError("Unrecognised sequence format: expected FASTA ('>') or FASTQ ('@') records")
+
+
+def _parse_records(buf, view, fmt, pos, end):
+    """Records in buf[pos:end]; `buf` is an mmap or bytes, `view` a memoryview of it."""
+    if fmt == "fastq":
+        return _fastq_records(buf, view, pos, end)
+    return _fasta_records(buf, view, pos, end)
+
+
+def _line(buf, view, pos, end):
+    """Returns (line_view, next_pos) with the newline and any CR stripped."""
+    nl = buf.find(b"\n", pos, end)
+    stop = end if nl == -1 else nl
+    next_pos = end if nl == -1 else nl + 1
+    if stop > pos and view[stop - 1] == CARRIAGE_RETURN:
+        stop -= 1
+    return view[pos:stop], next_pos
+
+
+def _fastq_records(buf, view, pos, end):
+    while pos < end:
+        header, pos = _line(buf, view, pos, end)
+        if len(header) == 0:
+            continue  # Padding between records
+        seq, pos = _line(buf, view, pos, end)
+        _, pos = _line(buf, view, pos, end)
+        _, pos = _line(buf, view, pos, end)
+        yield header[1:], seq
+
+
+def _fasta_records(buf, view, pos, end):
+    while pos < end:
+        header, pos = _line(buf, view, pos, end)
+        if len(header) == 0 or header[0] != FASTA_HEADER:
+            continue  # Blank or comment lines before the first header
+        parts = []
+        while pos < end and view[pos] != FASTA_HEADER:
+            line, pos = _line(buf, view, pos, end)
+            if len(line) and line[0] != FASTA_COMMENT:
+                parts.append(line)
+        if len(parts) == 1:
+            yield header[1:], parts[0]
+        else:
+            yield header[1:], b"".join(parts)
@@ -0,0 +1,117 @@
+import aiohttp
+
+
+class SharedHttpClient:
+    """
+    One pooled aiohttp session for the whole app.
+    Created in the FastAPI lifespan and shared by every WebSocket session and
+    the verifier, so DNS lookups and TCP/TLS handshakes to the analysis
+    service are reused and total concurrency toward it is capped.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=60,
+                 connect_timeout=10, read_timeout=300, dns_ttl=300):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=connect_timeout, sock_read=read_timeout)
+        self.dns_ttl = dns_ttl
+        self._session = None
+        self._counters = {
+            "requests_total": 0,
+            "requests_failed": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "queued_total": 0,
+            "queued_now": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            raise RuntimeError("HTTP client used before application startup")
+        return self._session
+
+    def stats(self):
+        """Pool configuration and live counters, for sizing under load."""
+        stats = {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            **self._counters,
+        }
+        if self._session is not None:
+            connector = self._session.connector
+            # aiohttp keeps no public accessor for these, but both are stable
+            stats["connections_active"] = len(getattr(connector, "_acquired", ()))
+            stats["connections_idle"] = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        return stats
+
+    def _trace_config(self):
+        counters = self._counters
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            counters["requests_total"] += 1
+            counters["in_flight"] += 1
+            counters["max_in_flight"] = max(counters["max_in_flight"], counters["in_flight"])
+
+        async def on_request_end(session, ctx, params):
+            counters["in_flight"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            counters["in_flight"] -= 1
+            counters["requests_failed"] += 1
+
+        async def on_queued_start(session, ctx, params):
+            counters["queued_total"] += 1
+            counters["queued_now"] += 1
+
+        async def on_queued_end(session, ctx, params):
+            counters["queued_now"] -= 1
+
+        async def on_connection_create_end(session, ctx, params):
+            counters["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            counters["connections_reused"] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            counters["dns_cache_hits"] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            counters["dns_cache_misses"] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_request_end.append(on_request_end)
+        trace.on_request_exception.append(on_request_exception)
+        trace.on_connection_queued_start.append(on_queued_start)
+        trace.on_connection_queued_end.append(on_queued_end)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace
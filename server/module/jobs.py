@@ -0,0 +1,457 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+
+from module.metrics import Metrics
+
+# Job lifecycle; events of a finished job are only ever replayed
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETE = "complete"
+ERROR = "error"
+FINISHED = (COMPLETE, ERROR)
+
+# Event types that end a subscription
+TERMINAL_EVENTS = ("complete", "error")
+
+
+class JobQueueFull(Exception):
+    """Raised by JobManager.submit when the queue is at capacity."""
+
+
+class JobStore:
+    """
+    SQLite persistence of jobs and their event logs, shared by every
+    server process on one host that opens the same file (WAL mode needs
+    shared memory, so the file must not live on a network filesystem).
+    A job row holds its status, current stage, final result and the worker
+    that owns it; events are the exact messages streamed to clients,
+    numbered per job so subscribers can replay and resume from any point.
+    A re-queued job drops the events of the interrupted run but keeps
+    numbering after them (`seq_base`), so cursors never go backwards.
+    Multi-statement updates run in IMMEDIATE transactions, so concurrent
+    workers never claim or create the same job twice.
+    """
+
+    COLUMNS = ("id", "file_id", "backend", "status", "stage", "error", "result", "created", "updated",
+               "owner", "heartbeat", "seq_base")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, file_id TEXT NOT NULL, backend TEXT NOT NULL, "
+            "status TEXT NOT NULL, stage TEXT, error TEXT, result TEXT, "
+            "created REAL NOT NULL, updated REAL NOT NULL, owner TEXT, heartbeat REAL, seq_base INTEGER)"
+        )
+        # Stores created before jobs had owners and sequence bases
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("heartbeat", "REAL"), ("seq_base", "INTEGER")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_file ON jobs(file_id, backend)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, "
+            "PRIMARY KEY (job_id, seq))"
+        )
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def submit(self, file_id, backend, queue_size):
+        """
+        Latest queued, running or completed job for (file_id, backend), or
+        a new queued one. Raises JobQueueFull if `queue_size` jobs wait.
+        """
+        with self._lock, self._transaction():
+            job = self._job(self._db.execute(
+                f"SELECT {self._select} FROM jobs WHERE file_id = ? AND backend = ? AND status != ? "
+                "ORDER BY created DESC LIMIT 1",
+                (file_id, backend, ERROR),
+            ).fetchone())
+            if job is not None:
+                return job
+            queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if queued >= queue_size:
+                raise JobQueueFull(f"Analysis queue is full ({queue_size} jobs waiting)")
+
+            now = time.time()
+            job = dict.fromkeys(self.COLUMNS)
+            job.update(id=str(uuid.uuid4()), file_id=file_id, backend=backend, status=QUEUED, created=now, updated=now)
+            self._db.execute(
+                f"INSERT INTO jobs ({self._select}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                tuple(job.values()),
+            )
+            return job
+
+    def claim(self, owner):
+        """Marks the oldest queued job as running on `owner` and returns it."""
+        with self._lock, self._transaction():
+            row = self._db.execute(
+                f"SELECT {self._select} FROM jobs WHERE status = ? ORDER BY created LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            job = self._job(row)
+            now = time.time()
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, updated = ? WHERE id = ?",
+                (RUNNING, owner, now, now, job["id"]),
+            )
+            job.update(status=RUNNING, owner=owner, heartbeat=now, updated=now)
+            return job
+
+    def heartbeat(self, owner, job_ids):
+        """Renews the lease of `owner` on its running jobs."""
+        if not job_ids:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ?",
+                [(time.time(), job_id, owner) for job_id in job_ids],
+            )
+            self._db.commit()
+
+    def requeue_stale(self, lease):
+        """
+        Puts running jobs whose owner missed its heartbeat for `lease`
+        seconds (crashed worker) back in the queue.
+        """
+        return self._requeue("heartbeat < ?", time.time() - lease)
+
+    def release(self, owner):
+        """Puts the running jobs of a worker that shuts down back in the queue."""
+        return self._requeue("owner = ?", owner)
+
+    def update(self, job_id, **fields):
+        """Sets columns of a job; `result` is stored as JSON."""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(f"SELECT {self._select} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row)
+
+    def latest(self, file_id, backend):
+        """Most recent job for an upload on a backend, or None."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {self._select} FROM jobs WHERE file_id = ? AND backend = ? ORDER BY created DESC LIMIT 1",
+                (file_id, backend),
+            ).fetchone()
+        return self._job(row)
+
+    def count(self, status):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def append_event(self, job_id, seq, event):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO job_events (job_id, seq, event) VALUES (?, ?, ?)",
+                (job_id, seq, json.dumps(event)),
+            )
+            self._db.commit()
+
+    def events(self, job_id, after=-1):
+        """(seq, event) pairs of a job with seq > `after`, in order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after),
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def prune(self, older_than):
+        """Deletes finished jobs last updated before `older_than` (epoch seconds)."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?) AND updated < ?)",
+                (*FINISHED, older_than),
+            )
+            deleted = self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?",
+                (*FINISHED, older_than),
+            ).rowcount
+            self._db.commit()
+        return deleted
+
+    def _requeue(self, condition, value):
+        with self._lock, self._transaction():
+            job_ids = [row[0] for row in self._db.execute(
+                f"SELECT id FROM jobs WHERE status = ? AND {condition}", (RUNNING, value)
+            )]
+            for job_id in job_ids:
+                # The run starts over, so do its events; numbering continues
+                # after them, so subscribers' cursors stay valid
+                last = self._db.execute("SELECT MAX(seq) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()[0]
+                self._db.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, stage = NULL, error = NULL, result = NULL, "
+                    "owner = NULL, heartbeat = NULL, updated = ?, "
+                    "seq_base = COALESCE(?, seq_base) WHERE id = ?",
+                    (QUEUED, time.time(), None if last is None else last + 1, job_id),
+                )
+        return job_ids
+
+    @property
+    def _select(self):
+        return ", ".join(self.COLUMNS)
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock up front, serialising workers
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.rollback()
+            raise
+        else:
+            self._db.commit()
+
+    @classmethod
+    def _job(cls, row):
+        if row is None:
+            return None
+        job = dict(zip(cls.COLUMNS, row))
+        if job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+
+class JobContext:
+    """
+    Handle given to the job runner to report progress.
+    `trace` collects the timing spans of this run (see Metrics.trace).
+    """
+
+    def __init__(self, manager, job, trace=None):
+        self.manager = manager
+        self.job = job
+        self.trace = trace
+        self.job_id = job["id"]
+        self.file_id = job["file_id"]
+        self.backend = job["backend"]
+        self.finished = False
+        self.error = None
+
+    async def emit(self, event):
+        """Persists `event` and pushes it to every live subscriber."""
+        if event.get("type") in TERMINAL_EVENTS:
+            self.finished = True
+            if event["type"] == "error":
+                self.error = event.get("message", "Analysis failed")
+        self.manager.metrics.inc("job_events", type=event.get("type"))
+        await self.manager._publish(self.job_id, event)
+
+    async def stage(self, stage):
+        await asyncio.to_thread(self.manager.store.update, self.job_id, stage=stage)
+
+    async def set_result(self, result):
+        await asyncio.to_thread(self.manager.store.update, self.job_id, result=result)
+
+
+class JobManager:
+    """
+    Runs analyses as background jobs, independent of any WebSocket.
+    Every server process on the host runs a JobManager on the same
+    JobStore: jobs are claimed from the shared queue, so whichever worker
+    has a free slot runs the next one, and any worker can stream any
+    job's events. A store error (e.g. a locked database) is logged and the
+    worker backs off and carries on; a job it was running is picked up
+    again once its lease expires.
+    At most `concurrency` jobs run per process and up to `queue_size` wait.
+    Uploads have one job per backend: submitting again returns the queued,
+    running or completed job, so reconnecting clients only re-subscribe.
+    Running jobs hold a lease renewed every `lease / 3` seconds; jobs of a
+    worker that died are re-queued once their lease expires.
+    `runner(ctx)` does the work and reports through the JobContext; its
+    events end with a "complete" or "error" message (added here if the
+    runner raises or returns without one). Events and job durations are
+    counted in `metrics`.
+    """
+
+    def __init__(self, store, runner, concurrency=2, queue_size=64, lease=30.0, poll_interval=1.0, metrics=None):
+        self.store = store
+        self.runner = runner
+        self.metrics = metrics or Metrics()
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks = []
+        self._wake = asyncio.Event()
+        self._running = set()
+        self._next_seq = {}
+        self._subscribers = {}
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._keep_alive()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Unfinished jobs go back to the queue for the remaining workers
+        await asyncio.to_thread(self.store.release, self.worker_id)
+
+    async def submit(self, file_id, backend):
+        """Returns the job for (file_id, backend), creating one if needed."""
+        job = await asyncio.to_thread(self.store.submit, file_id, backend, self.queue_size)
+        if job["status"] == QUEUED:
+            self._wake.set()
+        return job
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    async def subscribe(self, job_id, after=-1):
+        """
+        Yields the events of a job with seq > `after`: everything persisted
+        so far, then live events until the job finishes. Each event carries
+        its `seq`, the cursor to resume from. Events of jobs running in this
+        process are pushed; those of other workers are polled from the store.
+        """
+        live = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(live)
+        try:
+            # Registered before the replay, so nothing falls in between
+            last = after
+            pending = await asyncio.to_thread(self.store.events, job_id, after)
+            while True:
+                for seq, event in pending:
+                    if seq <= last:
+                        continue
+                    last = seq
+                    yield {**event, "seq": seq}
+                    if event.get("type") in TERMINAL_EVENTS:
+                        return
+
+                try:
+                    pending = [await asyncio.wait_for(live.get(), self.poll_interval)]
+                except asyncio.TimeoutError:
+                    pending = await asyncio.to_thread(self.store.events, job_id, last)
+                    if not pending:
+                        job = await asyncio.to_thread(self.store.get, job_id)
+                        if job is None or job["status"] in FINISHED:
+                            return
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(live)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    def stats(self):
+        return {
+            "worker_id": self.worker_id,
+            "queued": self.store.count(QUEUED),
+            "running": self.store.count(RUNNING),
+            "running_here": len(self._running),
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+        }
+
+    async def _publish(self, job_id, event):
+        seq = self._next_seq[job_id]
+        self._next_seq[job_id] = seq + 1
+        await asyncio.to_thread(self.store.append_event, job_id, seq, event)
+        for live in self._subscribers.get(job_id, ()):
+            live.put_nowait((seq, event))
+
+    async def _keep_alive(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.store.heartbeat, self.worker_id, list(self._running))
+                if await asyncio.to_thread(self.store.requeue_stale, self.lease):
+                    self._wake.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+            await asyncio.sleep(self.lease / 3)
+
+    async def _worker(self):
+        failures = 0
+        while True:
+            try:
+                await self._run_next()
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                traceback.print_exc()
+                failures += 1
+                await asyncio.sleep(min(self.poll_interval * 2 ** failures, 30.0))
+
+    async def _run_next(self):
+        """Claims and runs one job, or waits for one to be queued."""
+        job = await asyncio.to_thread(self.store.claim, self.worker_id)
+        if job is None:
+            # Woken by a local submit, or poll for jobs queued elsewhere
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        job_id = job["id"]
+        self._running.add(job_id)
+        self._next_seq[job_id] = job["seq_base"] or 0
+        self.metrics.observe("job_queue_wait_seconds", max(0.0, time.time() - job["created"]), backend=job["backend"])
+        try:
+            # Spans recorded anywhere below (shard tasks included) land in ctx.trace
+            with self.metrics.trace("job", job_id=job_id, backend=job["backend"]) as trace:
+                ctx = JobContext(self, job, trace)
+                with self.metrics.span("job_run", backend=job["backend"]):
+                    try:
+                        if job["seq_base"]:
+                            await ctx.emit({"type": "log", "message": "Analysis restarted after a worker failure"})
+                        await self.runner(ctx)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        traceback.print_exc()
+                        if not ctx.finished:
+                            await ctx.emit({"type": "error", "message": str(e)})
+                    if not ctx.finished:
+                        await ctx.emit({"type": "complete", "message": "Analysis Finished."})
+            status = ERROR if ctx.error is not None else COMPLETE
+            self.metrics.inc("jobs_finished", backend=job["backend"], status=status)
+            # One structured line per analysis
+            print(json.dumps({"event": "job_trace", "status": status, **trace.summary()}))
+            await asyncio.to_thread(self.store.update, job_id, status=status, error=ctx.error)
+        finally:
+            self._running.discard(job_id)
+            self._next_seq.pop(job_id, None)
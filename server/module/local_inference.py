@@ -0,0 +1,118 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Per-process engine, loaded once by the pool initializer
+_ENGINE = None
+
+
+def _core_groups(workers):
+    """Splits the cores this process may run on into `workers` disjoint groups."""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    workers = max(1, min(workers, len(cores)))
+    return [cores[i::workers] for i in range(workers)]
+
+
+def _init_worker(model_name, core_queue, seed):
+    global _ENGINE
+    cores = core_queue.get()
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    # Imported here so the parent process never loads torch/transformers
+    import torch
+    from module.model_handler import DNABertEngine
+    from utils.utils import set_global_seed
+
+    set_global_seed(seed)
+
+    # One intra-op thread per pinned core, no oversubscription across workers
+    torch.set_num_threads(len(cores))
+    _ENGINE = DNABertEngine(model_name)
+    print(f"Embedding worker {os.getpid()} ready on cores {cores}")
+
+
+def _embed(sequences):
+    return _ENGINE.process_sequences(sequences)
+
+
+def _ping():
+    # Only answered once the initializer (model load) has finished
+    time.sleep(0.05)
+    return os.getpid()
+
+
+class EmbeddingPool:
+    """
+    Pool of worker processes running DNABertEngine.
+    Each worker loads the model once and is pinned to its own subset of
+    cores, so embedding throughput scales across the whole machine.
+    """
+
+    def __init__(self, workers=None, model_name="zhihan1996/DNABERT-S", chunk_size=512, seed=42):
+        groups = _core_groups(workers or os.cpu_count() or 1)
+        self.workers = len(groups)
+        self.chunk_size = chunk_size
+
+        # spawn: CUDA/torch state must not be inherited through fork
+        context = multiprocessing.get_context("spawn")
+        self._core_queue = context.Queue()
+        for group in groups:
+            self._core_queue.put(group)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(model_name, self._core_queue, seed),
+        )
+
+    async def warm_up(self, attempts=20):
+        """
+        Starts every worker so models are loaded before the first request.
+        Returns once each worker has answered a ping (or after `attempts`
+        rounds, if pings keep landing on the same workers).
+        """
+        loop = asyncio.get_running_loop()
+        seen = set()
+        for _ in range(attempts):
+            pids = await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+            seen.update(pids)
+            if len(seen) >= self.workers:
+                break
+        return len(seen)
+
+    async def embed(self, sequences, on_progress=None):
+        """
+        Embeds `sequences` (str) across the pool, returning a float32 array
+        in input order. `on_progress(done, total)` is an optional coroutine.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def run(start):
+            chunk = sequences[start:start + self.chunk_size]
+            return start, await loop.run_in_executor(self._executor, _embed, chunk)
+
+        output = None
+        done = 0
+        for future in asyncio.as_completed([run(start) for start in range(0, len(sequences), self.chunk_size)]):
+            start, embeddings = await future
+            if output is None:
+                output = np.empty((len(sequences), embeddings.shape[1]), dtype=np.float32)
+            output[start:start + len(embeddings)] = embeddings
+            done += len(embeddings)
+            if on_progress:
+                await on_progress(done, len(sequences))
+
+        if output is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return output
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,178 @@
+import bisect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Histogram bucket upper bounds
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))  # 1 KiB .. 1 GiB
+
+# Trace of the analysis running in the current task (inherited by the
+# tasks and threads it starts)
+_current_trace = ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram; percentiles are estimated from the buckets."""
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """p-th percentile, interpolated linearly inside its bucket."""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets + (self.max,), self.counts):
+            if n and seen + n >= rank:
+                upper = min(bound, self.max)
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+            lower = min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class Trace:
+    """Timing spans and counters of one analysis, in the order recorded."""
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+        self.started = time.monotonic()
+        self.spans = []
+        self.counters = {}
+
+    def add_span(self, name, start, duration, fields):
+        self.spans.append({
+            "name": name,
+            "start": round(start - self.started, 6),
+            "duration": round(duration, 6),
+            **fields,
+        })
+
+    def add(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Total seconds per span name plus the raw spans and counters."""
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration"], 6)
+        return {
+            "name": self.name,
+            **self.fields,
+            "duration": round(time.monotonic() - self.started, 6),
+            "stage_seconds": totals,
+            "counters": dict(self.counters),
+            "spans": list(self.spans),
+        }
+
+
+class Metrics:
+    """
+    Process-wide counters and latency/size histograms, one instance per app.
+    `span()` times a block into a `{name}_seconds` histogram and, inside
+    `trace()`, into that analysis' Trace as well, so the same call sites
+    give both per-analysis breakdowns and aggregate hot spots.
+    Labels are keyword arguments; each label set is its own series.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self._counters[key] = self._counters.get(key, 0) + value
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, value)
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Times the block. Yields a dict whose entries (e.g. byte counts
+        known only at the end) are stored on the trace span.
+        """
+        fields = {}
+        start = time.monotonic()
+        try:
+            yield fields
+        finally:
+            duration = time.monotonic() - start
+            self.observe(f"{name}_seconds", duration, **labels)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add_span(name, start, duration, {**labels, **fields})
+
+    @contextmanager
+    def trace(self, name, **fields):
+        """Collects the spans of everything run inside the block (tasks included)."""
+        trace = Trace(name, **fields)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+
+    def snapshot(self):
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ],
+            "histograms": [
+                {"name": name, "labels": dict(labels), **histogram.snapshot()}
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ],
+        }
+
+    def prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for (name, labels), value in sorted(self._counters.items()):
+            lines.append(f"{name}_total{_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
@@ -16,22 +16,53 @@ class DNABertEngine:
         self.model.eval()
         print("AI Engine Ready.")
 
-    def process_sequences(self, sequences: list, batch_size=16):
-        embeddings = []
-        
-        # Process batches
-        for i in range(0, len(sequences), batch_size):
-            batch = sequences[i : i + batch_size]
-            inputs = self.tokenizer(batch, return_tensors="pt", padding=True, truncation=True, max_length=100)
+    def process_sequences(self, sequences: list, batch_size=None, max_tokens=8192, max_length=100):
+        """
+        Mean-pooled embeddings, one row per sequence, in input order.
+        Sequences are tokenized once, sorted by token length and packed into
+        batches of at most `max_tokens` padded tokens (optionally capped at
+        `batch_size` sequences), so short reads are not padded to long ones.
+        """
+        hidden_size = self.model.config.hidden_size
+        embeddings = np.empty((len(sequences), hidden_size), dtype=np.float32)
+        if not sequences:
+            return embeddings
+
+        encoded = self.tokenizer(list(sequences), truncation=True, max_length=max_length)
+        lengths = np.fromiter((len(ids) for ids in encoded["input_ids"]), dtype=np.int64, count=len(sequences))
+        order = np.argsort(lengths, kind="stable")
+
+        # Process batches, shortest sequences first
+        for batch in self._token_batches(order, lengths, max_tokens, batch_size):
+            features = {key: [encoded[key][i] for i in batch] for key in encoded.keys()}
+            inputs = self.tokenizer.pad(features, padding=True, return_tensors="pt")
             inputs = {k: v.to(self.device) for k, v in inputs.items()}
-            
-            with torch.no_grad():
+
+            with torch.inference_mode():
                 outputs = self.model(**inputs)
                 hidden_states = outputs[0]
-                attention_mask = inputs['attention_mask'].unsqueeze(-1)
+                attention_mask = inputs['attention_mask'].unsqueeze(-1).to(hidden_states.dtype)
                 sum_embeddings = torch.sum(hidden_states * attention_mask, dim=1)
                 sum_mask = torch.clamp(attention_mask.sum(dim=1), min=1e-9)
                 mean_embeddings = sum_embeddings / sum_mask
-                embeddings.append(mean_embeddings.cpu().numpy())
+                # Scatter straight back to the input positions
+                embeddings[batch] = mean_embeddings.float().cpu().numpy()
+
+        return embeddings
 
-        return np.vstack(embeddings)
\ No newline at end of file
+    @staticmethod
+    def _token_batches(order, lengths, max_tokens, batch_size=None):
+        """
+        Greedily packs length-sorted indices so that
+        len(batch) * longest_in_batch stays within `max_tokens`.
+        """
+        batch = []
+        for i in order:
+            padded = (len(batch) + 1) * int(lengths[i])
+            full = batch_size is not None and len(batch) >= batch_size
+            if batch and (padded > max_tokens or full):
+                yield np.asarray(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            yield np.asarray(batch)
@@ -0,0 +1,99 @@
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13 installs as "multipart"
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Upper bound of a non-file form field (e.g. the `type` hint)
+MAX_FIELD_SIZE = 64 * 1024
+
+
+class StreamingForm:
+    """
+    Incremental multipart/form-data parser for a request body that is
+    streamed in. Bytes of the `file_field` part go to `on_file(data)` as
+    soon as they are parsed, so the upload is never spooled anywhere else
+    first; the other (small) fields are collected in `fields`.
+    Raises ValueError on a malformed or truncated body (python-multipart's
+    parse errors are ValueErrors too).
+    """
+
+    def __init__(self, content_type, on_file, file_field="file"):
+        media_type, params = parse_options_header(content_type or "")
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected a multipart/form-data body")
+        self.on_file = on_file
+        self.file_field = file_field
+        self.fields = {}
+        self.filename = None
+        self.file_seen = False
+
+        self._headers = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._name = None
+        self._value = None
+        self._complete = False
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_end": self._on_end,
+        })
+
+    def feed(self, data):
+        self._parser.write(data)
+
+    def finish(self):
+        """Raises ValueError if the body ended early or had no `file_field` part."""
+        self._parser.finalize()
+        if not self._complete:
+            raise ValueError("Truncated multipart body")
+        if not self.file_seen:
+            raise ValueError(f"Missing form field '{self.file_field}'")
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._name = None
+        self._value = None
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        if self._name == self.file_field:
+            if self.file_seen:
+                raise ValueError(f"More than one '{self.file_field}' field")
+            self.file_seen = True
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace") or None
+        else:
+            self._value = bytearray()
+
+    def _on_part_data(self, data, start, end):
+        if self._name == self.file_field:
+            self.on_file(data[start:end])
+            return
+        self._value += data[start:end]
+        if len(self._value) > MAX_FIELD_SIZE:
+            raise ValueError(f"Form field '{self._name}' is too large")
+
+    def _on_part_end(self):
+        if self._value is not None:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+
+    def _on_end(self):
+        self._complete = True
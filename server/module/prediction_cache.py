@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def sequence_key(seq):
+    """
+    Content address of a read: hash of the upper-cased DNA sequence.
+    Accepts bytes, memoryview or str.
+    """
+    if isinstance(seq, str):
+        seq = seq.encode('ascii')
+    normalized = bytes(seq).upper().replace(b"U", b"T")
+    return hashlib.blake2b(normalized, digest_size=16).digest()
+
+
+class PredictionCache:
+    """
+    Two-tier cache of per-sequence predictions keyed by `sequence_key`.
+    A bounded in-memory LRU sits in front of a SQLite table; the table is
+    trimmed back to `max_disk_items` (least recently used first) on write.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    BATCH = 500
+
+    def __init__(self, path, memory_items=100000, max_disk_items=5000000):
+        self.path = path
+        self.memory_items = memory_items
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key BLOB PRIMARY KEY, value TEXT NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions(last_used)")
+        self._disk_items = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get_many(self, keys):
+        """Returns {key: prediction} for every key found in either tier."""
+        keys = list(keys)
+        found = {}
+        missing = []
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                value = self._memory.get(key)
+                if value is None:
+                    missing.append(key)
+                else:
+                    self._memory.move_to_end(key)
+                    found[key] = value
+
+            disk_found = {}
+            if missing:
+                now = int(time.time())
+                for i in range(0, len(missing), self.BATCH):
+                    batch = missing[i:i + self.BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, value FROM predictions WHERE key IN ({placeholders})", batch
+                    ).fetchall()
+                    for key, value in rows:
+                        disk_found[bytes(key)] = json.loads(value)
+                if disk_found:
+                    self._db.executemany(
+                        "UPDATE predictions SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in disk_found],
+                    )
+                    self._db.commit()
+                    for key, value in disk_found.items():
+                        self._remember(key, value)
+
+            # Counters are per looked-up read, duplicates included
+            for key in keys:
+                if key in disk_found:
+                    self._counters["disk_hits"] += 1
+                elif key in found:
+                    self._counters["memory_hits"] += 1
+                else:
+                    self._counters["misses"] += 1
+            found.update(disk_found)
+        return found
+
+    def put_many(self, items):
+        """Stores (key, prediction) pairs in both tiers."""
+        items = list(dict(items).items())
+        if not items:
+            return
+        now = int(time.time())
+        with self._lock:
+            for key, value in items:
+                self._remember(key, value)
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR REPLACE INTO predictions (key, value, last_used) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items],
+            )
+            # Re-inserted keys are counted again; rare, since only misses are stored
+            self._disk_items += self._db.total_changes - before
+            self._db.commit()
+            if self._disk_items > self.max_disk_items:
+                self._evict()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "memory_items": len(self._memory),
+                "disk_items": self._disk_items,
+            }
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        # Trim to 90% so eviction does not run on every write near the limit
+        target = int(self.max_disk_items * 0.9)
+        self._db.execute(
+            "DELETE FROM predictions WHERE key IN "
+            "(SELECT key FROM predictions ORDER BY last_used ASC LIMIT ?)",
+            (self._disk_items - target,),
+        )
+        self._db.commit()
+        remaining = self._db.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+        self._counters["evicted"] += self._disk_items - remaining
+        self._disk_items = remaining
@@ -0,0 +1,230 @@
+import asyncio
+
+import aiohttp
+import numpy as np
+
+from module.compression import gzip_bytes
+from module.dereplicate import dereplicate
+from module.service_client import CircuitOpenError, ServiceError
+from module.sketch import representatives
+
+
+class PredictionError(Exception):
+    """Raised when a shard still fails after all retries (or the circuit is open)."""
+
+
+class ShardedPredictor:
+    """
+    Fans pre-built FASTA shards out to /predict/fasta under a bounded
+    semaphore (CachedPredictor builds them from the uncached uniques).
+    Each shard is one ServiceClient call (retried, hedged and budgeted on
+    its own), and every finished shard is reported through `on_shard` so
+    callers can stream partial results.
+    With `compress_level` set, shards travel gzip-compressed (`.gz`
+    filename, application/gzip); DNA text shrinks about 4x, but the
+    service has to accept gzip uploads, so it is opt-in.
+    """
+
+    def __init__(self, service, shard_size=2048, concurrency=4, compress_level=None):
+        self.service = service
+        self.shard_size = shard_size
+        self.concurrency = concurrency
+        self.compress_level = compress_level
+
+    async def predict_shards(self, shards, file_id, file_format, on_shard=None, on_log=None):
+        """
+        Posts pre-built FASTA/FASTQ payloads and returns their results in order.
+        `on_shard(index, payload)` and `on_log(message)` are optional coroutines.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        payloads = [None] * len(shards)
+        done = 0
+        if on_log:
+            await on_log(f"Sending {len(shards)} shard(s) to analysis service...")
+
+        async def run(index, data):
+            nonlocal done
+            async with semaphore:
+                payloads[index] = await self._post_shard(
+                    data,
+                    f"{file_id}_{index}.{file_format}",
+                    index,
+                    len(shards),
+                    on_log,
+                )
+            done += 1
+            if on_log:
+                await on_log(f"Analysed shard {done}/{len(shards)}")
+            if on_shard:
+                await on_shard(index, payloads[index])
+
+        tasks = [asyncio.create_task(run(index, data)) for index, data in enumerate(shards)]
+        try:
+            await asyncio.gather(*tasks)
+        except PredictionError as e:
+            if isinstance(e.__cause__, CircuitOpenError):
+                # Turned away by the breaker: a sibling may be its half-open
+                # probe, and cancelling it would leave the circuit undecided
+                await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            # One shard giving up fails the whole prediction
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        results = []
+        for payload in payloads:
+            results.extend(payload.get("results", []))
+        return results
+
+    async def _post_shard(self, data, filename, index, total, on_log):
+        content_type = 'application/octet-stream'
+        if self.compress_level:
+            # Compressed once, reused by every retry and hedge
+            data = await asyncio.to_thread(gzip_bytes, data, self.compress_level)
+            filename = f"{filename}.gz"
+            content_type = 'application/gzip'
+
+        def make_form():
+            # A fresh form per request, hedges and retries included
+            form = aiohttp.FormData()
+            form.add_field('file', data, filename=filename, content_type=content_type)
+            return form
+
+        async def on_retry(attempt, delay, error):
+            print(f"Shard {index + 1}/{total} failed on attempt {attempt + 1}: {error}")
+            if on_log:
+                await on_log(f"Shard {index + 1}/{total} failed, retrying in {delay:.1f}s...")
+
+        try:
+            return await self.service.post_form("/predict/fasta", make_form, on_retry=on_retry, payload_bytes=len(data))
+        except ServiceError as e:
+            raise PredictionError(f"Shard {index + 1}/{total} failed: {e}") from e
+
+
+class CachedPredictor:
+    """
+    Dereplicates an upload, serves unique sequences from a PredictionCache
+    and sends only the uncached uniques upstream (as FASTA shards).
+    Partial results carry per-item `weights` (read multiplicities) so the
+    abundance stats match a per-read run exactly.
+    With a `sketcher` (SketchClusterer), at least `sketch_min_sequences`
+    uncached uniques and an estimated redundancy of at least
+    `sketch_min_redundancy`, uniques are first grouped by k-mer
+    similarity, around the cached ones first: only new group
+    representatives go upstream, every
+    representative is weighted with its whole group, and members take
+    their representative's prediction. Those approximate labels are never
+    written to the cache.
+    """
+
+    def __init__(self, predictor, cache, reverse_complement=False, sketcher=None, sketch_min_sequences=0,
+                 sketch_min_redundancy=0.0):
+        self.predictor = predictor
+        self.cache = cache
+        self.reverse_complement = reverse_complement
+        self.sketcher = sketcher
+        self.sketch_min_sequences = sketch_min_sequences
+        self.sketch_min_redundancy = sketch_min_redundancy
+
+    async def predict(self, reader, file_id, on_shard=None, on_log=None):
+        """Returns a DereplicatedReads with one prediction per unique sequence."""
+        reads = await asyncio.to_thread(dereplicate, reader.records(), self.reverse_complement)
+        if on_log:
+            await on_log(
+                f"Dereplicated {len(reads)} reads into {reads.n_unique} unique sequences "
+                f"({reads.duplication_factor:.1f}x duplication)"
+            )
+
+        cached = await asyncio.to_thread(self.cache.get_many, reads.keys)
+        hits = []
+        misses = []
+        for unique, key in enumerate(reads.keys):
+            value = cached.get(key)
+            if value is None:
+                misses.append(unique)
+            else:
+                reads.predictions[unique] = value
+                hits.append(unique)
+
+        if on_log:
+            hit_rate = (len(hits) / reads.n_unique * 100) if reads.n_unique else 0
+            await on_log(f"Prediction cache: {len(hits)} hits, {len(misses)} misses ({hit_rate:.1f}% hit rate)")
+        weights = reads.counts
+        upstream = misses
+        groups = None
+        if self.sketcher is not None and len(misses) >= self.sketch_min_sequences:
+            # Cached uniques are representatives first, so misses close to
+            # them need no request at all
+            candidates = np.asarray(hits + misses, dtype=np.int64)
+            sequences = [reads.sequences[u] for u in candidates.tolist()]
+            redundancy = await asyncio.to_thread(self.sketcher.estimate_redundancy, sequences)
+            if redundancy < self.sketch_min_redundancy:
+                if on_log:
+                    await on_log(
+                        f"Sketch pre-clustering skipped: at most {redundancy * 100:.0f}% of the sequences "
+                        f"are near-duplicates"
+                    )
+            else:
+                assignment = await asyncio.to_thread(
+                    self.sketcher.group, sequences, reads.counts[candidates], len(hits)
+                )
+                groups = candidates[assignment[len(hits):]]
+                rows = representatives(assignment)
+                upstream = candidates[rows[rows >= len(hits)]].tolist()
+                # Each representative stands for the reads of its whole group
+                weights = reads.counts.copy()
+                weights[misses] = 0
+                np.add.at(weights, groups, reads.counts[misses])
+                if on_log:
+                    matched = int(np.isin(groups, hits).sum()) if hits else 0
+                    await on_log(
+                        f"Sketch pre-clustering: {len(misses)} uncached sequences, {matched} matched cached ones, "
+                        f"{len(upstream)} representatives to predict"
+                    )
+
+        if hits and on_shard:
+            await on_shard(self._weighted(weights, hits, [reads.predictions[u] for u in hits]))
+        if not upstream:
+            if groups is not None:
+                self._propagate(reads, misses, groups)
+            return reads
+
+        shard_size = self.predictor.shard_size
+        shard_ids = [upstream[i:i + shard_size] for i in range(0, len(upstream), shard_size)]
+        shards = [
+            b"".join(b">%d\n%s\n" % (unique, reads.sequences[unique]) for unique in ids)
+            for ids in shard_ids
+        ]
+
+        async def on_upstream(index, payload):
+            # Cached as each shard lands: if a later shard fails for good,
+            # a rerun only resends the shards that never finished
+            ids = shard_ids[index]
+            results = payload.get("results", [])
+            if len(results) != len(ids):
+                raise PredictionError(f"Analysis service returned {len(results)} results for {len(ids)} sequences")
+            new_entries = []
+            for unique, item in zip(ids, results):
+                value = {k: v for k, v in item.items() if k != "id"}
+                reads.predictions[unique] = value
+                new_entries.append((reads.keys[unique], value))
+            await asyncio.to_thread(self.cache.put_many, new_entries)
+            if on_shard:
+                await on_shard(self._weighted(weights, ids, results))
+
+        await self.predictor.predict_shards(shards, file_id, "fasta", on_shard=on_upstream, on_log=on_log)
+        if groups is not None:
+            self._propagate(reads, misses, groups)
+        return reads
+
+    @staticmethod
+    def _propagate(reads, members, representatives):
+        for unique, representative in zip(members, representatives.tolist()):
+            reads.predictions[unique] = reads.predictions[representative]
+
+    @staticmethod
+    def _weighted(weights, uniques, items):
+        weights = weights[uniques].tolist()
+        return {"count": sum(weights), "results": items, "weights": weights}
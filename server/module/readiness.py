@@ -0,0 +1,59 @@
+import asyncio
+import time
+import traceback
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """
+    Background warm-up tasks (model loading, JIT compilation) started at
+    startup without blocking it. The server answers /health immediately;
+    /health/ready reports ready once every task has finished.
+    A failed task is reported, not retried: whatever it warms loads on
+    first use instead.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._components = {}
+        self._tasks = []
+
+    def add(self, name, coro):
+        """Runs the coroutine `coro` in the background as component `name`."""
+        component = self._components[name] = {"status": PENDING, "seconds": None, "error": None}
+
+        async def run():
+            started = time.monotonic()
+            try:
+                await coro
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                traceback.print_exc()
+                component["status"] = FAILED
+                component["error"] = str(e) or type(e).__name__
+            else:
+                component["status"] = READY
+            component["seconds"] = round(time.monotonic() - started, 3)
+            print(f"Warm-up of {name} {component['status']} after {component['seconds']}s")
+
+        self._tasks.append(asyncio.create_task(run()))
+
+    @property
+    def ready(self):
+        return all(component["status"] != PENDING for component in self._components.values())
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "uptime": round(time.monotonic() - self.started, 3),
+            "components": {name: dict(component) for name, component in self._components.items()},
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
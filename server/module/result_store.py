@@ -0,0 +1,268 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+# Columns filtered, sorted and grouped as dictionary codes
+CATEGORICAL = ("genus", "class")
+GROUP_COLUMNS = CATEGORICAL + ("cluster",)
+SORT_COLUMNS = ("row", "genus", "class", "cluster", "genus_prob")
+
+# Rows evaluated per step when filtering the memory-mapped columns
+FILTER_CHUNK = 1 << 20
+
+
+class ResultStore:
+    """
+    Per-read predictions of finished jobs, one columnar table per job:
+    `{directory}/{job_id}/` holds one .npy file per column (memory-mapped
+    on read), read names as one UTF-8 blob plus int64 offsets, and
+    `meta.json` with the row count and the dictionaries of the
+    dictionary-encoded genus/class columns. Tables are written to a
+    temporary directory and renamed into place, so readers never see a
+    partial one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, job_id, reads):
+        """Expands a DereplicatedReads (one prediction per unique) to a per-read table."""
+        n_unique = reads.n_unique
+        dictionaries = {column: {} for column in CATEGORICAL}
+        unique_codes = {column: np.zeros(n_unique, dtype=np.int32) for column in CATEGORICAL}
+        probability_names = []
+        unique_probs = {}
+        unique_cluster = np.full(n_unique, -1, dtype=np.int32)
+
+        for unique, item in enumerate(reads.predictions):
+            item = item or {}
+            prediction = item.get("prediction") or {}
+            for column in CATEGORICAL:
+                value = prediction.get(column) or "unknown"
+                unique_codes[column][unique] = dictionaries[column].setdefault(value, len(dictionaries[column]))
+            for key, value in prediction.items():
+                if not key.endswith("_prob"):
+                    continue
+                if key not in unique_probs:
+                    probability_names.append(key)
+                    unique_probs[key] = np.zeros(n_unique, dtype=np.float32)
+                unique_probs[key][unique] = value or 0
+            if item.get("cluster") is not None:
+                unique_cluster[unique] = item["cluster"]
+
+        index = reads.read_to_unique
+
+        path = os.path.join(self.directory, job_id)
+        tmp = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = {
+            "unique": index.astype(np.int32),
+            "cluster": unique_cluster[index],
+            "name_offsets": reads.name_offsets,
+            **{column: unique_codes[column][index] for column in CATEGORICAL},
+            **{key: unique_probs[key][index] for key in probability_names},
+        }
+        for column, values in columns.items():
+            np.save(os.path.join(tmp, f"{column}.npy"), values)
+        with open(os.path.join(tmp, "names.bin"), "wb") as f:
+            f.write(reads.name_data)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({
+                "job_id": job_id,
+                "rows": len(reads),
+                "unique": n_unique,
+                "probabilities": probability_names,
+                "dictionaries": {column: list(values) for column, values in dictionaries.items()},
+                "created": time.time(),
+            }, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+        return len(reads)
+
+    def open(self, job_id):
+        """ResultTable of a job, or None if it has none."""
+        path = os.path.join(self.directory, job_id)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+        return ResultTable(path)
+
+    def delete(self, job_id):
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    def prune(self, older_than):
+        """Deletes tables written before `older_than` (epoch seconds)."""
+        deleted = 0
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            try:
+                if os.path.getmtime(path) < older_than:
+                    shutil.rmtree(path, ignore_errors=True)
+                    deleted += 1
+            except OSError:
+                pass  # Removed concurrently
+        return deleted
+
+
+class ResultTable:
+    """
+    Read side of one job's table. Columns are memory-mapped, so queries
+    only touch the pages they need; filters, sorting and group-by work on
+    integer codes and never build per-row Python objects except for the
+    returned page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self.dictionaries = self.meta["dictionaries"]
+        self.probabilities = self.meta["probabilities"]
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def mask(self, genus=None, class_=None, cluster=None, min_prob=None, max_prob=None):
+        """Boolean row mask of the filters (None = no filter); unknown labels match nothing."""
+        wanted = {}
+        for column, value in (("genus", genus), ("class", class_)):
+            if value is not None:
+                values = [value] if isinstance(value, str) else list(value)
+                dictionary = self.dictionaries[column]
+                wanted[column] = np.array([dictionary.index(v) for v in values if v in dictionary], dtype=np.int32)
+
+        mask = np.ones(self.rows, dtype=bool)
+        for start in range(0, self.rows, FILTER_CHUNK):
+            end = min(start + FILTER_CHUNK, self.rows)
+            part = mask[start:end]
+            for column, codes in wanted.items():
+                part &= np.isin(self.column(column)[start:end], codes)
+            if cluster is not None:
+                part &= self.column("cluster")[start:end] == cluster
+            if min_prob is not None or max_prob is not None:
+                probs = self._prob()[start:end]
+                if min_prob is not None:
+                    part &= probs >= min_prob
+                if max_prob is not None:
+                    part &= probs <= max_prob
+        return mask
+
+    def query(self, mask=None, sort="row", descending=False, offset=0, limit=100):
+        """
+        (total matching rows, page of row dicts). Sorting selects the page
+        with a partition around the cut-off value, O(rows) instead of a
+        full sort; ties keep file order.
+        """
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(self.rows)
+        total = len(rows)
+        end = min(offset + limit, total)
+        if offset >= end:
+            return total, []
+
+        if sort == "row":
+            page = rows[::-1][offset:end] if descending else rows[offset:end]
+        else:
+            keys = self._sort_key(sort)[rows]
+            if descending:
+                keys = -keys
+            if end < total:
+                # Everything below the end-th smallest key, plus as many
+                # rows equal to it (in file order) as the page still needs
+                cut = np.partition(keys, end - 1)[end - 1]
+                below = np.flatnonzero(keys < cut)
+                ties = np.flatnonzero(keys == cut)[:end - len(below)]
+                chosen = np.concatenate([below, ties])
+            else:
+                chosen = np.arange(total)
+            chosen = chosen[np.lexsort((chosen, keys[chosen]))]
+            page = rows[chosen[offset:end]]
+
+        return total, [self._row(int(row)) for row in page]
+
+    def group_by(self, by, mask=None, offset=0, limit=100):
+        """
+        Groups of `by` (genus, class or cluster) with read count, share of
+        the matching reads and mean genus probability, largest first.
+        """
+        if by in CATEGORICAL:
+            labels = self.dictionaries[by]
+            codes = self.column(by)
+            size = len(labels)
+        else:
+            # Shift so unassigned (-1) becomes bin 0
+            codes = self.column("cluster").astype(np.int64) + 1
+            size = int(codes.max()) + 1 if self.rows else 0
+            labels = list(range(-1, size - 1))
+
+        counts = np.zeros(size, dtype=np.int64)
+        prob_sums = np.zeros(size, dtype=np.float64)
+        probs = self._prob()
+        for start in range(0, self.rows, FILTER_CHUNK):
+            end = min(start + FILTER_CHUNK, self.rows)
+            part = np.asarray(codes[start:end])
+            weights = np.asarray(probs[start:end], dtype=np.float64)
+            if mask is not None:
+                keep = mask[start:end]
+                part, weights = part[keep], weights[keep]
+            counts += np.bincount(part, minlength=size)
+            prob_sums += np.bincount(part, weights=weights, minlength=size)
+
+        total = int(counts.sum())
+        present = np.flatnonzero(counts)
+        order = present[np.lexsort((present, -counts[present]))]
+        groups = []
+        for code in order[offset:offset + limit].tolist():
+            groups.append({
+                by: labels[code],
+                "count": int(counts[code]),
+                "percentage": round(float(counts[code] / total * 100), 2) if total else 0.0,
+                "mean_genus_prob": round(float(prob_sums[code] / counts[code]), 4),
+            })
+        return {"total_reads": total, "total_groups": len(present), "groups": groups}
+
+    def _prob(self):
+        if "genus_prob" in self.probabilities:
+            return self.column("genus_prob")
+        return np.zeros(self.rows, dtype=np.float32)
+
+    def _sort_key(self, sort):
+        if sort in CATEGORICAL:
+            # Codes are in first-seen order; rank them alphabetically
+            labels = self.dictionaries[sort]
+            rank = np.empty(len(labels), dtype=np.int64)
+            rank[np.argsort(np.array(labels, dtype=object), kind="stable")] = np.arange(len(labels))
+            return rank[self.column(sort)]
+        if sort == "cluster":
+            return self.column("cluster").astype(np.int64)
+        return np.asarray(self._prob(), dtype=np.float64)
+
+    def _names(self):
+        if "names" not in self._columns:
+            path = os.path.join(self.path, "names.bin")
+            size = os.path.getsize(path)
+            self._columns["names"] = np.memmap(path, dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+        return self._columns["names"]
+
+    def _row(self, row):
+        offsets = self.column("name_offsets")
+        name = self._names()[offsets[row]:offsets[row + 1]].tobytes().decode("utf-8", "replace")
+        record = {
+            "row": row,
+            "read_id": name,
+            "genus": self.dictionaries["genus"][self.column("genus")[row]],
+            "class": self.dictionaries["class"][self.column("class")[row]],
+            "cluster": int(self.column("cluster")[row]),
+            "unique": int(self.column("unique")[row]),
+        }
+        for key in self.probabilities:
+            record[key] = round(float(self.column(key)[row]), 6)
+        return record
@@ -0,0 +1,209 @@
+import json
+import os
+
+import numpy as np
+
+# Keep the byte offset of every INDEX_STRIDE-th record only.
+# That is enough for record-aligned chunking and keeps the sidecar tiny
+# even for multi-million read runs.
+INDEX_STRIDE = 1024
+
+NEWLINE = 10
+CARRIAGE_RETURN = 13
+FASTA_HEADER = ord('>')
+FASTA_COMMENT = ord(';')
+FASTQ_HEADER = ord('@')
+FASTQ_SEPARATOR = ord('+')
+
+
+class SequenceScanner:
+    """
+    Single-pass byte-level scanner for FASTA/FASTQ data.
+    Chunks are fed as they arrive; the real format is sniffed from the content
+    and records/bases are counted without building any record objects.
+    """
+
+    def __init__(self, stride=INDEX_STRIDE):
+        self.stride = stride
+        self.format = None
+        self.records = 0
+        self.bases = 0
+        self.bytes = 0
+        self._offsets = []
+
+        # FASTQ lines consumed so far (drives the 4-line record phase)
+        self._line_no = 0
+
+        # State of the line that is still open at the end of the last chunk
+        self._line_start = 0
+        self._line_len = 0
+        self._line_first = -1
+        self._line_last = -1
+
+    def feed(self, chunk):
+        if not chunk:
+            return
+
+        buf = np.frombuffer(chunk, dtype=np.uint8)
+        chunk_offset = self.bytes
+        self.bytes += len(buf)
+
+        newlines = np.flatnonzero(buf == NEWLINE)
+        if len(newlines) == 0:
+            if self._line_len == 0:
+                self._line_first = int(buf[0])
+            self._line_len += len(buf)
+            self._line_last = int(buf[-1])
+            return
+
+        # Every newline closes one line; the first one continues the open line
+        starts = np.empty(len(newlines), dtype=np.int64)
+        starts[0] = 0
+        starts[1:] = newlines[:-1] + 1
+        lengths = newlines - starts
+
+        safe_starts = np.minimum(starts, len(buf) - 1)
+        firsts = np.where(lengths > 0, buf[safe_starts], -1).astype(np.int64)
+        lasts = np.where(lengths > 0, buf[newlines - 1], -1).astype(np.int64)
+
+        if self._line_len > 0:
+            firsts[0] = self._line_first
+            if lengths[0] == 0:
+                lasts[0] = self._line_last
+        lengths[0] += self._line_len
+
+        abs_starts = starts + chunk_offset
+        abs_starts[0] = self._line_start
+        lengths -= (lasts == CARRIAGE_RETURN)
+
+        self._process_lines(abs_starts, lengths, firsts)
+
+        tail = buf[newlines[-1] + 1:]
+        self._line_start = chunk_offset + int(newlines[-1]) + 1
+        self._line_len = len(tail)
+        self._line_first = int(tail[0]) if len(tail) else -1
+        self._line_last = int(tail[-1]) if len(tail) else -1
+
+    def finish(self):
+        """
+        Flushes the last (unterminated) line and returns the index summary.
+        Raises ValueError if the data is empty, unknown or truncated.
+        """
+        if self._line_len > 0:
+            length = self._line_len - (self._line_last == CARRIAGE_RETURN)
+            self._process_lines(
+                np.array([self._line_start], dtype=np.int64),
+                np.array([length], dtype=np.int64),
+                np.array([self._line_first], dtype=np.int64),
+            )
+            self._line_len = 0
+
+        if self.format is None or self.records == 0:
+            raise ValueError("No sequences found in file. Please check the file format.")
+        if self.format == "fastq" and self._line_no % 4 != 0:
+            raise ValueError("Truncated FASTQ record at end of file")
+
+        return {
+            "format": self.format,
+            "records": self.records,
+            "bases": self.bases,
+            "bytes": self.bytes,
+            "stride": self.stride,
+            "offsets": self.offsets(),
+        }
+
+    @classmethod
+    def scan_file(cls, path, chunk_size=1024 * 1024):
+        """Builds an index for a file that is already on disk."""
+        scanner = cls()
+        with open(path, 'rb') as f:
+            while chunk := f.read(chunk_size):
+                scanner.feed(chunk)
+        return scanner.finish()
+
+    def offsets(self):
+        """Byte offsets of every `stride`-th record header as an int64 array."""
+        if not self._offsets:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(self._offsets)
+
+    def _process_lines(self, starts, lengths, firsts):
+        if self.format is None:
+            non_empty = np.flatnonzero(lengths > 0)
+            if len(non_empty) == 0:
+                return
+            self.format = self._sniff(int(firsts[non_empty[0]]))
+            starts, lengths, firsts = starts[non_empty[0]:], lengths[non_empty[0]:], firsts[non_empty[0]:]
+
+        if self.format == "fastq":
+            self._process_fastq(starts, lengths, firsts)
+        else:
+            self._process_fasta(starts, lengths, firsts)
+
+    @staticmethod
+    def _sniff(first_byte):
+        if first_byte == FASTA_HEADER:
+            return "fasta"
+        if first_byte == FASTQ_HEADER:
+            return "fastq"
+        raise ValueError("Unrecognised sequence format: expected FASTA ('>') or FASTQ ('@') records")
+
+    def _process_fasta(self, starts, lengths, firsts):
+        headers = firsts == FASTA_HEADER
+        sequence_lines = ~headers & (firsts != FASTA_COMMENT)
+        self._add_records(starts[headers])
+        self.bases += int(lengths[sequence_lines].sum())
+
+    def _process_fastq(self, starts, lengths, firsts):
+        # Empty sequence/quality lines are valid (fully trimmed reads), but a
+        # blank line where a header is expected is just padding between records
+        while True:
+            phase = (self._line_no + np.arange(len(starts))) % 4
+            padding = np.flatnonzero((phase == 0) & (lengths == 0))
+            if len(padding) == 0:
+                break
+            cut = padding[0]
+            self._check_fastq(starts[:cut], lengths[:cut], firsts[:cut], phase[:cut])
+            starts, lengths, firsts = starts[cut + 1:], lengths[cut + 1:], firsts[cut + 1:]
+        self._check_fastq(starts, lengths, firsts, phase)
+
+    def _check_fastq(self, starts, lengths, firsts, phase):
+        headers = phase == 0
+        bad_header = headers & (firsts != FASTQ_HEADER)
+        bad_separator = (phase == 2) & (firsts != FASTQ_SEPARATOR)
+        bad = bad_header | bad_separator
+        if bad.any():
+            offset = int(starts[np.argmax(bad)])
+            raise ValueError(f"Malformed FASTQ record at byte {offset}")
+
+        self._add_records(starts[headers])
+        self.bases += int(lengths[phase == 1].sum())
+        self._line_no += len(starts)
+
+    def _add_records(self, header_starts):
+        count = len(header_starts)
+        if count == 0:
+            return
+        if self.stride == 1:
+            self._offsets.append(header_starts)
+        else:
+            ids = np.arange(self.records, self.records + count)
+            self._offsets.append(header_starts[ids % self.stride == 0])
+        self.records += count
+
+
+def index_path(upload_dir, file_id):
+    return os.path.join(upload_dir, f"{file_id}.idx")
+
+
+def write_index(path, summary):
+    with open(path, 'w') as f:
+        json.dump(dict(summary, offsets=np.asarray(summary["offsets"]).tolist()), f)
+
+
+def read_index(path):
+    """Returns the sidecar summary, or None if the file has no index."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
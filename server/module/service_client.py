@@ -0,0 +1,333 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+import aiohttp
+import numpy as np
+
+from module.metrics import BYTES_BUCKETS, Metrics
+
+
+class ServiceError(Exception):
+    """A failed call to the analysis service; `retryable` if worth another attempt."""
+
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpenError(ServiceError):
+    """Raised without calling the service while its circuit is open."""
+
+    def __init__(self, message):
+        super().__init__(message, retryable=False)
+
+
+class EndpointBudget:
+    """
+    Time limits of one endpoint: each attempt gets at most
+    `attempt_timeout` seconds and all attempts of a call, backoff
+    included, share `total_budget`.
+    """
+
+    def __init__(self, attempt_timeout=120, total_budget=300, max_attempts=3, retry_delay=2):
+        self.attempt_timeout = attempt_timeout
+        self.total_budget = total_budget
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures, so
+    callers fail fast instead of piling retries onto a service that is
+    down. After `reset_timeout` seconds a single probe is let through
+    (half-open): success closes the circuit, failure re-opens it, and a
+    probe that ends without a verdict (cancelled) must be `release`d.
+    Callers turned away can `wait` for the probe's verdict or the end of
+    the open period instead of failing.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._waiters = set()
+
+    def allow(self):
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+        self._notify()
+
+    def release(self):
+        """Gives up a half-open probe without a verdict; the next call probes instead."""
+        self._probing = False
+        self._notify()
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+            self._notify()
+
+    def retry_after(self):
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    async def wait(self, timeout):
+        """
+        Waits up to `timeout` seconds for a state change (a probe's verdict
+        or release), or until the open period ends; `allow` again after.
+        """
+        if self.state == self.OPEN:
+            timeout = min(timeout, self.retry_after())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.add(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        finally:
+            self._waiters.discard(waiter)
+            waiter.cancel()
+
+    def _notify(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+
+class LatencyTracker:
+    """Sliding window of successful response times of one endpoint."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, p):
+        return float(np.percentile(np.fromiter(self._samples, dtype=np.float64), p)) if self._samples else None
+
+
+class ServiceClient:
+    """
+    Resilient calls to the external analysis service over the shared
+    pooled session, one instance per app.
+
+    - Per-endpoint EndpointBudget: bounded attempts, each with its own
+      timeout, retried with jittered exponential backoff only while the
+      call's total budget lasts, and only for transient failures
+      (connection errors, timeouts, 429/5xx). 4xx responses and bodies
+      that are not valid JSON fail immediately.
+    - Hedging: once an endpoint has `hedge_min_samples` latencies, an
+      attempt still running after its `hedge_percentile` latency gets a
+      duplicate request; the first response wins and the other is
+      cancelled. Hedges are capped at `max_hedge_ratio` of requests.
+    - A CircuitBreaker shared by every caller fails calls fast while the
+      service is down.
+    Every attempt is an `upstream_request` span in `metrics`, retries and
+    hedges are counted there too.
+    """
+
+    def __init__(self, http, base_url, budgets=None, default_budget=None, breaker=None,
+                 hedge_percentile=95, hedge_min_samples=20, max_hedge_ratio=0.1, metrics=None):
+        self.http = http
+        self.metrics = metrics or Metrics()
+        self.base_url = base_url
+        self.budgets = budgets or {}
+        self.default_budget = default_budget or EndpointBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self._latency = {}
+        self._counters = {
+            "calls": 0,
+            "requests": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "retries": 0,
+            "failures": 0,
+            "rejected_open": 0,
+        }
+
+    async def post_form(self, endpoint, make_form, on_retry=None, payload_bytes=None):
+        """
+        POSTs `make_form()` (a fresh aiohttp.FormData per request) to
+        `endpoint` and returns the decoded JSON response.
+        `on_retry(attempt, delay, error)` is an optional coroutine.
+        `payload_bytes` (size of the form's file) is only recorded in metrics.
+        While another caller probes the half-open circuit, or the open
+        period ends within the call's budget, the call waits for it instead
+        of failing; otherwise it raises CircuitOpenError.
+        Raises ServiceError (CircuitOpenError while the circuit is open).
+        """
+        budget = self.budgets.get(endpoint, self.default_budget)
+        deadline = time.monotonic() + budget.total_budget
+        self._counters["calls"] += 1
+        if payload_bytes is not None:
+            self.metrics.inc("upstream_payload_bytes", payload_bytes, endpoint=endpoint)
+            self.metrics.observe("upstream_payload_size_bytes", payload_bytes, BYTES_BUCKETS, endpoint=endpoint)
+        retry_delay = budget.retry_delay
+
+        for attempt in range(budget.max_attempts):
+            while not self.breaker.allow():
+                # Open: wait out the reset if it fits the budget. Half-open:
+                # wait for the in-flight probe's verdict
+                remaining = deadline - time.monotonic()
+                open_for = self.breaker.retry_after() if self.breaker.state == CircuitBreaker.OPEN else 0.0
+                if open_for >= remaining:
+                    self._counters["rejected_open"] += 1
+                    self.metrics.inc("upstream_rejected_open", endpoint=endpoint)
+                    raise CircuitOpenError(
+                        f"Analysis service unavailable, retrying in {self.breaker.retry_after():.0f}s"
+                    )
+                await self.breaker.wait(remaining)
+
+            remaining = deadline - time.monotonic()
+            try:
+                result = await self._hedged(endpoint, make_form, min(budget.attempt_timeout, remaining))
+            except ServiceError as e:
+                if e.retryable:
+                    self.breaker.record_failure()
+                else:
+                    # The service answered, it is just not a usable answer
+                    self.breaker.record_success()
+                self._counters["failures"] += 1
+                # Full jitter keeps concurrent callers from retrying in lockstep
+                delay = random.uniform(0, retry_delay)
+                last = attempt == budget.max_attempts - 1
+                if not e.retryable or last or time.monotonic() + delay >= deadline:
+                    raise
+                self._counters["retries"] += 1
+                self.metrics.inc("upstream_retries", endpoint=endpoint)
+                if on_retry:
+                    await on_retry(attempt, delay, e)
+                await asyncio.sleep(delay)
+                retry_delay *= 2  # Exponential backoff
+            except BaseException:
+                # Cancelled (e.g. a sibling shard failed): no verdict on the
+                # service, but a half-open probe must not stay claimed
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+        raise ServiceError(f"{endpoint} exhausted its time budget", retryable=False)
+
+    def stats(self):
+        return {
+            **self._counters,
+            "circuit": self.breaker.state,
+            "circuit_opened": self.breaker.times_opened,
+            "latency_p50": {endpoint: tracker.percentile(50) for endpoint, tracker in self._latency.items()},
+            "latency_p95": {endpoint: tracker.percentile(95) for endpoint, tracker in self._latency.items()},
+        }
+
+    def _hedge_delay(self, endpoint):
+        tracker = self._latency.get(endpoint)
+        if tracker is None or len(tracker) < self.hedge_min_samples:
+            return None
+        if self._counters["hedges"] >= self.max_hedge_ratio * self._counters["requests"]:
+            return None
+        return tracker.percentile(self.hedge_percentile)
+
+    async def _hedged(self, endpoint, make_form, timeout):
+        delay = self._hedge_delay(endpoint)
+        primary = asyncio.create_task(self._request(endpoint, make_form, timeout))
+        tasks = {primary}
+        hedged = False
+        error = None
+        try:
+            while tasks:
+                wait = delay if not hedged else None
+                done, _ = await asyncio.wait(tasks, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual: race a duplicate against it
+                    hedged = True
+                    self._counters["hedges"] += 1
+                    self.metrics.inc("upstream_hedges", endpoint=endpoint)
+                    tasks.add(asyncio.create_task(self._request(endpoint, make_form, max(timeout - delay, 0.001))))
+                    continue
+                for task in done:
+                    tasks.discard(task)
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+                    if not error.retryable:
+                        raise error
+                if not hedged:
+                    # Failed fast: leave it to the retry loop and its backoff
+                    break
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _request(self, endpoint, make_form, timeout):
+        self._counters["requests"] += 1
+        started = time.monotonic()
+        outcome = "cancelled"  # Lost a hedge race or the caller gave up
+        with self.metrics.span("upstream_request", endpoint=endpoint) as span:
+            try:
+                async with self.http.session.post(
+                    f"{self.base_url}{endpoint}",
+                    data=make_form(),
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                ) as resp:
+                    span["status"] = resp.status
+                    if resp.status != 200:
+                        outcome = "http_error"
+                        text = await resp.text()
+                        raise ServiceError(
+                            f"External API error ({resp.status}): {text[:200]}",
+                            retryable=resp.status == 429 or resp.status >= 500,
+                        )
+                    try:
+                        result = await resp.json(content_type=None)
+                    except ValueError as e:
+                        outcome = "invalid_json"
+                        raise ServiceError(f"Invalid JSON from {endpoint}: {e}", retryable=False)
+                    outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise ServiceError(f"{endpoint} timed out after {timeout:.0f}s")
+            except aiohttp.ClientError as e:
+                outcome = "connection_error"
+                raise ServiceError(str(e) or type(e).__name__)
+            finally:
+                span["outcome"] = outcome
+                self.metrics.inc("upstream_requests", endpoint=endpoint, outcome=outcome)
+
+        self._latency.setdefault(endpoint, LatencyTracker()).record(time.monotonic() - started)
+        return result
@@ -0,0 +1,227 @@
+import numpy as np
+
+# 2-bit base codes; anything else (N, IUPAC, separators) is 4 and breaks k-mers
+_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _base in enumerate(b"ACGT"):
+    _CODES[_base] = _code
+
+# Sketch value of a read without a single valid k-mer
+EMPTY = np.uint32(0xFFFFFFFF)
+
+# Bases hashed per step (bounds the temporary uint64 arrays to ~32 MB each)
+CHUNK_BASES = 1 << 22
+
+# Sequences sketched by estimate_redundancy
+SAMPLE_SIZE = 4000
+# Sample members sharing one LSH bucket beyond which the sample is plainly redundant
+MAX_BUCKET = 256
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_ODD = np.uint64(0x9E3779B97F4A7C15)
+_ODD32 = np.uint32(0x9E3779B1)
+
+
+def _mix(x):
+    """splitmix64 finaliser, element-wise on a uint64 array."""
+    x = x ^ (x >> np.uint64(30))
+    x = x * _MIX1
+    x = x ^ (x >> np.uint64(27))
+    x = x * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+def _windows(bases, k, n_pos):
+    """
+    2-bit codes of the `n_pos` length-k windows of `bases`, built from
+    power-of-two windows (log2(k) passes instead of k).
+    """
+    result = None
+    covered = 0
+    width, codes = 1, bases
+    powers = {}
+    while width <= k:
+        powers[width] = codes
+        codes = (codes[:-width] << np.uint64(2 * width)) | codes[width:]
+        width *= 2
+    for width in sorted(powers, reverse=True):
+        if k - covered >= width:
+            part = powers[width][covered:covered + n_pos]
+            result = part if result is None else (result << np.uint64(2 * width)) | part
+            covered += width
+    return result
+
+
+class SketchClusterer:
+    """
+    Alignment-free pre-clustering of unique sequences for triage of large
+    samples: each sequence gets a MinHash sketch of its k-mers, and
+    sequences are grouped greedily around representatives, most abundant
+    first. A sequence joins the first representative sharing one of its
+    LSH bands (`bands` groups of `num_hashes / bands` sketch values) whose
+    estimated Jaccard similarity is at least `threshold`; otherwise it
+    becomes a representative itself. Only representatives need to be
+    predicted or embedded, their labels are then copied to the members.
+    With `canonical`, k-mers and their reverse complements hash alike.
+    Sequences without a valid k-mer (shorter than k, all N) stay alone.
+    """
+
+    def __init__(self, k=16, num_hashes=32, bands=16, threshold=0.6, canonical=False, seed=42):
+        if not 1 <= k <= 31:
+            raise ValueError("k must be between 1 and 31")
+        if num_hashes % bands:
+            raise ValueError("num_hashes must be a multiple of bands")
+        self.k = k
+        self.num_hashes = num_hashes
+        self.bands = bands
+        self.threshold = threshold
+        self.canonical = canonical
+        rng = np.random.default_rng(seed)
+        self._salts = rng.integers(0, 2 ** 32, size=num_hashes, dtype=np.uint32)
+        self._band_salts = rng.integers(0, 2 ** 63, size=bands, dtype=np.uint64)
+
+    def sketch(self, sequences):
+        """(len(sequences), num_hashes) uint32 MinHash sketches of upper-case DNA bytes."""
+        sketches = np.full((len(sequences), self.num_hashes), EMPTY, dtype=np.uint32)
+        start = 0
+        while start < len(sequences):
+            end, size = start, 0
+            while end < len(sequences) and (end == start or size + len(sequences[end]) < CHUNK_BASES):
+                size += len(sequences[end]) + 1
+                end += 1
+            self._sketch_chunk(sequences[start:end], sketches[start:end])
+            start = end
+        return sketches
+
+    def _sketch_chunk(self, sequences, out):
+        k = self.k
+        # One separator between reads, so no k-mer spans two of them
+        codes = _CODES[np.frombuffer(b"N".join(bytes(seq) for seq in sequences), dtype=np.uint8)]
+        n_pos = len(codes) - k + 1
+        if n_pos <= 0:
+            return
+        invalid = codes == 4
+        bases = np.where(invalid, 0, codes).astype(np.uint64)
+
+        kmers = _windows(bases, k, n_pos)
+        if self.canonical:
+            # Reverse complement: complemented bases read right to left
+            reverse = _windows(np.uint64(3) - bases[::-1], k, n_pos)[::-1]
+            kmers = np.minimum(kmers, reverse)
+
+        bad = np.concatenate(([0], np.cumsum(invalid, dtype=np.int64)))
+        valid = bad[k:] - bad[:n_pos] == 0
+        lengths = np.fromiter((len(seq) for seq in sequences), dtype=np.int64, count=len(sequences))
+        owner = np.repeat(np.arange(len(sequences)), lengths + 1)[:n_pos][valid]
+        if len(owner) == 0:
+            return
+        # 32-bit values: half the memory traffic of the per-function passes
+        hashed = (_mix(kmers[valid]) >> np.uint64(32)).astype(np.uint32)
+
+        # Owners are sorted, so each read's k-mers form one run
+        present, first = np.unique(owner, return_index=True)
+        values = np.empty_like(hashed)
+        for i, salt in enumerate(self._salts):
+            # hashed is already mixed; xor + odd multiply permutes it per function
+            np.bitwise_xor(hashed, salt, out=values)
+            np.multiply(values, _ODD32, out=values)
+            out[present, i] = np.minimum.reduceat(values, first)
+
+    def band_keys(self, sketches):
+        """(n, bands) uint64 bucket keys; equal keys mean equal sketch values in that band."""
+        rows = self.num_hashes // self.bands
+        keys = np.empty((len(sketches), self.bands), dtype=np.uint64)
+        for band in range(self.bands):
+            key = np.full(len(sketches), self._band_salts[band], dtype=np.uint64)
+            for column in range(band * rows, (band + 1) * rows):
+                key = _mix(key ^ sketches[:, column].astype(np.uint64)) * _ODD
+            keys[:, band] = key
+        return keys
+
+    def estimate_redundancy(self, sequences, sample_size=SAMPLE_SIZE, seed=0):
+        """
+        Cheap upper-bound estimate of the share of `sequences` that `group`
+        would attach to a representative, from a random sample of
+        `sample_size`: similar pairs in the sample scale with the square of
+        the sampling fraction, and a group of g sequences has at least
+        g - 1 similar pairs. Lets callers skip sketching every sequence
+        when there is little to gain.
+        """
+        n = len(sequences)
+        if n < 2:
+            return 0.0
+        m = min(n, sample_size)
+        sample = np.sort(np.random.default_rng(seed).choice(n, m, replace=False))
+        sketches = self.sketch([sequences[i] for i in sample.tolist()])
+        # Sequences without a k-mer share keys but are never grouped
+        sketches = sketches[~(sketches == EMPTY).all(axis=1)]
+        keys = self.band_keys(sketches)
+
+        pairs = []
+        for band in range(self.bands):
+            order = np.argsort(keys[:, band], kind="stable")
+            ordered = keys[order, band]
+            starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+            sizes = np.diff(np.append(starts, len(ordered)))
+            for start, size in zip(starts[sizes > 1].tolist(), sizes[sizes > 1].tolist()):
+                if size > MAX_BUCKET:
+                    return 1.0
+                first, second = np.triu_indices(size, 1)
+                members = np.sort(order[start:start + size])
+                pairs.append(members[first] * len(sketches) + members[second])
+        if not pairs:
+            return 0.0
+        pairs = np.unique(np.concatenate(pairs))
+        first, second = np.divmod(pairs, len(sketches))
+        needed = int(np.ceil(self.threshold * self.num_hashes))
+        similar = np.count_nonzero((sketches[first] == sketches[second]).sum(axis=1) >= needed)
+        return min(1.0, similar * (n * (n - 1)) / (m * (m - 1)) / n)
+
+    def group(self, sequences, counts=None, seeds=0):
+        """
+        Representative of every sequence, as an int64 array of indices into
+        `sequences` (representatives map to themselves). `counts` (read
+        multiplicities) decide who is tried as a representative first; the
+        first `seeds` sequences (e.g. already labelled ones) are
+        representatives before all others.
+        """
+        n = len(sequences)
+        assignment = np.arange(n, dtype=np.int64)
+        if n == 0:
+            return assignment
+        sketches = self.sketch(sequences)
+        empty = (sketches == EMPTY).all(axis=1).tolist()
+        keys = self.band_keys(sketches).tolist()
+        needed = int(np.ceil(self.threshold * self.num_hashes))
+
+        counts = np.ones(n) if counts is None else np.asarray(counts)
+        order = np.lexsort((np.arange(n), -counts, np.arange(n) >= seeds)).tolist()
+        buckets = {}
+        for i in order:
+            if empty[i]:
+                continue
+            if i < seeds:
+                for key in keys[i]:
+                    buckets.setdefault(key, i)
+                continue
+            representative = -1
+            tried = set()
+            for key in keys[i]:
+                candidate = buckets.get(key)
+                if candidate is None or candidate in tried:
+                    continue
+                tried.add(candidate)
+                if np.count_nonzero(sketches[i] == sketches[candidate]) >= needed:
+                    representative = candidate
+                    break
+            if representative >= 0:
+                assignment[i] = representative
+            else:
+                for key in keys[i]:
+                    buckets.setdefault(key, i)
+        return assignment
+
+
+def representatives(assignment):
+    """Indices of the representatives of a `group` assignment, in input order."""
+    return np.flatnonzero(assignment == np.arange(len(assignment)))
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from module.sequence_index import index_path, read_index, write_index
+
+
+class UploadStore:
+    """
+    Uploaded sequence files shared by every server process.
+    Blobs (`{file_id}.{format}`, `.gz` appended for compressed uploads,
+    plus their `.idx` sidecar) live in
+    `directory` and their metadata in a SQLite table, so any worker
+    process on the host can serve an upload another one accepted.
+    The table uses WAL mode, so `db_path` must be on local disk, not a
+    network filesystem shared between machines.
+    """
+
+    def __init__(self, directory, db_path=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path or os.path.join(directory, "uploads.sqlite3")
+        if os.path.dirname(self.db_path):
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS uploads ("
+            "file_id TEXT PRIMARY KEY, format TEXT NOT NULL, filename TEXT NOT NULL, "
+            "records INTEGER NOT NULL, bases INTEGER NOT NULL, bytes INTEGER NOT NULL, "
+            "created REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(uploads)")}
+        if "compression" not in columns:
+            self._db.execute("ALTER TABLE uploads ADD COLUMN compression TEXT")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def new_part(self):
+        """(file_id, path) of a fresh partial upload to write into."""
+        file_id = str(uuid.uuid4())
+        return file_id, os.path.join(self.directory, f"{file_id}.part")
+
+    def commit(self, file_id, part_path, summary, compression=None):
+        """
+        Publishes a fully written upload along with its scan summary.
+        `compression` ("gzip" or None) is how the blob is stored; the
+        summary always describes the decompressed content.
+        """
+        filename = f"{file_id}.{summary['format']}" + (".gz" if compression == "gzip" else "")
+        write_index(index_path(self.directory, file_id), summary)
+        os.replace(part_path, os.path.join(self.directory, filename))
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO uploads (file_id, format, filename, records, bases, bytes, created, compression) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_id, summary["format"], filename, summary["records"], summary["bases"],
+                 summary["bytes"], time.time(), compression),
+            )
+            self._db.commit()
+
+    def get(self, file_id):
+        """Metadata of an upload with its absolute `path`, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT file_id, format, filename, records, bases, bytes, created, compression "
+                "FROM uploads WHERE file_id = ?",
+                (file_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        upload = dict(zip(("file_id", "format", "filename", "records", "bases", "bytes", "created", "compression"), row))
+        upload["path"] = os.path.join(self.directory, upload["filename"])
+        if not os.path.exists(upload["path"]):
+            return None
+        return upload
+
+    def index(self, file_id):
+        """Sidecar index summary written at upload time, or None."""
+        return read_index(index_path(self.directory, file_id))
+
+    def delete(self, file_id):
+        upload = self.get(file_id)
+        paths = [index_path(self.directory, file_id)]
+        if upload is not None:
+            paths.append(upload["path"])
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already gone or removed by another worker
+        with self._lock:
+            self._db.execute("DELETE FROM uploads WHERE file_id = ?", (file_id,))
+            self._db.commit()
+
+    def prune(self, older_than):
+        """
+        Deletes uploads created before `older_than` (epoch seconds), e.g.
+        ones whose job failed or that never got a WebSocket, plus partial
+        files of uploads that never finished. Returns the uploads deleted.
+        """
+        with self._lock:
+            file_ids = [
+                row[0] for row in self._db.execute("SELECT file_id FROM uploads WHERE created < ?", (older_than,))
+            ]
+        for file_id in file_ids:
+            self.delete(file_id)
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".part"):
+                path = os.path.join(self.directory, entry)
+                try:
+                    if os.path.getmtime(path) < older_than:
+                        os.remove(path)
+                except OSError:
+                    pass  # Committed or removed concurrently
+        return len(file_ids)
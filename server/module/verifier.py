@@ -1,115 +1,148 @@
 import asyncio
 import aiohttp
-import json
+import numpy as np
+
+from module.aggregation import STATUS_FALLBACK, STATUS_THRESHOLDS
+from module.service_client import ServiceError
 
 class AsyncBlastVerifier:
-    GCP_API_URL = "https://pug-c-776087882401.europe-west1.run.app/predict/fasta"
-    
+    ENDPOINT = "/predict/fasta"
+
     @staticmethod
-    async def verify_stream(sequences, cluster_df, top_n=5):
+    async def verify_stream(sequences, labels, service, top_n=5, representatives=5,
+                            weights=None, probabilities=None, embeddings=None):
         """
-        Verify sequences using GCP API and yield results one by one.
-        Streams top N clusters based on abundance.
+        Verify the top N clusters (by abundance) against the analysis service
+        and yield each result as soon as its request completes.
+        `labels` is the cluster of every sequence (-1 is noise), `weights`
+        its read count. Only `representatives` sequences per cluster are
+        sent: those closest to the cluster centroid when `embeddings` are
+        given, else the most confident ones by `probabilities`, else evenly
+        spaced members.
+        Clusters are verified concurrently through `service` (the app's
+        ServiceClient, so calls share its breaker, budgets and hedging); a
+        cluster whose request fails is skipped.
         """
-        abundance = cluster_df['cluster'].value_counts()
-        top_clusters = abundance.index[abundance.index != -1][:top_n].tolist()
-        
-        # Prepare FASTA content from all sequences
-        fasta_content = ""
-        for idx, seq in enumerate(sequences):
-            fasta_content += f">seq_{idx}\n{seq}\n"
-        
+        labels = np.asarray(labels)
+        weights = np.ones(len(labels)) if weights is None else np.asarray(weights, dtype=np.float64)
+        total = float(weights.sum())
+        groups = AsyncBlastVerifier._group_clusters(labels)
+
+        # Top N clusters by abundance, noise (-1) excluded
+        cluster_ids = np.fromiter((c for c in groups if c != -1), dtype=np.int64)
+        counts = np.fromiter((weights[groups[c]].sum() for c in cluster_ids), dtype=np.float64, count=len(cluster_ids))
+        top = np.argsort(-counts, kind='stable')[:top_n]
+        top_clusters = cluster_ids[top].tolist()
+
+        if probabilities is not None:
+            probabilities = np.asarray(probabilities, dtype=np.float64)
+
+        async def verify(cluster_idx, cluster_id):
+            members = groups[cluster_id]
+            reps = AsyncBlastVerifier._representatives(members, representatives, embeddings, probabilities)
+            fasta_content = "".join(f">seq_{idx}\n{AsyncBlastVerifier._text(sequences[idx])}\n" for idx in reps.tolist())
+            predictions = await AsyncBlastVerifier._call_service(service, fasta_content)
+            return cluster_idx, cluster_id, int(round(weights[members].sum())), predictions
+
+        tasks = [
+            asyncio.create_task(verify(cluster_idx, cluster_id))
+            for cluster_idx, cluster_id in enumerate(top_clusters)
+        ]
         try:
-            # Call GCP API once with all sequences
-            async with aiohttp.ClientSession() as session:
-                gcp_results = await AsyncBlastVerifier._call_gcp_api(session, fasta_content)
-            
-            # Process results by cluster
-            for cluster_idx, cluster_id in enumerate(top_clusters):
-                # Get sequences in this cluster
-                indices = cluster_df[cluster_df['cluster'] == cluster_id].index.tolist()
-                cluster_count = len(indices)
-                
-                if cluster_count == 0:
+            for future in asyncio.as_completed(tasks):
+                cluster_idx, cluster_id, cluster_count, predictions = await future
+                if not predictions:
                     continue
-                
-                # Get the top prediction for this cluster from GCP results
-                cluster_predictions = []
-                for idx in indices:
-                    if idx < len(gcp_results):
-                        cluster_predictions.append(gcp_results[idx])
-                
-                if not cluster_predictions:
-                    continue
-                
-                # Sort by confidence (probability) and take the top prediction
-                top_pred = sorted(cluster_predictions, key=lambda x: float(x.get('probability', 0)), reverse=True)[0]
-                
-                genus = top_pred.get('genus', 'Unknown')
-                class_name = top_pred.get('class', 'Unknown')
-                probability = float(top_pred.get('probability', 0))
-                percentage = (cluster_count / len(sequences)) * 100
-                
-                # Format description for consistency
-                description = f"{genus} (Class: {class_name}, {cluster_count} sequences, {percentage:.1f}%)"
-                
-                yield {
-                    "cluster_index": cluster_idx + 1,
-                    "cluster_id": int(cluster_id),
-                    "cluster_count": cluster_count,
-                    "genus": genus,
-                    "class": class_name,
-                    "probability": probability,
-                    "percentage": round(percentage, 1),
-                    "match_percentage": probability,
-                    "description": description
-                }
-        
-        except Exception as e:
-            print(f"GCP API Error: {e}")
-            # Return empty - error will be handled by websocket
-    
+                yield AsyncBlastVerifier._cluster_result(
+                    cluster_idx, len(top_clusters), cluster_id, cluster_count, total, predictions
+                )
+        finally:
+            # Consumer stopped early: don't leave requests running
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _text(sequence):
+        return sequence.decode('ascii') if isinstance(sequence, (bytes, bytearray, memoryview)) else sequence
+
+    @staticmethod
+    def _group_clusters(labels):
+        """{cluster_id: member row indices}, from a single stable sort."""
+        order = np.argsort(labels, kind='stable')
+        cluster_ids, starts = np.unique(labels[order], return_index=True)
+        return {int(c): members for c, members in zip(cluster_ids, np.split(order, starts[1:]))}
+
+    @staticmethod
+    def _representatives(members, n, embeddings=None, probabilities=None):
+        if len(members) <= n:
+            return members
+        if embeddings is not None:
+            # Reads nearest the cluster centroid (cosine)
+            vectors = np.asarray(embeddings[members], dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            similarity = vectors @ vectors.mean(axis=0)
+            return members[np.argpartition(-similarity, n - 1)[:n]]
+        if probabilities is not None:
+            return members[np.argpartition(-probabilities[members], n - 1)[:n]]
+        return members[np.linspace(0, len(members) - 1, n).astype(np.int64)]
+
     @staticmethod
-    async def _call_gcp_api(session, fasta_content):
+    def _cluster_result(cluster_idx, n_clusters, cluster_id, cluster_count, total, predictions):
+        # Majority genus among the representatives, ties broken by confidence
+        votes = {}
+        for pred in predictions:
+            vote = votes.setdefault(pred['genus'], [0, 0.0, pred])
+            vote[0] += 1
+            vote[1] += pred['probability']
+        genus, (n_votes, total_prob, top_pred) = max(votes.items(), key=lambda item: (item[1][0], item[1][1]))
+
+        class_name = top_pred.get('class', 'Unknown')
+        probability = total_prob / n_votes
+        prob_percent = round(probability * 100, 1)
+        percentage = (cluster_count / total) * 100 if total > 0 else 0
+        status = next((name for threshold, name in STATUS_THRESHOLDS if prob_percent >= threshold), STATUS_FALLBACK)
+
+        # Same shape as AbundanceAggregator.verification_updates
+        description = f"{genus} (Class: {class_name}, {cluster_count} sequences, {percentage:.1f}%)"
+
+        return {
+            "step": f"Verification {cluster_idx + 1}/{n_clusters}",
+            "cluster_id": cluster_idx,
+            "status": status,
+            "match_percentage": prob_percent,
+            "description": description,
+            "cluster": int(cluster_id),
+            "genus": genus,
+            "class": class_name,
+        }
+
+    @staticmethod
+    async def _call_service(service, fasta_content):
         """
-        Call the GCP API with FASTA content and return parsed results.
+        POST the FASTA content to /predict/fasta through `service` and return
+        [{genus, class, probability}]; [] if the service call fails.
         """
+        data = fasta_content.encode('ascii')
+
+        def make_form():
+            form = aiohttp.FormData()
+            form.add_field('file', data, filename='sequences.fasta', content_type='text/plain')
+            return form
+
         try:
-            # Create form data with FASTA file
-            data = aiohttp.FormData()
-            data.add_field('file', fasta_content, filename='sequences.fasta', content_type='text/plain')
-            
-            # Send request to GCP API
-            async with session.post(
-                AsyncBlastVerifier.GCP_API_URL,
-                data=data,
-                timeout=aiohttp.ClientTimeout(total=120)
-            ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    
-                    # Parse the GCP API response
-                    # Expected format: {"count": N, "results": [...]}
-                    results_list = result.get('results', [])
-                    
-                    # Convert to standardized format
-                    parsed_results = []
-                    for item in results_list:
-                        if isinstance(item, dict):
-                            parsed_results.append({
-                                'genus': item.get('genus', item.get('name', 'Unknown')),
-                                'class': item.get('class', item.get('family', 'Unknown')),
-                                'probability': float(item.get('probability', item.get('confidence', 0)))
-                            })
-                    
-                    return parsed_results
-                else:
-                    print(f"GCP API Error ({response.status}): {await response.text()}")
-                    return []
-        
-        except asyncio.TimeoutError:
-            print("GCP API Timeout")
+            result = await service.post_form(AsyncBlastVerifier.ENDPOINT, make_form, payload_bytes=len(data))
+        except ServiceError as e:
+            print(f"Verification request failed: {e}")
             return []
-        except Exception as e:
-            print(f"GCP API Exception: {e}")
-            return []
\ No newline at end of file
+
+        # Expected format: {"count": N, "results": [{"prediction": {...}}, ...]}
+        parsed_results = []
+        for item in result.get('results', []):
+            if isinstance(item, dict):
+                item = item.get('prediction', item)
+                parsed_results.append({
+                    'genus': item.get('genus', item.get('name', 'Unknown')),
+                    'class': item.get('class', item.get('family', 'Unknown')),
+                    'probability': float(item.get('probability', item.get('genus_prob', item.get('confidence', 0))))
+                })
+        return parsed_results
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import zlib
+
+# Encodings of batched frames: JSON text, or binary frames holding
+# raw-deflated JSON / MessagePack (needs the msgpack package)
+ENCODINGS = ("json", "deflate", "msgpack")
+
+# Snapshot events: a newer one makes older unsent ones redundant
+SUPERSEDING = ("clustering_result",)
+
+
+class EventBatcher:
+    """
+    Coalesces job events between sends on one WebSocket.
+    The producer `put`s events as they arrive; the sender takes everything
+    pending in one `get_batch` as soon as its previous frame has been
+    written. A fast client therefore gets one event per frame, while for a
+    slow one (whose sends block on a full buffer) events pile up into
+    larger frames instead of queueing frames, and superseded snapshots are
+    dropped on the way.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, event):
+        if event.get("type") in SUPERSEDING:
+            kept = [pending for pending in self._pending if pending.get("type") != event["type"]]
+            self.dropped += len(self._pending) - len(kept)
+            self._pending = kept
+        self._pending.append(event)
+        self._ready.set()
+
+    def close(self):
+        """No more events; `get_batch` drains what is left, then returns []."""
+        self._closed = True
+        self._ready.set()
+
+    async def get_batch(self):
+        while not self._pending and not self._closed:
+            self._ready.clear()
+            await self._ready.wait()
+        # One loop turn for producers that are ready right now (no timer)
+        await asyncio.sleep(0)
+        batch, self._pending = self._pending, []
+        return batch
+
+
+def encode_batch(events, encoding="json"):
+    """Returns (payload, is_binary) of one `{"type": "batch", "events": [...]}` frame."""
+    frame = {"type": "batch", "events": events}
+    if encoding == "msgpack":
+        import msgpack  # Optional, only for clients asking for it
+        return msgpack.packb(frame, use_bin_type=True), True
+    text = json.dumps(frame, separators=(",", ":"))
+    if encoding == "deflate":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(text.encode()) + compressor.flush(), True
+    return text, False
+
+
+def msgpack_available():
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        return False
+    return True
@@ -0,0 +1,61 @@
+import numpy as np
+
+from module.aggregation import AbundanceAggregator
+
+
+def labels_of(aggregator, rows):
+    return [aggregator._labels[row] for row in rows]
+
+
+def test_groups_are_registered_in_first_seen_order():
+    aggregator = AbundanceAggregator()
+    aggregator.add(["b", "unknown", "a", "b", "c"])
+    aggregator.add(["z", "a", "y"])
+    assert aggregator._labels == ["b", "a", "c", "z", "y"]
+    assert aggregator.total == 8 and aggregator.noise_count == 1
+    assert aggregator._counts.tolist() == [2, 2, 1, 1, 1]
+
+
+def test_top_breaks_ties_by_first_seen():
+    aggregator = AbundanceAggregator()
+    aggregator.add([f"g{i}" for i in range(100)])
+    assert labels_of(aggregator, aggregator.top(5)) == ["g0", "g1", "g2", "g3", "g4"]
+
+    # A larger group goes first, the tie at the cutoff still keeps first-seen order
+    aggregator.add(["g50", "g50", "g7"])
+    assert labels_of(aggregator, aggregator.top(4)) == ["g50", "g7", "g0", "g1"]
+    assert len(aggregator.top(0)) == 0
+    assert len(aggregator.top(500)) == 100
+
+
+def test_top_matches_a_full_stable_sort():
+    rng = np.random.default_rng(0)
+    aggregator = AbundanceAggregator()
+    for _ in range(5):
+        labels = rng.integers(0, 300, 1000).astype(str)
+        aggregator.add(labels, weights=rng.integers(1, 4, 1000))
+    expected = np.argsort(-aggregator._counts, kind="stable")
+    for k in (1, 7, 20, 299, 300):
+        assert aggregator.top(k).tolist() == expected[:k].tolist()
+
+
+def test_final_stats_do_not_depend_on_shard_arrival_order():
+    def item(genus):
+        return {"prediction": {"genus": genus, "class": "c", "genus_prob": 0.9}}
+
+    # Unique sequences in file order; A and B tie on reads
+    predictions = [item("A"), item("B"), item("B"), item("A"), item("C")]
+    counts = np.array([1, 1, 1, 1, 1])
+    shards = [(predictions[:2], counts[:2]), (predictions[2:], counts[2:])]
+
+    # Progressive stats follow the order shards land in...
+    progressive = AbundanceAggregator()
+    for results, weights in reversed(shards):
+        progressive.add_results(results, weights)
+    assert progressive.clustering_result()["top_groups"][0]["count"] == 2
+    assert [update["description"][0] for update in progressive.verification_updates()] == ["B", "A", "C"]
+
+    # ...the final ones are rebuilt in file order, ties going to A
+    final = AbundanceAggregator()
+    final.add_results(predictions, counts)
+    assert [update["description"][0] for update in final.verification_updates()] == ["A", "B", "C"]
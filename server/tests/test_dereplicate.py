@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from module.aggregation import AbundanceAggregator
+from module.dereplicate import dereplicate, normalize
+from module.prediction_cache import sequence_key
+
+GENERA = ["Vibrio", "Bacillus", "unknown", "Prochlorococcus", "Pelagibacter"]
+
+
+def predict(seq):
+    """Deterministic stand-in for the service, the same for both strands of a read."""
+    canonical = normalize(seq, reverse_complement=True)
+    h = int.from_bytes(sequence_key(canonical)[:4], "little")
+    return {"prediction": {
+        "genus": GENERA[h % len(GENERA)],
+        "class": f"class-{h % len(GENERA)}",
+        "genus_prob": (h % 1000) / 1000,
+    }}
+
+
+def reverse_complement(seq):
+    return seq.translate(bytes.maketrans(b"ACGT", b"TGCA"))[::-1]
+
+
+def sample_reads(rng, n=3000, uniques=60, with_reverse=False):
+    pool = [bytes(rng.choice(list(b"ACGT"), 40)) for _ in range(uniques)]
+    reads = []
+    for i, pick in enumerate(rng.zipf(1.5, n) % uniques):
+        seq = pool[pick]
+        if with_reverse and i % 3 == 0:
+            seq = reverse_complement(seq)
+        if i % 7 == 0:
+            seq = seq.lower()
+        reads.append((b"read%d" % i, seq))
+    return reads
+
+
+def baseline(results):
+    """The per-read loop main.py ran before dereplication, and the messages it built."""
+    count = len(results)
+    unique_predictions = {}
+    for item in results:
+        pred_dict = item.get("prediction", {})
+        genus = pred_dict.get("genus", "unknown")
+        if genus not in unique_predictions:
+            unique_predictions[genus] = {"count": 0, "class": pred_dict.get("class", "unknown"),
+                                         "avg_prob": 0, "total_prob": 0}
+        unique_predictions[genus]["count"] += 1
+        unique_predictions[genus]["total_prob"] += pred_dict.get("genus_prob", 0)
+    for genus in unique_predictions:
+        unique_predictions[genus]["avg_prob"] = unique_predictions[genus]["total_prob"] / unique_predictions[genus]["count"]
+
+    ranked = sorted(unique_predictions.items(), key=lambda x: x[1]["count"], reverse=True)
+    top_groups = [
+        {"group_id": idx, "count": data["count"], "percentage": round(data["count"] / count * 100, 2)}
+        for idx, (genus, data) in enumerate(ranked[:20])
+    ]
+    verifications = []
+    for idx, (genus, data) in enumerate(ranked[:5]):
+        prob_percent = round(data["avg_prob"] * 100, 1)
+        status = ("KNOWN (Old)" if prob_percent >= 95 else "RELATED (Old)" if prob_percent >= 80
+                  else "NOVEL (New)" if prob_percent >= 50 else "GHOST (Newish)")
+        verifications.append({
+            "step": f"Verification {idx+1}/{min(5, len(unique_predictions))}",
+            "cluster_id": idx,
+            "status": status,
+            "match_percentage": prob_percent,
+            "description": f"{genus} (Class: {data['class']}, {data['count']} sequences, "
+                           f"{round(data['count'] / count * 100, 1)}%)",
+        })
+    return unique_predictions, top_groups, verifications
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_weighted_aggregation_matches_the_per_read_loop(reverse):
+    records = sample_reads(np.random.default_rng(0), with_reverse=reverse)
+    expected, top_groups, verifications = baseline([predict(seq) for _, seq in records])
+
+    reads = dereplicate(iter(records), reverse_complement=reverse)
+    assert len(reads) == len(records) and reads.counts.sum() == len(records)
+    reads.predictions = [predict(seq) for seq in reads.sequences]
+
+    # The baseline had no noise label: "unknown" was a genus like any other
+    aggregator = AbundanceAggregator(noise_labels=())
+    aggregator.add_results(reads.predictions, reads.counts)
+    assert aggregator._labels == list(expected)
+    for row, (genus, data) in enumerate(expected.items()):
+        assert aggregator._counts[row] == data["count"]
+        assert aggregator._prob_sums[row] == pytest.approx(data["total_prob"], rel=1e-12)
+        assert aggregator._prob_sums[row] / aggregator._counts[row] == pytest.approx(data["avg_prob"], rel=1e-12)
+
+    result = aggregator.clustering_result()
+    assert result["total_reads"] == len(records)
+    assert result["total_clusters"] == len(expected)
+    assert result["top_groups"] == top_groups
+    assert aggregator.verification_updates(top_n=5) == verifications
+
+
+def test_reverse_complement_collapses_both_strands():
+    records = [(b"a", b"AACG"), (b"b", b"cgtt"), (b"c", b"AACG"), (b"d", b"AACGU")]
+    same_strand = dereplicate(iter(records))
+    assert same_strand.n_unique == 3
+    assert same_strand.read_to_unique.tolist() == [0, 1, 0, 2]
+
+    both = dereplicate(iter(records), reverse_complement=True)
+    assert both.n_unique == 2
+    assert both.read_to_unique.tolist() == [0, 0, 0, 1]
+    assert both.sequences[0] == b"AACG" and both.counts.tolist() == [3, 1]
+    assert [both.name(i) for i in range(4)] == ["a", "b", "c", "d"]
+    assert [name for name, _ in both.iter_reads()] == ["a", "b", "c", "d"]
+
+
+def test_normalize():
+    assert normalize(b"acgu") == b"ACGT"
+    # Smaller of the read and its reverse complement, IUPAC codes included
+    assert normalize(b"TTRN", reverse_complement=True) == b"NYAA"
+    assert normalize(b"AAAC", reverse_complement=True) == b"AAAC"
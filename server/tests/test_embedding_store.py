@@ -0,0 +1,110 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from module.embedding_store import KEY_BYTES, EmbeddingStore
+from module.prediction_cache import sequence_key
+
+
+def keys_of(*seqs):
+    return [sequence_key(seq) for seq in seqs]
+
+
+def vectors(n, dim=4, start=0):
+    return np.arange(start, start + n * dim, dtype=np.float32).reshape(n, dim)
+
+
+def test_append_lookup_load(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="m")
+    keys = keys_of("AAAA", "CCCC", "GGGG")
+    assert store.append(keys, vectors(3)) == 3
+    # Known keys, duplicates within the batch and unknown keys
+    assert store.append(keys_of("AAAA", "TTTT", "TTTT"), vectors(3, start=100)) == 1
+    assert store.lookup(keys_of("CCCC", "ACGT", "TTTT")).tolist() == [1, -1, 3]
+    np.testing.assert_array_equal(store.load(keys_of("GGGG")), vectors(3)[2:].astype(np.float16))
+    with pytest.raises(KeyError):
+        store.load(keys_of("ACGT"))
+
+
+def test_reopen_and_model_mismatch(tmp_path):
+    EmbeddingStore(str(tmp_path), model_name="m").append(keys_of("AAAA"), vectors(1))
+    store = EmbeddingStore(str(tmp_path), model_name="m")
+    assert store.rows == 1 and store.dim == 4
+    with pytest.raises(ValueError):
+        EmbeddingStore(str(tmp_path), model_name="other")
+
+
+def test_crash_before_first_meta_is_discarded(tmp_path):
+    # An append that died after writing data but before the first meta.json
+    with open(tmp_path / "vectors.f16", "wb") as f:
+        f.write(b"\x01" * 8 * 3)
+    with open(tmp_path / "keys.bin", "wb") as f:
+        f.write(b"\x02" * KEY_BYTES * 3)
+
+    store = EmbeddingStore(str(tmp_path), model_name="m")
+    assert os.path.getsize(tmp_path / "keys.bin") == 0
+    store.append(keys_of("AAAA", "CCCC"), vectors(2))
+    assert store.lookup(keys_of("AAAA", "CCCC")).tolist() == [0, 1]
+    np.testing.assert_array_equal(store.load(keys_of("CCCC")), vectors(2)[1:].astype(np.float16))
+
+
+def test_crash_after_meta_tail_is_cut(tmp_path):
+    store = EmbeddingStore(str(tmp_path), model_name="m")
+    store.append(keys_of("AAAA"), vectors(1))
+    with open(tmp_path / "keys.bin", "ab") as f:
+        f.write(b"\x02" * KEY_BYTES)
+
+    reopened = EmbeddingStore(str(tmp_path), model_name="m")
+    reopened.append(keys_of("CCCC"), vectors(1, start=50))
+    assert reopened.lookup(keys_of("AAAA", "CCCC")).tolist() == [0, 1]
+    assert json.loads((tmp_path / "meta.json").read_text())["rows"] == 2
+
+
+def test_instances_sharing_a_directory(tmp_path):
+    # Two handles on one directory stand in for two worker processes
+    first = EmbeddingStore(str(tmp_path), model_name="m")
+    second = EmbeddingStore(str(tmp_path), model_name="m")
+    first.append(keys_of("AAAA"), vectors(1))
+    second.append(keys_of("CCCC", "AAAA"), vectors(2, start=10))
+
+    assert second.rows == 2
+    assert first.lookup(keys_of("AAAA", "CCCC")).tolist() == [0, 1]
+    np.testing.assert_array_equal(first.load(keys_of("CCCC")), vectors(1, start=10).astype(np.float16))
+
+
+@pytest.mark.parametrize("shared", [False, True], ids=["same-instance", "second-instance"])
+def test_reads_stay_consistent_while_another_thread_appends(tmp_path, shared):
+    import threading
+
+    store = EmbeddingStore(str(tmp_path), model_name="m")
+    # Appends through the same object, or through a second one like another worker
+    writer = EmbeddingStore(str(tmp_path), model_name="m") if shared else store
+    stored = keys_of(*(f"A{i}" for i in range(200)))
+    store.append(stored, vectors(200))
+    expected = vectors(200).astype(np.float16)
+    stop = threading.Event()
+    errors = []
+
+    def append():
+        for batch in range(100):
+            writer.append(keys_of(*(f"C{batch}-{i}" for i in range(50))), vectors(50, start=batch))
+        stop.set()
+
+    def read():
+        while not stop.is_set():
+            try:
+                if (store.lookup(stored) < 0).any():
+                    errors.append("stored key reported missing")
+                np.testing.assert_array_equal(store.load(stored), expected)
+            except (KeyError, AssertionError) as e:
+                errors.append(repr(e))
+
+    threads = [threading.Thread(target=append), threading.Thread(target=read), threading.Thread(target=read)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.lookup(keys_of("C99-49"))[0] == 200 + 100 * 50 - 1
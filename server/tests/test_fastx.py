@@ -0,0 +1,118 @@
+import gzip
+
+import pytest
+
+from module import fastx
+from module.compression import GzipDecoder, gzip_bytes, is_gzip
+from module.fastx import FastxReader, GzipFastxReader, open_fastx
+from module.sequence_index import SequenceScanner
+
+FASTQ = b"".join(b"@read%d extra\nACGTN%s\n+\n%s\n" % (i, b"T" * i, b"I" * (i + 5)) for i in range(50))
+FASTA = b">a desc\r\nACGT\r\nacgt\r\n;comment\r\n>b\r\nGG\r\n>c\r\n\r\n>d\r\nTTT"
+FASTA_RECORDS = [(b"a desc", b"ACGTacgt"), (b"b", b"GG"), (b"c", b""), (b"d", b"TTT")]
+FASTQ_RECORDS = [(b"read%d extra" % i, b"ACGTN" + b"T" * i) for i in range(50)]
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def as_bytes(records):
+    return [(bytes(name), bytes(seq)) for name, seq in records]
+
+
+def summary(data):
+    scanner = SequenceScanner()
+    scanner.feed(data)
+    return scanner.finish()
+
+
+@pytest.mark.parametrize("data, expected", [(FASTQ, FASTQ_RECORDS), (FASTA, FASTA_RECORDS)], ids=["fastq", "fasta"])
+def test_reader_records_and_random_access(tmp_path, data, expected):
+    with FastxReader(write(tmp_path, "reads", data)) as reader:
+        assert reader.count() == len(expected)
+        assert as_bytes(reader.records()) == expected
+        assert as_bytes([reader.record(i) for i in (len(expected) - 1, 0, 2)]) == \
+            [expected[-1], expected[0], expected[2]]
+        assert list(reader.sequences()) == [seq.decode().upper() for _, seq in expected]
+
+
+def test_reader_uses_the_sidecar_index(tmp_path):
+    index = dict(summary(FASTQ), records=7)
+    with FastxReader(write(tmp_path, "reads.fq", FASTQ), index=index) as reader:
+        # Counted from the index, no scan of the file
+        assert reader.format == "fastq" and reader.count() == 7
+        assert len(reader.offsets()) == 50
+
+
+def test_reader_byte_range(tmp_path):
+    with FastxReader(write(tmp_path, "reads.fq", FASTQ)) as reader:
+        offsets = reader.offsets()
+        assert as_bytes(reader.records(int(offsets[10]), int(offsets[13]))) == FASTQ_RECORDS[10:13]
+
+
+@pytest.mark.parametrize("stride, per_chunk", [(4, 8), (4, 6), (1, 7)])
+def test_reader_chunks_are_record_aligned(tmp_path, stride, per_chunk):
+    path = write(tmp_path, "reads.fq", FASTQ)
+    scanner = SequenceScanner(stride=stride)
+    scanner.feed(FASTQ)
+    index = scanner.finish()
+    assert SequenceScanner.scan_file(path, chunk_size=13)["records"] == 50
+    with FastxReader(path, index=index) as reader:
+        chunks = list(reader.chunks(per_chunk))
+        assert sum(n for _, _, n in chunks) == 50
+        # Chunks of whole strides come from the sparse sidecar, without a scan
+        assert (reader._offsets is None) == (per_chunk % stride == 0)
+        assert chunks[0][0] == 0 and chunks[-1][1] == len(FASTQ)
+        records = []
+        for start, end, n in chunks:
+            assert bytes(reader.chunk(start, end))[:1] == b"@"
+            part = as_bytes(reader.records(start, end))
+            assert len(part) == n
+            records += part
+        assert records == FASTQ_RECORDS
+
+
+def test_reader_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unrecognised"):
+        FastxReader(write(tmp_path, "reads.txt", b"ACGT\n"))
+
+
+@pytest.mark.parametrize("with_index", [False, True])
+@pytest.mark.parametrize("data, expected", [(FASTQ, FASTQ_RECORDS), (FASTA, FASTA_RECORDS)], ids=["fastq", "fasta"])
+def test_gzip_reader_across_blocks_and_members(tmp_path, monkeypatch, data, expected, with_index):
+    # BGZF-style: many small gzip members, split in the middle of records
+    members = b"".join(gzip_bytes(data[pos:pos + 37]) for pos in range(0, len(data), 37))
+    monkeypatch.setattr(fastx, "READ_CHUNK", 11)
+    path = write(tmp_path, "reads.gz", members)
+    index = summary(data) if with_index else None
+    with open_fastx(path, index=index, compression="gzip") as reader:
+        assert isinstance(reader, GzipFastxReader)
+        assert reader.count() == len(expected)
+        assert as_bytes(reader.records()) == expected
+        assert list(reader.sequences()) == [seq.decode().upper() for _, seq in expected]
+
+
+def test_gzip_decoder_streams_multi_member_data():
+    data = FASTQ * 20
+    compressed = gzip.compress(data[:1000]) + gzip.compress(data[1000:])
+    assert is_gzip(compressed) and not is_gzip(FASTQ)
+    decoder = GzipDecoder(max_block=256)
+    blocks = []
+    for pos in range(0, len(compressed), 100):
+        blocks.extend(decoder.feed(compressed[pos:pos + 100]))
+    decoder.finish()
+    assert b"".join(blocks) == data
+    assert max(len(block) for block in blocks) <= 256
+
+
+def test_gzip_decoder_errors():
+    compressed = gzip.compress(FASTQ)
+    decoder = GzipDecoder()
+    list(decoder.feed(compressed[:len(compressed) // 2]))
+    with pytest.raises(ValueError, match="Truncated"):
+        decoder.finish()
+    with pytest.raises(ValueError, match="Corrupt"):
+        list(GzipDecoder().feed(b"\x1f\x8b" + b"\x00" * 20))
@@ -0,0 +1,111 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from module.jobs import COMPLETE, QUEUED, RUNNING, JobManager, JobQueueFull, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    yield store
+    store.close()
+
+
+def test_submit_returns_the_existing_job(store):
+    job = store.submit("f", "remote", queue_size=4)
+    assert job["status"] == QUEUED
+    assert store.submit("f", "remote", queue_size=4)["id"] == job["id"]
+    assert store.submit("f", "local", queue_size=4)["id"] != job["id"]
+    with pytest.raises(JobQueueFull):
+        store.submit("g", "remote", queue_size=2)
+
+
+def test_claim_and_requeue_keep_numbering(store):
+    job = store.submit("f", "remote", queue_size=4)
+    claimed = store.claim("w1")
+    assert claimed["id"] == job["id"] and claimed["status"] == RUNNING
+    assert store.claim("w2") is None
+    for seq in range(3):
+        store.append_event(job["id"], seq, {"type": "log", "message": str(seq)})
+
+    # The lease expired: the run starts over after the events it had sent
+    assert store.requeue_stale(lease=-1) == [job["id"]]
+    requeued = store.get(job["id"])
+    assert requeued["status"] == QUEUED and requeued["owner"] is None
+    assert requeued["seq_base"] == 3
+    assert store.events(job["id"]) == []
+
+    # A second requeue before any new event keeps the base
+    store.claim("w2")
+    store.release("w2")
+    assert store.get(job["id"])["seq_base"] == 3
+
+
+def run_manager(store, runner, body):
+    async def main():
+        manager = JobManager(store, runner, concurrency=1, poll_interval=0.05)
+        await manager.start()
+        try:
+            return await asyncio.wait_for(body(manager), 10)
+        finally:
+            await manager.close()
+    return asyncio.run(main())
+
+
+async def three_logs(ctx):
+    for i in range(3):
+        await ctx.emit({"type": "log", "message": f"step {i}"})
+
+
+def test_subscribe_numbers_events_and_resumes(store):
+    async def body(manager):
+        job = await manager.submit("f", "remote")
+        events = [event async for event in manager.subscribe(job["id"])]
+        resumed = [event async for event in manager.subscribe(job["id"], after=1)]
+        return job["id"], events, resumed
+
+    job_id, events, resumed = run_manager(store, three_logs, body)
+    assert [event["seq"] for event in events] == [0, 1, 2, 3]
+    assert events[-1]["type"] == "complete"
+    assert [event["seq"] for event in resumed] == [2, 3]
+    assert store.get(job_id)["status"] == COMPLETE
+
+
+def test_requeued_job_continues_after_old_events(store):
+    job = store.submit("f", "remote", queue_size=4)
+    store.claim("dead-worker")
+    for seq in range(5):
+        store.append_event(job["id"], seq, {"type": "log", "message": "old run"})
+    store.requeue_stale(lease=-1)
+
+    async def body(manager):
+        # A subscriber that already saw the old run's events
+        return [event async for event in manager.subscribe(job["id"], after=4)]
+
+    events = run_manager(store, three_logs, body)
+    assert [event["seq"] for event in events] == [5, 6, 7, 8, 9]
+    assert events[0]["message"] == "Analysis restarted after a worker failure"
+    assert events[-1]["type"] == "complete"
+
+
+def test_worker_survives_store_errors(store, monkeypatch):
+    claim = store.claim
+    failures = []
+
+    def flaky_claim(owner):
+        if len(failures) < 2:
+            failures.append(owner)
+            raise sqlite3.OperationalError("database is locked")
+        return claim(owner)
+
+    monkeypatch.setattr(store, "claim", flaky_claim)
+
+    async def body(manager):
+        job = await manager.submit("f", "remote")
+        return [event async for event in manager.subscribe(job["id"])]
+
+    events = run_manager(store, three_logs, body)
+    assert len(failures) == 2
+    assert events[-1]["type"] == "complete"
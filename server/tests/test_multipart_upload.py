@@ -0,0 +1,63 @@
+import pytest
+
+from module.multipart_upload import StreamingForm
+
+BOUNDARY = "----synapse-test"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+FILE = b"@r1\nACGT\n+\nIIII\n" * 50 + b"--" + BOUNDARY[:6].encode()  # boundary-like bytes inside
+
+
+def body(file=FILE, fields=(("type", ".fastq"),), filename="reads.fq"):
+    parts = []
+    for name, value in fields:
+        parts.append(
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{name}\"\r\n\r\n{value}\r\n".encode()
+        )
+    if file is not None:
+        parts.append(
+            f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n".encode() + file + b"\r\n"
+        )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+def parse(data, chunk_size):
+    received = []
+    form = StreamingForm(CONTENT_TYPE, received.append)
+    for pos in range(0, len(data), chunk_size):
+        form.feed(data[pos:pos + chunk_size])
+    form.finish()
+    return form, b"".join(received)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 20])
+def test_file_bytes_stream_out_whatever_the_chunking(chunk_size):
+    form, received = parse(body(), chunk_size)
+    assert received == FILE
+    assert form.fields == {"type": ".fastq"}
+    assert form.filename == "reads.fq"
+
+
+def test_file_field_may_come_first_and_be_empty():
+    data = body(file=b"", fields=())
+    closing = f"--{BOUNDARY}--\r\n".encode()
+    data = data[:-len(closing)] + body(file=None)
+    form, received = parse(data, 5)
+    assert received == b"" and form.file_seen
+    assert form.fields == {"type": ".fastq"}
+
+
+@pytest.mark.parametrize("data, message", [
+    (body()[:-20], "Truncated"),
+    (body(file=None), "Missing form field 'file'"),
+])
+def test_invalid_bodies(data, message):
+    with pytest.raises(ValueError, match=message):
+        parse(data, 16)
+
+
+def test_rejects_other_content_types():
+    with pytest.raises(ValueError, match="multipart/form-data"):
+        StreamingForm("application/octet-stream", print)
+    with pytest.raises(ValueError, match="multipart/form-data"):
+        StreamingForm("multipart/form-data", print)
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from module import prediction_cache
+from module.fastx import FastxReader
+from module.prediction_cache import PredictionCache, sequence_key
+from module.predictor import CachedPredictor, PredictionError
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000]
+    monkeypatch.setattr(prediction_cache.time, "time", lambda: now[0])
+    return now
+
+
+def key(i):
+    return sequence_key(b"ACGT" + b"A" * i)
+
+
+def test_sequence_key_normalises_case_and_rna():
+    assert sequence_key(b"acgu") == sequence_key("ACGT") == sequence_key(memoryview(b"ACGT"))
+    assert sequence_key(b"ACGT") != sequence_key(b"ACGA")
+
+
+def test_memory_tier_is_lru(tmp_path):
+    cache = PredictionCache(str(tmp_path / "cache.sqlite3"), memory_items=2)
+    cache.put_many([(key(0), {"v": 0}), (key(1), {"v": 1})])
+    assert cache.get_many([key(0)]) == {key(0): {"v": 0}}  # key(0) is now the most recent
+    cache.put_many([(key(2), {"v": 2})])
+    assert list(cache._memory) == [key(0), key(2)]
+
+    # Evicted from memory only, still served from disk
+    assert cache.get_many([key(1), key(3), key(1)]) == {key(1): {"v": 1}}
+    assert cache.stats()["disk_hits"] == 2 and cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_disk_is_trimmed_least_recently_used_first(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = PredictionCache(path, memory_items=1, max_disk_items=10)
+    for i in range(10):
+        clock[0] += 1
+        cache.put_many([(key(i), {"v": i})])
+    clock[0] += 1
+    cache.get_many([key(0), key(1)])  # used again, survive the trim
+
+    clock[0] += 1
+    cache.put_many([(key(10), {"v": 10})])
+    # Trimmed to 90% of the limit, oldest last_used first
+    assert cache.stats()["disk_items"] == 9 and cache.stats()["evicted"] == 2
+    cache.close()
+
+    reopened = PredictionCache(path, memory_items=1, max_disk_items=10)
+    found = reopened.get_many([key(i) for i in range(11)])
+    assert sorted(value["v"] for value in found.values()) == [0, 1, 4, 5, 6, 7, 8, 9, 10]
+    reopened.close()
+
+
+class FailingPredictor:
+    """Lands the first shard, then gives up on the second."""
+
+    shard_size = 2
+
+    def __init__(self):
+        self.sent = []
+
+    async def predict_shards(self, shards, file_id, file_format, on_shard=None, on_log=None):
+        self.sent.append(len(shards))
+        ids = [int(line[1:]) for line in shards[0].split(b"\n") if line.startswith(b">")]
+        await on_shard(0, {"results": [{"id": i, "prediction": {"genus": f"g{i}"}} for i in ids]})
+        raise PredictionError("Shard 2/2 failed")
+
+
+def test_finished_shards_are_cached_when_a_later_one_fails(tmp_path):
+    path = tmp_path / "reads.fa"
+    path.write_bytes(b">a\nAAAA\n>b\nCCCC\n>c\nGGGG\n>d\nTTTT\n")
+    cache = PredictionCache(str(tmp_path / "cache.sqlite3"))
+    predictor = FailingPredictor()
+
+    async def on_shard(payload):
+        pass
+
+    with FastxReader(str(path)) as reader:
+        with pytest.raises(PredictionError):
+            asyncio.run(CachedPredictor(predictor, cache).predict(reader, "f", on_shard=on_shard))
+
+    found = cache.get_many([sequence_key(seq) for seq in (b"AAAA", b"CCCC", b"GGGG", b"TTTT")])
+    assert found == {
+        sequence_key(b"AAAA"): {"prediction": {"genus": "g0"}},
+        sequence_key(b"CCCC"): {"prediction": {"genus": "g1"}},
+    }
+    cache.close()
@@ -0,0 +1,162 @@
+import numpy as np
+import pytest
+
+import module.result_store as result_store
+from module.dereplicate import dereplicate
+from module.result_store import ResultStore
+
+GENERA = ["Vibrio", "Bacillus", "unknown", "Alteromonas", "Pelagibacter"]
+CLASSES = ["Gammaproteobacteria", "Bacilli", "Alphaproteobacteria"]
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    # Small chunks so filters and group-by cross chunk boundaries
+    monkeypatch.setattr(result_store, "FILTER_CHUNK", 64)
+    rng = np.random.default_rng(7)
+    pool = [bytes(rng.choice(list(b"ACGT"), 30)) for _ in range(40)]
+    reads = dereplicate((b"read%d" % i, pool[pick]) for i, pick in enumerate(rng.integers(0, len(pool), 500)))
+    # Few distinct values, so every sort key has long runs of ties
+    reads.predictions = [
+        {
+            "prediction": {
+                "genus": GENERA[rng.integers(len(GENERA))],
+                "class": CLASSES[rng.integers(len(CLASSES))],
+                "genus_prob": float(rng.choice([0.25, 0.5, 0.75, 1.0])),
+            },
+            "cluster": int(rng.integers(-1, 4)),
+        }
+        for _ in range(reads.n_unique)
+    ]
+    store = ResultStore(str(tmp_path))
+    store.write("job", reads)
+    return store.open("job"), reads
+
+
+def expected_rows(reads):
+    """Per-read column values straight from the predictions."""
+    rows = []
+    for row, unique in enumerate(reads.read_to_unique.tolist()):
+        item = reads.predictions[unique]
+        rows.append({
+            "row": row,
+            "genus": item["prediction"]["genus"],
+            "class": item["prediction"]["class"],
+            "cluster": item["cluster"],
+            "genus_prob": float(np.float32(item["prediction"]["genus_prob"])),
+        })
+    return rows
+
+
+def stable_sort(rows, sort, descending):
+    """Full sort by `sort`, ties in file order whichever the direction."""
+    if sort in ("genus", "class"):
+        rank = {label: i for i, label in enumerate(sorted({row[sort] for row in rows}))}
+        key = lambda row: rank[row[sort]]
+    else:
+        key = lambda row: row[sort]
+    sign = -1 if descending else 1
+    if sort == "row":
+        return sorted(rows, key=key, reverse=descending)
+    return sorted(rows, key=lambda row: (sign * key(row), row["row"]))
+
+
+@pytest.mark.parametrize("sort", ["row", "genus", "class", "cluster", "genus_prob"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_query_pages_match_a_full_stable_sort(table, sort, descending):
+    table, reads = table
+    rows = expected_rows(reads)
+    expected = [row["row"] for row in stable_sort(rows, sort, descending)]
+
+    # Offsets landing inside runs of ties, and the last, partial page
+    for offset, limit in [(0, 10), (3, 17), (41, 25), (120, 7), (len(rows) - 5, 10), (0, len(rows))]:
+        total, page = table.query(sort=sort, descending=descending, offset=offset, limit=limit)
+        assert total == len(rows)
+        assert [record["row"] for record in page] == expected[offset:offset + limit]
+    assert table.query(sort=sort, descending=descending, offset=len(rows)) == (len(rows), [])
+
+    # Paging through the whole table visits every row once, in order
+    paged = []
+    for offset in range(0, len(rows), 33):
+        paged += [record["row"] for record in table.query(sort=sort, descending=descending, offset=offset, limit=33)[1]]
+    assert paged == expected
+
+
+def test_query_with_a_mask_sorts_only_matching_rows(table):
+    table, reads = table
+    rows = expected_rows(reads)
+    mask = table.mask(genus=["Vibrio", "Bacillus"])
+    matching = [row for row in rows if row["genus"] in ("Vibrio", "Bacillus")]
+    expected = [row["row"] for row in stable_sort(matching, "genus_prob", True)]
+
+    total, page = table.query(mask, sort="genus_prob", descending=True, offset=11, limit=30)
+    assert total == len(matching)
+    assert [record["row"] for record in page] == expected[11:41]
+    record = page[0]
+    assert record == {**record, **rows[record["row"]]}
+    assert record["read_id"] == "read%d" % record["row"]
+
+
+def test_mask_filters_on_dictionary_codes(table):
+    table, reads = table
+    rows = expected_rows(reads)
+
+    def check(mask, predicate):
+        assert mask.tolist() == [bool(predicate(row)) for row in rows]
+
+    check(table.mask(), lambda row: True)
+    check(table.mask(genus="Vibrio"), lambda row: row["genus"] == "Vibrio")
+    # Labels not in the dictionary match nothing, the others still do
+    check(table.mask(genus=["Alteromonas", "Nonexistent"]), lambda row: row["genus"] == "Alteromonas")
+    check(table.mask(genus="Nonexistent"), lambda row: False)
+    check(
+        table.mask(genus=["Vibrio", "unknown"], class_="Bacilli", cluster=2),
+        lambda row: row["genus"] in ("Vibrio", "unknown") and row["class"] == "Bacilli" and row["cluster"] == 2,
+    )
+    check(table.mask(cluster=-1, min_prob=0.5, max_prob=0.75), lambda row: row["cluster"] == -1 and 0.5 <= row["genus_prob"] <= 0.75)
+
+
+@pytest.mark.parametrize("by", ["genus", "class", "cluster"])
+def test_group_by_matches_counting_rows(table, by):
+    table, reads = table
+    rows = expected_rows(reads)
+    mask = table.mask(min_prob=0.5)
+
+    for selected in (rows, [row for row in rows if row["genus_prob"] >= 0.5]):
+        stats = {}
+        for row in selected:
+            stat = stats.setdefault(row[by], [0, 0.0])
+            stat[0] += 1
+            stat[1] += row["genus_prob"]
+        # Largest first; ties by dictionary code (first seen) or cluster id
+        tie = table.dictionaries[by].index if by != "cluster" else (lambda cluster: cluster)
+        order = sorted(stats, key=lambda label: (-stats[label][0], tie(label)))
+        expected = [
+            {
+                by: label,
+                "count": stats[label][0],
+                "percentage": round(stats[label][0] / len(selected) * 100, 2),
+                "mean_genus_prob": round(stats[label][1] / stats[label][0], 4),
+            }
+            for label in order
+        ]
+
+        result = table.group_by(by, mask=None if selected is rows else mask, limit=len(order))
+        assert result["total_reads"] == len(selected)
+        assert result["total_groups"] == len(order)
+        assert result["groups"] == expected
+        assert table.group_by(by, mask=None if selected is rows else mask, offset=1, limit=2)["groups"] == expected[1:3]
+
+
+def test_group_by_breaks_count_ties_by_first_seen(tmp_path):
+    reads = dereplicate([(b"a", b"AAAA"), (b"b", b"CCCC"), (b"c", b"GGGG"), (b"d", b"CCCC"), (b"e", b"TTTT")])
+    reads.predictions = [
+        {"prediction": {"genus": genus, "class": "c", "genus_prob": 0.5}, "cluster": cluster}
+        for genus, cluster in [("Zeta", 3), ("Beta", 1), ("Alpha", 0), ("Zeta", -1)]
+    ]
+    store = ResultStore(str(tmp_path))
+    store.write("job", reads)
+    table = store.open("job")
+
+    assert [(g["genus"], g["count"]) for g in table.group_by("genus")["groups"]] == [("Zeta", 2), ("Beta", 2), ("Alpha", 1)]
+    assert [g["cluster"] for g in table.group_by("cluster")["groups"]] == [1, -1, 0, 3]
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from module.sequence_index import SequenceScanner, index_path, read_index, write_index
+
+FASTQ = (
+    b"@r1 first\nACGT\n+\nIIII\n"
+    b"@r2\n\n+\n\n"  # fully trimmed read
+    b"\n"  # padding between records
+    b"@r3\nGGGCC\n+r3\n@@@@@\n"  # quality line starting with '@'
+)
+FASTA = (
+    b">s1 wrapped\r\nACGT\r\n;comment\r\nAC\r\n"
+    b">s2\r\n;inline comment\r\nTTTT\r\n"
+    b">s3\r\nG"  # no final newline
+)
+
+
+def scan(data, chunk_size=None, stride=1):
+    scanner = SequenceScanner(stride=stride)
+    chunk_size = chunk_size or max(len(data), 1)
+    for pos in range(0, len(data), chunk_size):
+        scanner.feed(data[pos:pos + chunk_size])
+    return scanner.finish()
+
+
+def headers(data, marker):
+    lines = data.split(b"\n")
+    starts = np.cumsum([0] + [len(line) + 1 for line in lines[:-1]])
+    return [int(start) for start, line in zip(starts, lines) if line[:1] == marker]
+
+
+def test_fastq_summary():
+    summary = scan(FASTQ)
+    assert summary["format"] == "fastq"
+    assert summary["records"] == 3
+    assert summary["bases"] == 9
+    assert summary["bytes"] == len(FASTQ)
+    assert summary["offsets"].tolist() == [0, FASTQ.index(b"@r2"), FASTQ.index(b"@r3")]
+
+
+def test_fasta_summary_with_crlf_and_comments():
+    summary = scan(FASTA)
+    assert summary["format"] == "fasta"
+    assert summary["records"] == 3
+    assert summary["bases"] == 6 + 4 + 1
+    assert summary["offsets"].tolist() == headers(FASTA, b">")
+
+
+@pytest.mark.parametrize("data", [FASTQ, FASTA], ids=["fastq", "fasta"])
+def test_chunk_boundaries_do_not_matter(data):
+    expected = scan(data)
+    for chunk_size in range(1, 12):
+        summary = scan(data, chunk_size)
+        assert summary["offsets"].tolist() == expected["offsets"].tolist()
+        assert {k: v for k, v in summary.items() if k != "offsets"} == \
+            {k: v for k, v in expected.items() if k != "offsets"}
+
+
+def test_sparse_offsets_keep_every_stride_th_record():
+    data = b"".join(b"@r%d\nACGT\n+\nIIII\n" % i for i in range(10))
+    full = scan(data)["offsets"]
+    for chunk_size in (5, 17, len(data)):
+        assert scan(data, chunk_size, stride=3)["offsets"].tolist() == full[::3].tolist()
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "No sequences"),
+    (b"\n\n", "No sequences"),
+    (b"ACGT\n", "Unrecognised"),
+    (b"@r1\nACGT\n+\n", "Truncated"),
+    (b"@r1\nACGT\n-\nIIII\n", "Malformed"),
+    (b"@r1\nACGT\n+\nIIII\nr2\nAC\n+\nII\n", "Malformed"),
+])
+def test_invalid_input(data, message):
+    with pytest.raises(ValueError, match=message):
+        scan(data, 3)
+
+
+def test_index_round_trip(tmp_path):
+    path = index_path(str(tmp_path), "upload")
+    assert read_index(path) is None
+    write_index(path, scan(FASTQ))
+    index = read_index(path)
+    assert index["records"] == 3
+    assert index["offsets"] == scan(FASTQ)["offsets"].tolist()
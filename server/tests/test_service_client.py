@@ -0,0 +1,204 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from module.http_client import SharedHttpClient
+from module.predictor import PredictionError, ShardedPredictor
+from module.service_client import CircuitBreaker, CircuitOpenError, EndpointBudget, ServiceClient, ServiceError
+
+
+def run_with_service(handler, check, **options):
+    """Runs `check(service, calls)` against a local server answering /predict/fasta with `handler`."""
+
+    async def main():
+        calls = []
+
+        async def endpoint(request):
+            calls.append(request)
+            return await handler(request, len(calls))
+
+        app = web.Application()
+        app.router.add_post("/predict/fasta", endpoint)
+        # Don't wait for stalled handlers on cleanup
+        runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        http = SharedHttpClient()
+        await http.start()
+        try:
+            await check(ServiceClient(http, f"http://127.0.0.1:{port}", **options), calls)
+        finally:
+            await http.close()
+            await runner.cleanup()
+
+    asyncio.run(main())
+
+
+def make_form():
+    form = aiohttp.FormData()
+    form.add_field("file", b">a\nACGT\n", filename="sequences.fasta", content_type="text/plain")
+    return form
+
+
+def test_breaker_opens_and_probes_once():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_cancelled_half_open_probe_is_released():
+    async def handler(request, n):
+        await asyncio.sleep(10)
+        return web.json_response({"results": []})
+
+    async def check(service, calls):
+        breaker = service.breaker
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        await asyncio.sleep(0.06)
+
+        # The probe is cancelled mid-request, like a shard whose sibling failed
+        probe = asyncio.create_task(service.post_form("/predict/fasta", make_form))
+        while not calls:
+            await asyncio.sleep(0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # Still half-open, and the next call is let through as the new probe
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow()
+
+    run_with_service(handler, check, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+
+
+def test_half_open_shards_wait_for_the_probe():
+    async def handler(request, n):
+        await asyncio.sleep(0.1)
+        return web.json_response({"results": [{"request": n}]})
+
+    async def check(service, calls):
+        breaker = service.breaker
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+
+        # One shard probes, the other three wait for its verdict
+        predictor = ShardedPredictor(service, concurrency=4)
+        results = await predictor.predict_shards([b">a\nACGT\n"] * 4, "upload", "fasta")
+        assert len(results) == 4 and len(calls) == 4
+        assert results[0] == {"request": 1}
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert service.stats()["rejected_open"] == 0
+
+    run_with_service(handler, check, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+
+
+def test_failed_probe_does_not_strand_the_circuit():
+    async def handler(request, n):
+        await asyncio.sleep(0.1)
+        return web.Response(status=503, text="still down")
+
+    async def check(service, calls):
+        breaker = service.breaker
+        breaker.record_failure()
+        breaker.opened_at -= 60
+
+        predictor = ShardedPredictor(service, concurrency=4)
+        with pytest.raises(PredictionError):
+            await predictor.predict_shards([b">a\nACGT\n"] * 4, "upload", "fasta")
+        # Only the probe reached the service; it re-opened the circuit
+        assert len(calls) == 1
+        assert breaker.state == CircuitBreaker.OPEN and breaker.times_opened == 2
+
+    run_with_service(
+        handler, check,
+        default_budget=EndpointBudget(total_budget=5, retry_delay=0.01),
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60),
+    )
+
+
+def test_call_waits_out_a_short_open_period():
+    async def handler(request, n):
+        return web.json_response({"request": n})
+
+    async def check(service, calls):
+        service.breaker.record_failure()
+        started = time.monotonic()
+        assert await service.post_form("/predict/fasta", make_form) == {"request": 1}
+        assert time.monotonic() - started >= 0.2
+        assert service.breaker.state == CircuitBreaker.CLOSED
+
+    run_with_service(
+        handler, check,
+        default_budget=EndpointBudget(total_budget=5),
+        breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.2),
+    )
+
+
+def test_retries_transient_errors_then_opens_the_circuit():
+    async def handler(request, n):
+        return web.Response(status=503, text="busy")
+
+    async def check(service, calls):
+        with pytest.raises(ServiceError):
+            await service.post_form("/predict/fasta", make_form)
+        assert len(calls) == 3
+        assert service.breaker.state == CircuitBreaker.OPEN
+        with pytest.raises(CircuitOpenError):
+            await service.post_form("/predict/fasta", make_form)
+        assert len(calls) == 3
+
+    run_with_service(
+        handler, check,
+        default_budget=EndpointBudget(attempt_timeout=5, total_budget=10, max_attempts=3, retry_delay=0.01),
+        breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60),
+    )
+
+
+def test_client_errors_are_not_retried():
+    async def handler(request, n):
+        return web.Response(status=400, text="bad fasta")
+
+    async def check(service, calls):
+        with pytest.raises(ServiceError) as info:
+            await service.post_form("/predict/fasta", make_form)
+        assert not info.value.retryable
+        assert len(calls) == 1
+        assert service.breaker.state == CircuitBreaker.CLOSED
+
+    run_with_service(handler, check, default_budget=EndpointBudget(retry_delay=0.01))
+
+
+def test_slow_request_is_hedged():
+    async def handler(request, n):
+        # The first call after three warm-up ones stalls; its hedge answers
+        if n == 4:
+            await asyncio.sleep(5)
+        return web.json_response({"request": n})
+
+    async def check(service, calls):
+        for _ in range(3):
+            await service.post_form("/predict/fasta", make_form)
+        started = time.monotonic()
+        result = await service.post_form("/predict/fasta", make_form)
+        assert result == {"request": 5}
+        assert time.monotonic() - started < 2
+        stats = service.stats()
+        assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+
+    run_with_service(handler, check, hedge_min_samples=3, max_hedge_ratio=0.5)
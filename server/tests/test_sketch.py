@@ -0,0 +1,53 @@
+import numpy as np
+
+from module.sketch import SketchClusterer, representatives
+
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+
+def random_sequences(rng, n, length=150):
+    return [BASES[rng.integers(0, 4, length)].tobytes() for _ in range(n)]
+
+
+def mutated(rng, sequence, rate=0.01):
+    codes = np.frombuffer(sequence, dtype=np.uint8).copy()
+    positions = rng.random(len(codes)) < rate
+    codes[positions] = BASES[rng.integers(0, 4, positions.sum())]
+    return codes.tobytes()
+
+
+def test_group_collects_near_duplicates_around_the_most_abundant():
+    rng = np.random.default_rng(0)
+    templates = random_sequences(rng, 3)
+    sequences = [mutated(rng, templates[i % 3], 0.003) for i in range(30)] + [b"ACG", b"NNNNNNNNNNNNNNNNNNNN"]
+    counts = np.ones(len(sequences))
+    counts[4] = 10
+    assignment = SketchClusterer(threshold=0.5).group(sequences, counts)
+
+    reps = representatives(assignment)
+    assert 4 in reps.tolist()
+    assert (assignment[1:30:3] == 4).all()
+    # No valid k-mer: always on their own
+    assert assignment[30] == 30 and assignment[31] == 31
+    assert len(reps) <= 6
+
+
+def test_seeds_are_representatives_first():
+    rng = np.random.default_rng(1)
+    template = random_sequences(rng, 1)[0]
+    sequences = [mutated(rng, template, 0.003) for _ in range(10)]
+    counts = np.arange(10, 0, -1)
+    assignment = SketchClusterer(threshold=0.5).group(sequences, counts, seeds=1)
+    assert assignment[0] == 0 and (assignment == 0).sum() >= 8
+
+
+def test_estimate_redundancy_separates_distinct_from_redundant_samples():
+    rng = np.random.default_rng(2)
+    sketcher = SketchClusterer(threshold=0.5)
+    distinct = random_sequences(rng, 20000)
+    assert sketcher.estimate_redundancy(distinct) < 0.01
+
+    templates = random_sequences(rng, 1000)
+    redundant = templates + [mutated(rng, templates[i]) for i in rng.integers(0, 1000, 19000)]
+    assert sketcher.estimate_redundancy(redundant) > 0.5
+    assert sketcher.estimate_redundancy(redundant[:1]) == 0.0
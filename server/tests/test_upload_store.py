@@ -0,0 +1,49 @@
+import os
+import time
+
+from module.sequence_index import SequenceScanner
+from module.upload_store import UploadStore
+
+
+def upload(store, data=b">a\nACGT\n"):
+    file_id, part_path = store.new_part()
+    with open(part_path, "wb") as f:
+        f.write(data)
+    scanner = SequenceScanner()
+    scanner.feed(data)
+    store.commit(file_id, part_path, scanner.finish())
+    return file_id
+
+
+def test_commit_get_delete(tmp_path):
+    store = UploadStore(str(tmp_path))
+    file_id = upload(store)
+    meta = store.get(file_id)
+    assert meta["format"] == "fasta" and meta["records"] == 1 and meta["compression"] is None
+    assert open(meta["path"], "rb").read() == b">a\nACGT\n"
+    assert store.index(file_id)["records"] == 1
+
+    store.delete(file_id)
+    assert store.get(file_id) is None and store.index(file_id) is None
+    assert not os.path.exists(meta["path"])
+    store.close()
+
+
+def test_prune_removes_old_uploads_and_stale_parts(tmp_path):
+    store = UploadStore(str(tmp_path))
+    old, recent = upload(store), upload(store)
+    store._db.execute("UPDATE uploads SET created = created - 7200 WHERE file_id = ?", (old,))
+    store._db.commit()
+    old_path = store.get(old)["path"]
+
+    _, stale_part = store.new_part()
+    _, fresh_part = store.new_part()
+    for path in (stale_part, fresh_part):
+        open(path, "wb").close()
+    os.utime(stale_part, (time.time() - 7200, time.time() - 7200))
+
+    assert store.prune(time.time() - 3600) == 1
+    assert store.get(old) is None and not os.path.exists(old_path) and store.index(old) is None
+    assert store.get(recent) is not None
+    assert not os.path.exists(stale_part) and os.path.exists(fresh_part)
+    store.close()
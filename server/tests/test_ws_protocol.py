@@ -0,0 +1,104 @@
+import asyncio
+import json
+import zlib
+
+import pytest
+
+from module.ws_protocol import ENCODINGS, EventBatcher, encode_batch, msgpack_available
+
+
+def clustering(n):
+    return {"type": "clustering_result", "data": {"total_reads": n}}
+
+
+def log(message):
+    return {"type": "log", "message": message}
+
+
+def test_newer_snapshot_drops_pending_ones():
+    async def main():
+        batcher = EventBatcher()
+        batcher.put(log("a"))
+        batcher.put(clustering(1))
+        batcher.put(log("b"))
+        batcher.put(clustering(2))
+        batcher.put(clustering(3))
+        # Only the latest snapshot is left, the other events keep their order
+        assert await batcher.get_batch() == [log("a"), log("b"), clustering(3)]
+        assert batcher.dropped == 2
+
+        # A snapshot already sent is not dropped again
+        batcher.put(clustering(4))
+        assert await batcher.get_batch() == [clustering(4)]
+        assert batcher.dropped == 2
+
+    asyncio.run(main())
+
+
+def test_get_batch_waits_for_events_and_coalesces_ready_producers():
+    async def main():
+        batcher = EventBatcher()
+        getter = asyncio.create_task(batcher.get_batch())
+        await asyncio.sleep(0.01)
+        assert not getter.done()
+
+        async def produce(message):
+            batcher.put(log(message))
+
+        # Producers ready in the same loop turn land in one batch
+        await asyncio.gather(produce("a"), produce("b"))
+        assert await getter == [log("a"), log("b")]
+
+    asyncio.run(main())
+
+
+def test_close_drains_pending_events_then_ends():
+    async def main():
+        batcher = EventBatcher()
+        batcher.put(log("a"))
+        batcher.put(clustering(1))
+        batcher.close()
+        assert await batcher.get_batch() == [log("a"), clustering(1)]
+        assert await batcher.get_batch() == []
+
+        # A sender blocked on an empty batcher is woken by close()
+        idle = EventBatcher()
+        getter = asyncio.create_task(idle.get_batch())
+        await asyncio.sleep(0.01)
+        idle.close()
+        assert await asyncio.wait_for(getter, 1) == []
+
+    asyncio.run(main())
+
+
+EVENTS = [log("Found 3 sequences"), clustering(3), {"type": "complete", "message": "Analysis Finished."}]
+
+
+def decode(payload, encoding):
+    if encoding == "msgpack":
+        import msgpack
+        return msgpack.unpackb(payload, raw=False)
+    if encoding == "deflate":
+        return json.loads(zlib.decompress(payload, -zlib.MAX_WBITS))
+    return json.loads(payload)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_encode_batch_round_trips(encoding):
+    if encoding == "msgpack" and not msgpack_available():
+        pytest.skip("msgpack is not installed")
+    payload, binary = encode_batch(EVENTS, encoding)
+    assert binary == (encoding != "json")
+    assert isinstance(payload, bytes if binary else str)
+    assert decode(payload, encoding) == {"type": "batch", "events": EVENTS}
+
+
+def test_deflate_is_raw_and_smaller_for_repetitive_batches():
+    events = [log("Analysed shard %d/100" % i) for i in range(100)]
+    text, _ = encode_batch(events)
+    payload, _ = encode_batch(events, "deflate")
+    assert len(payload) < len(text) // 4
+    # Raw deflate: no zlib header, so a zlib-wrapped decoder rejects it
+    with pytest.raises(zlib.error):
+        zlib.decompress(payload)
+    assert json.loads(zlib.decompressobj(-zlib.MAX_WBITS).decompress(payload)) == json.loads(text)
@@ -1,12 +1,21 @@
-import torch
+import sys
+
 import numpy as np
 import random
 
 def set_global_seed(seed=42):
+    """
+    Seeds Python, NumPy and (if it is already loaded) torch.
+    torch is never imported here, so the remote-only server starts without
+    it; processes that load torch call this again afterwards.
+    """
     random.seed(seed)
     np.random.seed(seed)
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
     torch.manual_seed(seed)
     if torch.cuda.is_available():
         torch.cuda.manual_seed_all(seed)
         torch.backends.cudnn.deterministic = True  
-        torch.backends.cudnn.benchmark = False
\ No newline at end of file
+        torch.backends.cudnn.benchmark = False